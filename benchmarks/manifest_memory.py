@@ -0,0 +1,83 @@
+"""
+memory held by the manifest, the dependency tables of every version of every package, for the packuments of the
+fixture graph in resources/ (jest, express, mongoose, mongodb... and their dependencies)
+
+    PYTHONPATH=src python benchmarks/manifest_memory.py [fixture...]
+
+Only the packages with a fixture are part of the graph, the dependencies on the others are dropped. The ranges
+parsed while building it are cached by `reference.parse_npm_spec` for every reference, they are reported apart.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from tiny_package_manager.base import format_name
+from tiny_package_manager.packument import PackumentParser
+from tiny_package_manager.reference import parse_npm_spec
+from tiny_package_manager.synthetic import Registry, SyntheticReference
+
+RESOURCES = "./resources"
+
+FIXTURES = ["express", "mongoose", "mongodb", "api-easy", "express-resource", "vows", "request", "jest-cli",
+            "@jest/core"]
+
+
+def fixture_registry(roots: list[str]) -> Registry:
+    """
+    the packuments reachable from the roots which have a fixture
+    """
+    packages: Registry = {}
+    pending = list(roots)
+    while pending:
+        name = pending.pop()
+        path = os.path.join(RESOURCES, format_name(name))
+        if name in packages or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as reader:
+            packages[name] = PackumentParser(reader).parse()
+        pending.extend(dependency for dependencies in packages[name].values() for dependency in dependencies)
+    return {name: {version_name: {dependency: spec
+                                  for dependency, spec in dependencies.items() if dependency in packages}
+                   for version_name, dependencies in versions.items()}
+            for name, versions in packages.items()}
+
+
+def main(roots: list[str]) -> dict:
+    registry = fixture_registry(roots)
+    reference = SyntheticReference(registry)
+    # the packuments and their version tables are loaded beforehand, only the manifest is measured
+    for name in registry:
+        reference.version_table(name)
+
+    parse_npm_spec.cache_clear()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    for name in registry:
+        reference._update_metadata(name)
+    elapsed = time.perf_counter() - start
+    built, peak = tracemalloc.get_traced_memory()
+    parse_npm_spec.cache_clear()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    versions = sum(len(package_versions) for package_versions in registry.values())
+    edges = sum(len(dependencies)
+                for package_versions in registry.values() for dependencies in package_versions.values())
+    tables = len({id(version_dependency) for dependencies in reference.manifest.dependencies.values()
+                  for version_dependency in dependencies.version_dependencies.values()})
+    result = {"packages": len(registry), "versions": versions, "edges": edges, "tables": tables,
+              "manifest_bytes": after - before, "parsed_ranges_bytes": built - after, "peak_bytes": peak - before,
+              "seconds": round(elapsed, 4)}
+    print(f"{len(registry)} packages, {versions} versions, {edges} dependency edges, {tables} dependency tables")
+    print(f"manifest {result['manifest_bytes'] / 2 ** 20:.2f}MB, "
+          f"{result['manifest_bytes'] / versions:.0f} bytes per version, peak {result['peak_bytes'] / 2 ** 20:.2f}MB, "
+          f"built in {elapsed:.3f}s")
+    print(f"parsed ranges {result['parsed_ranges_bytes'] / 2 ** 20:.2f}MB")
+    return result
+
+
+if __name__ == '__main__':
+    json.dump(main(sys.argv[1:] or FIXTURES), sys.stderr, indent=2)
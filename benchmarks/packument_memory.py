@@ -0,0 +1,51 @@
+"""
+peak memory and time of parsing the largest packument fixtures, whole with json.loads and streamed
+
+    PYTHONPATH=src python benchmarks/packument_memory.py [fixture...]
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from tiny_package_manager.packument import parse_packument, stream_packument
+
+FIXTURES = ["mongoose", "mongodb"]
+
+
+def measure(parse) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    parse()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def read_whole(path: str):
+    with open(path, "rb") as reader:
+        return parse_packument(reader.read())
+
+
+def read_streamed(path: str):
+    with open(path, "rb") as reader:
+        return stream_packument(reader)
+
+
+def main(fixtures: list[str]):
+    print(f"{'fixture':<12}{'size':>10}  {'parser':<10}{'peak':>10}{'time':>10}")
+    results = {}
+    for fixture in fixtures:
+        path = f"./resources/{fixture}"
+        with open(path, "rb") as reader:
+            size = len(reader.read())
+        for parser, parse in (("json", read_whole), ("streaming", read_streamed)):
+            elapsed, peak = measure(lambda: parse(path))
+            results[f"{fixture}/{parser}"] = {"peak_bytes": peak, "seconds": round(elapsed, 4)}
+            print(f"{fixture:<12}{size / 2 ** 20:>8.1f}MB  {parser:<10}{peak / 2 ** 20:>8.1f}MB{elapsed:>9.3f}s")
+    return results
+
+
+if __name__ == '__main__':
+    json.dump(main(sys.argv[1:] or FIXTURES), sys.stderr, indent=2)
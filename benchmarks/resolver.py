@@ -0,0 +1,137 @@
+"""
+time, search nodes and peak memory of the solver on synthetic registries, compared with benchmarks/baseline.json
+
+    PYTHONPATH=src python benchmarks/resolver.py [--update] [--workers=N] [--latency=SECONDS] [scenario...]
+
+Every scenario is run with every engine, results are named `<scenario>/<engine>`.
+
+--workers=N also runs the backtracking engine with N processes, named `<scenario>/parallel-N`, and reports its
+speed-up. The nodes searched by the cancelled workers vary from run to run, these results aren't kept in the baseline.
+
+--latency=SECONDS also runs the backtracking engine with packuments taking that long to load, once loading them only
+when they are needed and once with the prefetcher, and reports the seconds spent waiting for them and the network wait
+the prefetcher hid. These results aren't kept in the baseline either.
+
+--update writes the results as the new baseline. Nodes are deterministic, any change is reported; time and memory
+are only reported past `TOLERANCE`. Exits with 1 if a scenario regressed.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from tiny_package_manager.prefetch import PREFETCH_CONCURRENCY
+from tiny_package_manager.reference import BACKTRACKING, ENGINES, PUBGRUB
+from tiny_package_manager.synthetic import Registry, SyntheticReference, synthetic_registry
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# runs of every scenario, the fastest one is kept to smooth the noise
+REPEAT = 3
+
+# ratio of the baseline time or memory past which a scenario regressed
+TOLERANCE = 1.5
+
+# name -> packages, versions per package, fan-out, conflict density, seed, direct dependencies
+SCENARIOS = {
+    "small": (50, 10, 3, 0.0, 1, 3),
+    "wide": (1000, 10, 3, 0.0, 2, 3),
+    "fan-out": (300, 20, 5, 0.0, 1, 3),
+    "conflicts": (300, 20, 5, 0.02, 2, 3),
+    "dense-conflicts": (200, 20, 4, 0.1, 2, 3),
+    "hard-conflicts": (100, 10, 4, 0.3, 1, 3),
+    # more packages selected at once than the recursion limit of python
+    "deep": (3000, 3, 4, 0.0, 1, 20),
+}
+
+# scenarios the other engines take minutes to solve
+ENGINES_OF = {"hard-conflicts": (PUBGRUB,)}
+
+
+def compile_registry(registry: Registry, roots: int, engine: str, workers: int = 1) -> SyntheticReference:
+    reference = SyntheticReference(registry)
+    reference.direct_dependencies = {f"p{idx}": "*" for idx in range(roots)}
+    if reference.compile(engine=engine, workers=workers) is None:
+        raise ValueError("the scenario has no solution")
+    return reference
+
+
+def measure(scenario: tuple, engine: str, workers: int = 1) -> dict:
+    packages, versions, fan_out, conflict_density, seed, roots = scenario
+    # generated beforehand, only the solver is measured
+    registry = synthetic_registry(packages, versions, fan_out, conflict_density, seed)
+    elapsed = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        reference = compile_registry(registry, roots, engine, workers)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    # tracemalloc slows everything down, memory is measured on a run of its own
+    tracemalloc.start()
+    compile_registry(registry, roots, engine, workers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 4), "nodes": reference.stats.nodes, "peak_bytes": peak}
+
+
+def measure_latency(scenario: tuple, latency: float, prefetch_concurrency: int) -> dict:
+    packages, versions, fan_out, conflict_density, seed, roots = scenario
+    reference = SyntheticReference(synthetic_registry(packages, versions, fan_out, conflict_density, seed),
+                                   latency=latency, prefetch_concurrency=prefetch_concurrency)
+    reference.direct_dependencies = {f"p{idx}": "*" for idx in range(roots)}
+    reference.compile()
+    seconds = reference.metrics()["seconds"]
+    return {"seconds": reference.elapsed, "waited": seconds["metadata"], "hidden": seconds["prefetch_hidden"]}
+
+
+def regressions(result: dict, baseline: dict) -> list[str]:
+    found = []
+    if result["nodes"] != baseline["nodes"]:
+        found.append(f"nodes {baseline['nodes']} -> {result['nodes']}")
+    for key in ("seconds", "peak_bytes"):
+        if result[key] > baseline[key] * TOLERANCE:
+            found.append(f"{key} {baseline[key]} -> {result[key]}")
+    return found
+
+
+def main(arguments: list[str]) -> int:
+    update = "--update" in arguments
+    workers = max([int(argument.split("=", 1)[1]) for argument in arguments if argument.startswith("--workers=")],
+                  default=1)
+    latency = max([float(argument.split("=", 1)[1]) for argument in arguments if argument.startswith("--latency=")],
+                  default=0.0)
+    names = [argument for argument in arguments if not argument.startswith("--")] or list(SCENARIOS)
+    baselines = {}
+    if os.path.isfile(BASELINE):
+        with open(BASELINE) as reader:
+            baselines = json.load(reader)
+
+    print(f"{'scenario':<30}{'time':>10}{'nodes':>10}{'peak':>10}  regressions")
+    results = {}
+    regressed = False
+    for name, engine in ((name, engine) for name in names for engine in ENGINES_OF.get(name, ENGINES)):
+        key = f"{name}/{engine}"
+        results[key] = result = measure(SCENARIOS[name], engine)
+        found = regressions(result, baselines[key]) if key in baselines and not update else []
+        regressed = regressed or bool(found)
+        print(f"{key:<30}{result['seconds']:>9.3f}s{result['nodes']:>10}{result['peak_bytes'] / 2 ** 20:>8.1f}MB  "
+              f"{', '.join(found)}")
+        if workers > 1 and engine == BACKTRACKING:
+            parallel = measure(SCENARIOS[name], engine, workers)
+            print(f"{f'{name}/parallel-{workers}':<30}{parallel['seconds']:>9.3f}s{parallel['nodes']:>10}"
+                  f"{parallel['peak_bytes'] / 2 ** 20:>8.1f}MB  speed-up {result['seconds'] / parallel['seconds']:.2f}")
+        if latency > 0 and engine == BACKTRACKING:
+            for prefetch_concurrency in (0, PREFETCH_CONCURRENCY):
+                loaded = measure_latency(SCENARIOS[name], latency, prefetch_concurrency)
+                print(f"{f'{name}/prefetch-{prefetch_concurrency}':<30}{loaded['seconds']:>9.3f}s  "
+                      f"waited {loaded['waited']:.3f}s for packuments, hid {loaded['hidden']:.3f}s")
+
+    if update:
+        with open(BASELINE, "w") as writer:
+            json.dump({**baselines, **results}, writer, indent=2)
+            writer.write("\n")
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
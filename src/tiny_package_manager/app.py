@@ -1,16 +1,34 @@
+import asyncio
 import os
+import tempfile
+from typing import Optional
 
-import requests
 from semantic_version import Version, NpmSpec
 
-from .base import Package, Reference, PackageVersion
+from .base import Package, Reference, PackageVersion, format_name
+from .integrity import Integrity
+from .registry import RegistryClient, default_client
+
+# where the downloaded tarballs are cached
+TARBALL_DIRECTORY = os.path.expanduser("~/.tiny-package-manager/tarballs")
 
 
 class RemotePackage(Package):
-    def __init__(self, name: str, sem_version_str: str, reference: Reference):
+    def __init__(self,
+                 name: str,
+                 sem_version_str: str,
+                 reference: Optional[Reference],
+                 client: Optional[RegistryClient] = None,
+                 directory: str = TARBALL_DIRECTORY):
+        """
+        :param reference: gives the integrity of the tarball, None to download it without checking it
+        :param directory: where the tarball is cached
+        """
         super().__init__(name)
         self.sem_version = NpmSpec(sem_version_str)
         self.references = reference
+        self.client = client
+        self.directory = directory
 
     def __eq__(self, __value):
         return (str(self.sem_version) == str(__value.sem_version)
@@ -25,18 +43,35 @@ class RemotePackage(Package):
         return self.sem_version < other.sem_version
 
     def fetch(self) -> bytes:
-        return self._http_fetch()
+        with open(self.download(), "rb") as reader:
+            return reader.read()
 
     def package_versions(self) -> list[PackageVersion]:
         return self.references.package_versions(self.name)
 
-    def _http_fetch(self):
-        url = f"https://registry.yarnpkg.com/{self.name}/-/{self.name}-{str(self.sem_version)}.tgz"
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.content
-        else:
-            raise ValueError(f"error fetching {url}")
+    def download(self, directory: Optional[str] = None, integrity: Optional[str] = None) -> str:
+        """
+        stream the tarball into the cache unless it's already there, checking the integrity given by the registry.
+        A tarball is only ever moved into the cache once verified.
+
+        :param directory: the cache, `self.directory` by default
+        :param integrity: of the tarball if the caller looked it up already, else it is asked to the reference
+        :return: path of the tarball
+        """
+        version_name = str(self.sem_version)
+        path = os.path.join(directory or self.directory, f"{format_name(self.name)}-{version_name}.tgz")
+        if not os.path.exists(path):
+            if integrity is None:
+                integrity = self._integrity(version_name)
+            client = self.client or default_client()
+            client.download(client.tarball_url(self.name, version_name), path,
+                            Integrity(integrity) if integrity is not None else None)
+        return path
+
+    def _integrity(self, version_name: str) -> Optional[str]:
+        if self.references is None:
+            return None
+        return self.references.integrity(self.name, version_name)
 
 
 class LocalPackage(Package):
@@ -53,19 +88,27 @@ class LocalPackage(Package):
             return reader.read()
 
     def store(self, data: bytes):
-        with open(self.abs_path, "wb") as writer:
-            writer.write(data)
+        # written aside then renamed, threads storing the same package never leave a mix of their writes behind
+        directory = os.path.dirname(self.abs_path)
+        writer = tempfile.NamedTemporaryFile("wb", dir=directory, prefix=".tmp-", delete=False)
+        try:
+            with writer:
+                writer.write(data)
+            os.replace(writer.name, self.abs_path)
+        except BaseException:
+            os.remove(writer.name)
+            raise
 
     def _get_abs_path(self):
         return os.path.abspath(self.path)
 
 
-# async download file
+# async download file, the blocking io runs in a thread so that the event loop can fetch other packages meanwhile
 async def fetch_package(package: Package) -> bytes:
     if isinstance(package, LocalPackage):
-        return package.fetch()
+        return await asyncio.to_thread(package.fetch)
     elif isinstance(package, RemotePackage):
-        return package.fetch()
+        return await asyncio.to_thread(package.fetch)
     else:
         raise TypeError(f"Unsupported package type: {type(package)}")
 
@@ -1,7 +1,15 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 from semantic_version import Version
 
+from .integrity import Integrity, IntegrityError
+from .metadata import MetadataStore
+from .registry import RegistryClient
+from .registry_test import LocalRegistry
 from .utils import get_pinned_reference
 from .reference import YarnReference
 from .app import LocalPackage, RemotePackage
@@ -21,11 +29,55 @@ class ManagerTestCase(unittest.TestCase):
         local = LocalPackage("local", "../tiny-package-manager/resources/relative_package")
         assert local.fetch() == RELATIVE_DATA.encode()
 
-    @staticmethod
-    def test_remote_package_1():
-        remote = RemotePackage("dayjs", "1.11.13", YarnReference())
+    def test_remote_package_1(self):
         local = LocalPackage("dayjs", "./resources/dayjs-1.11.13.tgz")
-        assert remote.fetch() == local.fetch()
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as cache:
+            shutil.copy(local.abs_path, root)
+            with open(os.path.join(root, "dayjs"), "w") as writer:
+                json.dump({"name": "dayjs",
+                           "versions": {"1.11.13": {"dist": {"integrity": str(Integrity.of(local.fetch()))}}}},
+                          writer)
+            with LocalRegistry(root) as registry, RegistryClient(registry.url) as client:
+                reference = YarnReference(client=client, store=MetadataStore(":memory:"), max_age=0)
+                remote = RemotePackage("dayjs", "1.11.13", reference, client, cache)
+                self.assertEqual(remote.fetch(), local.fetch())
+                self.assertEqual(registry.hits["/dayjs/-/dayjs-1.11.13.tgz"], 1)
+                self.assertEqual(os.listdir(cache), ["dayjs-1.11.13.tgz"])
+
+    def test_remote_package_download(self):
+        with open("./resources/dayjs-1.11.13.tgz", "rb") as reader:
+            data = reader.read()
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as cache:
+            shutil.copy("./resources/dayjs-1.11.13.tgz", root)
+            for integrity in (Integrity.of(data), Integrity.of(b"corrupt")):
+                with open(os.path.join(root, "dayjs"), "w") as writer:
+                    json.dump({"name": "dayjs", "versions": {"1.11.13": {"dist": {"integrity": str(integrity)}}}},
+                              writer)
+                with LocalRegistry(root) as registry, RegistryClient(registry.url) as client:
+                    reference = YarnReference(client=client, store=MetadataStore(":memory:"), max_age=0)
+                    remote = RemotePackage("dayjs", "1.11.13", reference, client)
+                    if integrity.digests["sha512"] == Integrity.of(data).digests["sha512"]:
+                        path = remote.download(cache)
+                        with open(path, "rb") as reader:
+                            self.assertEqual(reader.read(), data)
+                        os.remove(path)
+                    else:
+                        with self.assertRaises(IntegrityError):
+                            remote.download(cache)
+                        self.assertEqual(os.listdir(cache), [])
+
+    def test_local_package_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            local = LocalPackage("local", os.path.join(directory, "package"))
+            local.store(b"stored")
+            self.assertEqual(local.fetch(), b"stored")
+
+            # the temporary file is removed when it can't replace the package
+            local = LocalPackage("local", os.path.join(directory, "directory"))
+            os.mkdir(local.abs_path)
+            with self.assertRaises(OSError):
+                local.store(b"stored")
+            self.assertEqual(sorted(os.listdir(directory)), ["directory", "package"])
 
     @staticmethod
     def test_remote_package_get_pinned_reference():
@@ -1,10 +1,19 @@
+import multiprocessing
+from typing import Iterable, Iterator, Optional
+
 from semantic_version import Version
 
 PackageName = str
 VersionName = str
 
+# how the worker processes are started: threads (downloads, prefetching) are running by then, forking them could
+# deadlock
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
 
 class PackageVersion(object):
+    __slots__ = ("name", "version")
+
     def __init__(self, name: PackageName, version: Version):
         self.name = name
         self.version = version
@@ -25,29 +34,199 @@ class PackageVersion(object):
         return self.name.__lt__(other.name)
 
 
+class InternedVersion(Version):
+    """
+    a version parsed once by the VersionTable of its package. Versions of the same table are equal, ordered and
+    hashed by their index in the sorted versions of the package, compared with any other version they behave as a
+    `Version`.
+    """
+
+    def __init__(self, version_name: VersionName):
+        super().__init__(version_name)
+        self.table: Optional['VersionTable'] = None
+        self.index = -1
+        # `Version` computes both on every call
+        self.name = super().__str__()
+        self.hash = super().__hash__()
+
+    def __str__(self):
+        return self.name
+
+    def __hash__(self):
+        return self.hash
+
+    def __reduce__(self):
+        # parsed again before its table is restored, whose indexes hash it
+        return InternedVersion, (self.name,), {"table": self.table, "index": self.index}
+
+    def __eq__(self, other):
+        if type(other) is InternedVersion and other.table is self.table is not None:
+            return self.index == other.index
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        if type(other) is InternedVersion and other.table is self.table is not None:
+            return self.index != other.index
+        return super().__ne__(other)
+
+    def __lt__(self, other):
+        if type(other) is InternedVersion and other.table is self.table is not None:
+            return self.index < other.index
+        return super().__lt__(other)
+
+    def __le__(self, other):
+        if type(other) is InternedVersion and other.table is self.table is not None:
+            return self.index <= other.index
+        return super().__le__(other)
+
+    def __gt__(self, other):
+        if type(other) is InternedVersion and other.table is self.table is not None:
+            return self.index > other.index
+        return super().__gt__(other)
+
+    def __ge__(self, other):
+        if type(other) is InternedVersion and other.table is self.table is not None:
+            return self.index >= other.index
+        return super().__ge__(other)
+
+
+class VersionTable(object):
+    """
+    all versions of a package interned into a sorted array, so that a set of them is a bitset. Every version name is
+    parsed once, into an `InternedVersion`.
+    """
+
+    def __init__(self, package_name: PackageName, version_names: Iterable[VersionName]):
+        """
+        :param package_name: the name of the package
+        :param version_names: the versions of the package, in the order of the registry
+        """
+        self.package_name = package_name
+        self.names: dict[VersionName, InternedVersion] = {version_name: InternedVersion(version_name)
+                                                          for version_name in version_names}
+        self.versions: list[InternedVersion] = sorted(set(self.names.values()))
+        self.indexes: dict[Version, int] = {version: idx for idx, version in enumerate(self.versions)}
+        for version in self.names.values():
+            version.index = self.indexes[version]
+            version.table = self
+        # indexes of the versions in the order of the registry
+        self.listed: list[int] = list(dict.fromkeys(self.indexes[version] for version in self.names.values()))
+
+    def __len__(self):
+        return len(self.versions)
+
+    def version(self, version_name: VersionName) -> Version:
+        return self.names[version_name]
+
+    def index(self, version: Version) -> Optional[int]:
+        """
+        :return: the index of the version in the sorted versions, None if it isn't a version of the package
+        """
+        if type(version) is InternedVersion and version.table is self:
+            return version.index
+        return self.indexes.get(version)
+
+    def version_set(self, versions: Iterable[Version]) -> 'VersionSet':
+        bits = 0
+        for version in versions:
+            bits |= 1 << self.indexes[version]
+        return VersionSet(self, bits)
+
+    def all(self) -> 'VersionSet':
+        return VersionSet(self, (1 << len(self.versions)) - 1)
+
+
+class VersionSet(object):
+    """
+    a set of versions of one package, stored as a bitset over the VersionTable of the package: a range of npm is a run
+    of consecutive indexes of the sorted versions. The sets of a range are shared by every version depending on it,
+    see `YarnReference.matching_versions`.
+    """
+
+    __slots__ = ("table", "bits")
+
+    def __init__(self, table: VersionTable, bits: int = 0):
+        self.table = table
+        self.bits = bits
+
+    def __contains__(self, version: Version) -> bool:
+        idx = self.table.index(version)
+        return idx is not None and (self.bits >> idx) & 1 == 1
+
+    def __and__(self, other: 'VersionSet') -> 'VersionSet':
+        return VersionSet(self.table, self.bits & self._bits_of(other))
+
+    def __or__(self, other: 'VersionSet') -> 'VersionSet':
+        return VersionSet(self.table, self.bits | self._bits_of(other))
+
+    def __sub__(self, other: 'VersionSet') -> 'VersionSet':
+        return VersionSet(self.table, self.bits & ~self._bits_of(other))
+
+    def __eq__(self, other):
+        if not isinstance(other, VersionSet):
+            return False
+        return self.table is other.table and self.bits == other.bits
+
+    def __hash__(self):
+        return hash((self.table.package_name, self.bits))
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __iter__(self) -> Iterator[Version]:
+        """
+        iterate the versions from the oldest to the newest
+        """
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            yield self.table.versions[lowest.bit_length() - 1]
+            bits ^= lowest
+
+    def __repr__(self):
+        return f"VersionSet({self.table.package_name}, {[str(version) for version in self]})"
+
+    def listed(self) -> list[Version]:
+        """
+        :return: the versions in the order of the registry
+        """
+        return [self.table.versions[idx] for idx in self.table.listed if (self.bits >> idx) & 1]
+
+    def _bits_of(self, other: 'VersionSet') -> int:
+        if self.table is not other.table:
+            raise ValueError(f"{self} and {other} are versions of different packages")
+        return other.bits
+
+
 class VersionDependency(object):
-    def __init__(self, versions: dict[PackageName, list[Version]]):
+    """
+    the dependencies of a version: package -> its versions matching the range. The versions with the same ranges share
+    one, so it isn't updated once it is in the manifest, see `Dependencies.shared`.
+    """
+
+    __slots__ = ("versions",)
+
+    def __init__(self, versions: dict[PackageName, VersionSet]):
         self.versions = versions
 
-    def update(self, package_name: PackageName, versions: list[Version]):
-        if package_name not in self.versions:
-            self.versions[package_name] = []
+    def update(self, package_name: PackageName, versions: VersionSet):
         self.versions[package_name] = versions
 
     def compatible(self, dep_package_version: PackageVersion) -> bool:
         if PackageName(dep_package_version.name) not in self.versions:
             return True
-        version_list = self.versions[PackageName(dep_package_version.name)]
-        for version in version_list:
-            if version == dep_package_version.version:
-                return True
-        return False
+        return dep_package_version.version in self.versions[PackageName(dep_package_version.name)]
 
     def all_packages(self) -> list[PackageName]:
         return [version for version in self.versions]
 
 
 class VersionDependencies(object):
+    __slots__ = ("version_name", "version_dependencies")
+
     def __init__(self, version_name: VersionName, version_dependencies: dict[VersionName, VersionDependency]):
         self.version_name = version_name
         self.version_dependencies = version_dependencies
@@ -75,8 +254,12 @@ class VersionDependencies(object):
 
 
 class Dependencies(object):
+    __slots__ = ("dependencies", "tables", "count")
+
     def __init__(self, dependencies: dict[PackageName, VersionDependencies]):
         self.dependencies = dependencies
+        # the raw ranges of a version -> its dependencies, shared by the versions with the same ranges
+        self.tables: dict[tuple[str, ...], VersionDependency] = {}
         self.count = 0
 
     def update(self,
@@ -94,6 +277,17 @@ class Dependencies(object):
             self.dependencies[package_name] = VersionDependencies(package_name, {})
         self.dependencies[package_name].update(version_name, version_dependency)
 
+    def shared(self, ranges: tuple[str, ...]) -> Optional[VersionDependency]:
+        """
+        :param ranges: the raw dependencies of a version, package and npm range one after the other in the order of the
+                       packument
+        :return: the dependencies already built for the same ranges, None if there aren't any
+        """
+        return self.tables.get(ranges)
+
+    def share(self, ranges: tuple[str, ...], version_dependency: VersionDependency):
+        self.tables[ranges] = version_dependency
+
     def inc_count(self) -> int:
         self.count += 1
         return self.count
@@ -124,6 +318,15 @@ class Dependencies(object):
         return version_dependencies.compatible(package_version, dep_package_version)
 
 
+def format_name(name: str) -> str:
+    """
+    file name of the things cached for a package, scoped names contain a slash
+    """
+    name = name.replace("@", "at_")
+    name = name.replace("/", "_")
+    return name
+
+
 class Reference(object):
     def package_versions(self, name: str) -> list[PackageVersion]:
         """
@@ -134,6 +337,12 @@ class Reference(object):
     def dependencies(self, name: str, version: Version) -> Dependencies:
         raise NotImplementedError()
 
+    def integrity(self, name: str, version_name: str) -> Optional[str]:
+        """
+        integrity of the tarball of a version, None if the registry doesn't tell
+        """
+        return None
+
 
 class Package:
     def __init__(self, name: str):
@@ -0,0 +1,270 @@
+import multiprocessing
+import os
+import shutil
+import tarfile
+import time
+from concurrent import futures
+from typing import Iterable, Optional
+
+from .app import RemotePackage, TARBALL_DIRECTORY
+from .base import START_METHOD, PackageVersion, Reference, format_name
+from .integrity import Integrity
+from .package_store import PackageStore, link_tree
+from .registry import RegistryClient, default_client
+
+NODE_MODULES = "./node_modules"
+
+DOWNLOAD = "download"
+VERIFY = "verify"
+DECOMPRESS = "decompress"
+WRITE = "write"
+LINK = "link"
+STAGES = (DOWNLOAD, VERIFY, DECOMPRESS, WRITE, LINK)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class InstallStats(object):
+    def __init__(self):
+        self.packages = 0
+        # tarballs downloaded, the others were in the cache already
+        self.downloaded = 0
+        # packages found extracted in the package store, nothing was downloaded nor extracted for them
+        self.stored = 0
+        # files written or linked
+        self.files = 0
+        # bytes of the files extracted
+        self.bytes = 0
+        # files materialized from the package store by each link method
+        self.links: dict[str, int] = {}
+        # seconds spent in every stage, summed over the packages: stages overlap, their sum exceeds `elapsed`
+        self.stages: dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.elapsed = 0.0
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] += seconds
+
+    def __str__(self):
+        stages = ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in self.stages.items())
+        links = "".join(f", {method}={count}" for method, count in self.links.items())
+        return (f"packages={self.packages}, downloaded={self.downloaded}, stored={self.stored}, files={self.files}, "
+                f"bytes={self.bytes}{links}, {stages}, elapsed={self.elapsed:.3f}s")
+
+
+class Installer(object):
+    """
+    install a solution into a flat node_modules: download -> verify -> decompress -> write, pipelined so that the
+    network and the disk work of different packages overlap. Downloads run in threads, extractions in processes.
+
+    With a package store, packages are extracted into the store once and linked into the projects: a package found
+    in the store is neither downloaded nor extracted again.
+    """
+
+    def __init__(self,
+                 reference: Reference,
+                 client: Optional[RegistryClient] = None,
+                 cache_directory: str = TARBALL_DIRECTORY,
+                 concurrency: int = 8,
+                 processes: Optional[int] = None,
+                 store: Optional[PackageStore] = None):
+        """
+        :param cache_directory: where the tarballs are cached
+        :param concurrency: downloads in flight
+        :param processes: extraction processes, the number of CPUs by default
+        :param store: where the packages are extracted, to be linked into node_modules
+        """
+        self.reference = reference
+        self.client = client or default_client()
+        self.cache_directory = cache_directory
+        self.concurrency = concurrency
+        self.processes = processes
+        self.store = store
+        self.stats = InstallStats()
+
+    def install(self, solution: Iterable[PackageVersion], node_modules: str = NODE_MODULES) -> InstallStats:
+        self.stats = InstallStats()
+        start = time.perf_counter()
+        # extraction and link futures -> package, and the staging directory and integrity of the extractions into
+        # the store
+        working: dict[futures.Future, tuple[PackageVersion, Optional[str], Optional[str]]] = {}
+        try:
+            with (futures.ThreadPoolExecutor(max_workers=self.concurrency) as downloads,
+                  futures.ProcessPoolExecutor(max_workers=self.processes,
+                                              mp_context=multiprocessing.get_context(START_METHOD)) as extractions):
+                # looked up here, the reference isn't safe to use from the download threads
+                integrities = [(package_version, self.reference.integrity(package_version.name,
+                                                                          str(package_version.version)))
+                               for package_version in solution]
+                downloading = {downloads.submit(self._download, package_version, integrity): package_version
+                               for package_version, integrity in integrities}
+                while downloading or working:
+                    done, _ = futures.wait(downloading.keys() | working.keys(), return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        if future in downloading:
+                            # extract this one while the others are still downloading
+                            package_version = downloading.pop(future)
+                            destination = os.path.join(node_modules, package_version.name)
+                            working.update(self._extract(extractions, package_version, destination, *future.result()))
+                            continue
+
+                        package_version, staging, integrity = working.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception:
+                            if staging is not None:
+                                shutil.rmtree(staging, ignore_errors=True)
+                            raise
+                        # the files extracted into the store are counted once linked into node_modules
+                        self._extracted(result, count_files=staging is None)
+                        if staging is None:
+                            self.stats.packages += 1
+                            continue
+                        source = self.store.commit(staging, Integrity(integrity))
+                        destination = os.path.join(node_modules, package_version.name)
+                        working[extractions.submit(link_package, source, destination)] = (package_version, None, None)
+        finally:
+            # after a failure, the extractions into the store which weren't committed, once the pools are shut down
+            for _, staging, _ in working.values():
+                if staging is not None:
+                    shutil.rmtree(staging, ignore_errors=True)
+        self.stats.elapsed = time.perf_counter() - start
+        return self.stats
+
+    def _extract(self,
+                 extractions: futures.Executor,
+                 package_version: PackageVersion,
+                 destination: str,
+                 path: Optional[str],
+                 integrity: Optional[str],
+                 verify: bool,
+                 seconds: Optional[float]) -> dict[futures.Future, tuple[PackageVersion, Optional[str], Optional[str]]]:
+        """
+        schedule the extraction of a downloaded package, see `_download` for the parameters
+        """
+        if seconds is not None:
+            self.stats.add(DOWNLOAD, seconds)
+            self.stats.downloaded += 1
+        if path is None:
+            self.stats.stored += 1
+            source = self.store.path(Integrity(integrity))
+            return {extractions.submit(link_package, source, destination): (package_version, None, None)}
+
+        if self.store is not None and integrity is not None:
+            staging = self.store.staging_directory()
+            future = extractions.submit(extract_tarball, path, staging, integrity if verify else None)
+            return {future: (package_version, staging, integrity)}
+        future = extractions.submit(extract_tarball, path, destination, integrity if verify else None)
+        return {future: (package_version, None, None)}
+
+    def _download(self,
+                  package_version: PackageVersion,
+                  integrity: Optional[str]) -> tuple[Optional[str], Optional[str], bool, Optional[float]]:
+        """
+        runs in a download thread
+
+        :param integrity: of the tarball as the reference gives it, None if it doesn't
+        :return: path of the tarball, None if the package is in the store already, its integrity, whether the
+        tarball still has to be verified, and the seconds spent downloading it, None if it was in the cache
+        """
+        version_name = str(package_version.version)
+        if self.store is not None and integrity is not None and self.store.has(Integrity(integrity)):
+            return None, integrity, False, None
+        path = os.path.join(self.cache_directory, f"{format_name(package_version.name)}-{version_name}.tgz")
+        if os.path.exists(path):
+            # the cache may hold tarballs from anywhere, they are verified before being extracted
+            return path, integrity, True, None
+        start = time.perf_counter()
+        # without the reference, the integrity was looked up already
+        remote = RemotePackage(package_version.name, version_name, None, self.client)
+        # verified as it arrives
+        path = remote.download(self.cache_directory, integrity)
+        return path, integrity, False, time.perf_counter() - start
+
+    def _extracted(self, result: dict, count_files: bool = True):
+        if count_files:
+            self.stats.files += result["files"]
+        self.stats.bytes += result["bytes"]
+        for stage in (VERIFY, DECOMPRESS, WRITE, LINK):
+            self.stats.add(stage, result[stage])
+        for method, count in result["links"].items():
+            self.stats.links[method] = self.stats.links.get(method, 0) + count
+
+
+def extract_tarball(path: str, destination: str, integrity: Optional[str] = None) -> dict:
+    """
+    extract a package tarball into `destination`, without its top directory (`package/` usually) as npm does.
+    Runs in a worker process.
+
+    :param integrity: checked before anything is extracted if given
+    :return: files and bytes written, and seconds spent in each stage
+    """
+    result = _result()
+    if integrity is not None:
+        start = time.perf_counter()
+        _verify(path, Integrity(integrity))
+        result[VERIFY] = time.perf_counter() - start
+
+    root = os.path.abspath(destination)
+    with open(path, "rb") as file_obj, tarfile.open(fileobj=file_obj, mode="r|*") as tar:
+        for tar_info in tar:
+            target = _target(root, tar_info.name)
+            if target is None or not (tar_info.isfile() or tar_info.isdir()):
+                continue
+            if tar_info.isdir():
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            start = time.perf_counter()
+            with tar.extractfile(tar_info) as reader:
+                data = reader.read()
+            written = time.perf_counter()
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as writer:
+                writer.write(data)
+            # keep the executable bits, npm packages ship scripts
+            os.chmod(target, 0o755 if tar_info.mode & 0o111 else 0o644)
+            result[DECOMPRESS] += written - start
+            result[WRITE] += time.perf_counter() - written
+            result["files"] += 1
+            result["bytes"] += len(data)
+    return result
+
+
+def link_package(source: str, destination: str) -> dict:
+    """
+    link a package of the store into `destination`, runs in a worker process
+
+    :return: same as `extract_tarball`
+    """
+    start = time.perf_counter()
+    links = link_tree(source, destination)
+    result = _result()
+    result[LINK] = time.perf_counter() - start
+    result["links"] = links
+    result["files"] = sum(links.values())
+    return result
+
+
+def _result() -> dict:
+    return {"files": 0, "bytes": 0, "links": {}, VERIFY: 0.0, DECOMPRESS: 0.0, WRITE: 0.0, LINK: 0.0}
+
+
+def _verify(path: str, integrity: Integrity):
+    verifier = integrity.verifier()
+    with open(path, "rb") as reader:
+        while chunk := reader.read(READ_CHUNK_SIZE):
+            verifier.update(chunk)
+    verifier.verify(path)
+
+
+def _target(root: str, name: str) -> Optional[str]:
+    """
+    :return: where a member goes, None for the top directory itself
+    """
+    parts = name.replace("\\", "/").split("/")[1:]
+    if not any(parts):
+        return None
+    target = os.path.abspath(os.path.join(root, *parts))
+    if os.path.commonpath([root, target]) != root:
+        raise ValueError(f"{name} is outside of the package")
+    return target
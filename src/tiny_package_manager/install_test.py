@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from semantic_version import Version
+
+from .app import LocalPackage, fetch_package
+from .base import PackageVersion
+from .install import *
+from .integrity import Integrity, IntegrityError
+from .metadata import MetadataStore
+from .package_store import *
+from .reference import YarnReference
+from .registry import RegistryClient
+from .registry_test import LocalRegistry
+from .utils import read_file_from_tarball
+
+TARBALLS = {"dayjs": "1.11.13", "jest": "0.0.71"}
+
+
+class InstallerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.node_modules = tempfile.mkdtemp()
+        for name, version_name in TARBALLS.items():
+            shutil.copy(f"./resources/{name}-{version_name}.tgz", self.root)
+            self.publish(name, version_name)
+        self.solution = [PackageVersion(name, Version(version_name)) for name, version_name in TARBALLS.items()]
+
+    def tearDown(self):
+        for directory in (self.root, self.cache, self.node_modules):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def publish(self, name: str, version_name: str, integrity: Optional[Integrity] = None):
+        if integrity is None:
+            with open(os.path.join(self.root, f"{name}-{version_name}.tgz"), "rb") as reader:
+                integrity = Integrity.of(reader.read())
+        with open(os.path.join(self.root, name), "w") as writer:
+            json.dump({"name": name, "versions": {version_name: {"dist": {"integrity": str(integrity)}}}}, writer)
+
+    def install(self, store: Optional[PackageStore] = None) -> InstallStats:
+        with LocalRegistry(self.root) as registry, RegistryClient(registry.url) as client:
+            reference = YarnReference(client=client, store=MetadataStore(":memory:"), max_age=0)
+            return Installer(reference, client, self.cache, concurrency=2, processes=2, store=store).install(
+                self.solution, self.node_modules)
+
+    def assertInstalled(self):
+        for name, version_name in TARBALLS.items():
+            tarball = f"./resources/{name}-{version_name}.tgz"
+            with open(os.path.join(self.node_modules, name, "package.json"), "rb") as reader:
+                self.assertEqual(reader.read(), read_file_from_tarball(tarball, "package", "package.json"))
+
+    def test_install(self):
+        stats = self.install()
+        self.assertEqual(stats.packages, 2)
+        self.assertEqual(stats.downloaded, 2)
+        self.assertGreater(stats.stages[DECOMPRESS], 0)
+        self.assertEqual(stats.stages[VERIFY], 0)
+        self.assertInstalled()
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.node_modules)), stats.files)
+
+        # the tarballs are cached now, and verified again before being extracted
+        stats = self.install()
+        self.assertEqual(stats.downloaded, 0)
+        self.assertGreater(stats.stages[VERIFY], 0)
+
+    def test_integrity_thread(self):
+        threads = set()
+        with LocalRegistry(self.root) as registry, RegistryClient(registry.url) as client:
+            reference = YarnReference(client=client, store=MetadataStore(":memory:"), max_age=0)
+            integrity = reference.integrity
+
+            def recorded_integrity(name: str, version_name: str) -> Optional[str]:
+                threads.add(threading.current_thread())
+                return integrity(name, version_name)
+
+            # the metadata counters of the reference aren't updated from the download threads
+            reference.integrity = recorded_integrity
+            Installer(reference, client, self.cache, concurrency=2, processes=2).install(self.solution,
+                                                                                          self.node_modules)
+        self.assertEqual(threads, {threading.current_thread()})
+        self.assertInstalled()
+
+    def test_package_store(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = PackageStore(root)
+            stats = self.install(store)
+            self.assertEqual((stats.packages, stats.downloaded, stats.stored), (2, 2, 0))
+            self.assertEqual(stats.links, {HARDLINK: stats.files, REFLINK: 0, COPY: 0})
+            self.assertInstalled()
+
+            # another project: nothing is downloaded nor extracted
+            shutil.rmtree(self.cache)
+            shutil.rmtree(self.node_modules)
+            stats = self.install(store)
+            self.assertEqual((stats.packages, stats.downloaded, stats.stored), (2, 0, 2))
+            self.assertEqual((stats.stages[DECOMPRESS], stats.bytes), (0, 0))
+            self.assertInstalled()
+
+            with open(os.path.join(self.root, "dayjs")) as reader:
+                integrity = Integrity(json.load(reader)["versions"]["1.11.13"]["dist"]["integrity"])
+            stored = os.path.join(store.path(integrity), "package.json")
+            installed = os.path.join(self.node_modules, "dayjs", "package.json")
+            self.assertTrue(os.path.samefile(stored, installed))
+            self.assertEqual([name for name in os.listdir(root) if name.startswith(".staging-")], [])
+
+    def test_link_fallback(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as destination:
+            os.makedirs(os.path.join(source, "lib"))
+            for name in ("package.json", "lib/index.js", COMPLETE):
+                with open(os.path.join(source, name), "w") as writer:
+                    writer.write(name)
+            target = os.path.join(destination, "package")
+            self.assertEqual(link_tree(source, target, (COPY,)), {COPY: 2})
+            # reflinks aren't supported by every file system, those fall back to copies
+            links = link_tree(source, target, (REFLINK, COPY))
+            self.assertEqual(sum(links.values()), 2)
+            with open(os.path.join(target, "lib", "index.js")) as reader:
+                self.assertEqual(reader.read(), "lib/index.js")
+            self.assertFalse(os.path.exists(os.path.join(target, COMPLETE)))
+
+    def test_corrupt_cache(self):
+        self.install()
+        self.publish("dayjs", TARBALLS["dayjs"], Integrity.of(b"corrupt"))
+        with self.assertRaises(IntegrityError):
+            self.install()
+
+    def test_corrupt_store_extraction(self):
+        self.install()
+        self.publish("dayjs", TARBALLS["dayjs"], Integrity.of(b"corrupt"))
+        with tempfile.TemporaryDirectory() as root:
+            with self.assertRaises(IntegrityError):
+                self.install(PackageStore(root))
+            self.assertEqual([name for name in os.listdir(root) if name.startswith(".staging-")], [])
+
+    def test_fetch_package(self):
+        local = LocalPackage("dayjs", "./resources/dayjs-1.11.13.tgz")
+        self.assertEqual(asyncio.run(fetch_package(local)), local.fetch())
+
+
+if __name__ == '__main__':
+    unittest.main()
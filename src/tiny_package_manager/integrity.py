@@ -0,0 +1,72 @@
+import base64
+import hashlib
+from typing import Optional
+
+# strongest first, an integrity listing several digests is checked against the strongest one
+ALGORITHMS = ("sha512", "sha384", "sha256", "sha1")
+
+
+class IntegrityError(ValueError):
+    pass
+
+
+class Integrity(object):
+    """
+    a subresource integrity string, as in `dist.integrity`: space separated `<algorithm>-<base64 digest>`
+    """
+
+    def __init__(self, integrity: str):
+        self.digests: dict[str, bytes] = {}
+        for entry in integrity.split():
+            algorithm, _, digest = entry.partition("-")
+            # options after the digest, `sha512-...?foo`, are ignored like npm does
+            digest = digest.split("?")[0]
+            if algorithm in ALGORITHMS and algorithm not in self.digests:
+                self.digests[algorithm] = base64.b64decode(digest)
+        if not self.digests:
+            raise ValueError(f"unsupported integrity {integrity!r}")
+        self.algorithm = next(algorithm for algorithm in ALGORITHMS if algorithm in self.digests)
+
+    def __str__(self):
+        return " ".join(f"{algorithm}-{base64.b64encode(digest).decode()}"
+                        for algorithm, digest in self.digests.items())
+
+    def verifier(self) -> "Verifier":
+        return Verifier(self)
+
+    @staticmethod
+    def of(data: bytes, algorithm: str = "sha512") -> "Integrity":
+        return Integrity(f"{algorithm}-{base64.b64encode(hashlib.new(algorithm, data).digest()).decode()}")
+
+
+class Verifier(object):
+    """
+    hash the data as it arrives, to check it right after the last chunk
+    """
+
+    def __init__(self, integrity: Integrity):
+        self.integrity = integrity
+        self.hash = hashlib.new(integrity.algorithm)
+
+    def update(self, chunk: bytes):
+        self.hash.update(chunk)
+
+    def verify(self, what: str):
+        expected = self.integrity.digests[self.integrity.algorithm]
+        if self.hash.digest() != expected:
+            actual = base64.b64encode(self.hash.digest()).decode()
+            raise IntegrityError(f"{what}: {self.integrity.algorithm} is {actual}, expected {self.integrity}")
+
+
+def dist_integrity(dist: dict) -> Optional[str]:
+    """
+    integrity of a tarball from the `dist` of a version, old versions only have a hex sha1 `shasum`
+    """
+    if not isinstance(dist, dict):
+        return None
+    if dist.get("integrity"):
+        return dist["integrity"]
+    try:
+        return f"sha1-{base64.b64encode(bytes.fromhex(dist['shasum'])).decode()}"
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,38 @@
+import unittest
+
+from .integrity import *
+
+
+class IntegrityTestCase(unittest.TestCase):
+    def test_strongest(self):
+        data = b"tarball"
+        sha1 = Integrity.of(data, "sha1")
+        sha512 = Integrity.of(data)
+        integrity = Integrity(f"{sha1} {sha512}?foo")
+        self.assertEqual(integrity.algorithm, "sha512")
+
+        verifier = integrity.verifier()
+        verifier.update(data[:3])
+        verifier.update(data[3:])
+        verifier.verify("tarball")
+
+        verifier = Integrity(f"{sha1} {Integrity.of(b'other')}").verifier()
+        verifier.update(data)
+        with self.assertRaises(IntegrityError):
+            verifier.verify("tarball")
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            Integrity("md5-AAAA")
+
+    def test_dist_integrity(self):
+        self.assertEqual(dist_integrity({"integrity": "sha512-AAAA", "shasum": "00"}), "sha512-AAAA")
+        shasum = "4f7b4b8ea3f56a3b89cf1fba2ca13bc4bea2c5f8"
+        self.assertEqual(Integrity(dist_integrity({"shasum": shasum})).digests["sha1"], bytes.fromhex(shasum))
+        self.assertIsNone(dist_integrity({"shasum": "not hex"}))
+        self.assertIsNone(dist_integrity({}))
+        self.assertIsNone(dist_integrity(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
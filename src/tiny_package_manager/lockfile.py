@@ -0,0 +1,113 @@
+import json
+import os
+from typing import Iterable, Optional
+
+from semantic_version import Version
+
+from .base import PackageName, PackageVersion
+
+# bump whenever the format changes, a lockfile with another version is ignored and rewritten
+LOCKFILE_VERSION = 1
+
+DEFAULT_LOCKFILE = "./tiny-package-lock.json"
+
+
+class LockedPackage(object):
+    def __init__(self,
+                 name: PackageName,
+                 version: Version,
+                 dependencies: Optional[dict[PackageName, str]] = None,
+                 integrity: Optional[str] = None):
+        """
+        :param dependencies: dependency ranges of the locked version, as published
+        :param integrity: integrity of its tarball, see `integrity.Integrity`
+        """
+        self.name = name
+        self.version = version
+        self.dependencies = dependencies or {}
+        self.integrity = integrity
+
+    def package_version(self) -> PackageVersion:
+        return PackageVersion(self.name, self.version)
+
+
+class Lockfile(object):
+    """
+    a resolved solution along with the direct dependencies it was resolved for. The solution is reused as is while
+    the direct dependencies don't change.
+    """
+
+    def __init__(self, direct_dependencies: dict[PackageName, str], packages: Iterable[LockedPackage]):
+        self.direct_dependencies = dict(direct_dependencies)
+        self.packages: dict[PackageName, LockedPackage] = {package.name: package for package in packages}
+
+    def solution(self) -> list[PackageVersion]:
+        return [package.package_version() for package in self.packages.values()]
+
+    def integrity(self, name: PackageName, version_name: str) -> Optional[str]:
+        package = self.packages.get(name)
+        if package is None or str(package.version) != version_name:
+            return None
+        return package.integrity
+
+    def reachable(self, names: Iterable[PackageName], excluded: Iterable[PackageName] = ()) -> set[PackageName]:
+        """
+        :param excluded: packages which aren't followed, nor the packages only reachable through them
+        :return: the locked packages among `names` and everything they depend on
+        """
+        excluded = set(excluded)
+        reachable: set[PackageName] = set()
+        pending = [name for name in names if name in self.packages]
+        while pending:
+            name = pending.pop()
+            if name in reachable or name in excluded:
+                continue
+            reachable.add(name)
+            pending.extend(dependency for dependency in self.packages[name].dependencies
+                           if dependency in self.packages)
+        return reachable
+
+    def unchanged(self, direct_dependencies: dict[PackageName, str]) -> dict[PackageName, Version]:
+        """
+        versions of the locked subtrees which are still wanted: the packages reachable from the direct dependencies
+        whose range didn't change, but not through the ones which changed or were added, their versions may not
+        match their new range
+
+        :return: name -> locked version
+        """
+        kept = [name for name, spec in direct_dependencies.items() if self.direct_dependencies.get(name) == spec]
+        changed = set(direct_dependencies) - set(kept)
+        return {name: self.packages[name].version for name in self.reachable(kept, changed)}
+
+    @staticmethod
+    def load(path: str) -> Optional["Lockfile"]:
+        """
+        :return: None if there is no lockfile, or if it was written by another version of the format
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as reader:
+            content: dict = json.load(reader)
+        if content.get("lockfileVersion") != LOCKFILE_VERSION:
+            return None
+        packages = [LockedPackage(name, Version(package["version"]), package.get("dependencies"),
+                                  package.get("integrity"))
+                    for name, package in content.get("packages", {}).items()]
+        return Lockfile(content.get("dependencies", {}), packages)
+
+    def save(self, path: str):
+        packages = {}
+        for name in sorted(self.packages):
+            package = self.packages[name]
+            packages[name] = {"version": str(package.version)}
+            if package.dependencies:
+                packages[name]["dependencies"] = package.dependencies
+            if package.integrity is not None:
+                packages[name]["integrity"] = package.integrity
+        content = {"lockfileVersion": LOCKFILE_VERSION, "dependencies": self.direct_dependencies, "packages": packages}
+        # written aside and renamed, an interrupted write never leaves a truncated lockfile
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as writer:
+            json.dump(content, writer, indent=2)
+            writer.write("\n")
+        os.replace(temporary, path)
@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from semantic_version import Version
+
+from .lockfile import *
+from .reference import NEWEST_FIRST, YarnReference
+from .reference_test import offline_reference
+from .synthetic import SyntheticReference
+
+
+class LockfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "tiny-package-lock.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_save_load(self):
+        lockfile = Lockfile({"a": "^1.0.0"}, [LockedPackage("a", Version("1.0.0"), {"b": "*"}, "sha512-AAAA"),
+                                              LockedPackage("b", Version("2.0.0"))])
+        lockfile.save(self.path)
+        loaded = Lockfile.load(self.path)
+        self.assertEqual(loaded.direct_dependencies, {"a": "^1.0.0"})
+        self.assertEqual(sorted(loaded.solution()), sorted(lockfile.solution()))
+        self.assertEqual(loaded.packages["a"].dependencies, {"b": "*"})
+        self.assertEqual(loaded.integrity("a", "1.0.0"), "sha512-AAAA")
+        self.assertIsNone(loaded.integrity("a", "1.0.1"))
+        self.assertIsNone(loaded.integrity("b", "2.0.0"))
+        self.assertEqual(loaded.reachable(["a"]), {"a", "b"})
+
+        self.assertIsNone(Lockfile.load(os.path.join(self.directory, "missing.json")))
+        with open(self.path, "w") as writer:
+            writer.write('{"lockfileVersion": 0}')
+        self.assertIsNone(Lockfile.load(self.path))
+
+    def test_unchanged(self):
+        reference = offline_reference(LOCKED_REFERENCE)
+        reference.package_version_cache["a"]["versions"]["1.0.0"]["dist"] = {"integrity": "sha512-a100"}
+        reference.direct_dependencies = {"a": "*", "b": "1.x"}
+        solution = reference.compile(lockfile=self.path)
+        self.assertTrue(os.path.isfile(self.path))
+
+        # nothing changed, no packument is loaded
+        reference = YarnReference()
+        reference.direct_dependencies = {"a": "*", "b": "1.x"}
+        self.assertEqual(sorted(reference.compile(lockfile=self.path)), sorted(solution))
+        self.assertEqual(reference.package_version_cache, {})
+        self.assertEqual(reference.integrity("a", "1.0.0"), "sha512-a100")
+        self.assertEqual(reference.stats.nodes, 0)
+
+    def test_partial(self):
+        reference = offline_reference(LOCKED_REFERENCE)
+        reference.direct_dependencies = {"a": "*", "b": "1.x"}
+        self.assertEqual(sorted(str(package_version) for package_version in reference.compile(lockfile=self.path)),
+                         ["(a:1.0.0)", "(b:1.0.0)", "(c:1.0.0)", "(d:1.0.0)"])
+
+        # newer versions are published meanwhile
+        reference = offline_reference(LOCKED_REFERENCE_UPDATED)
+        reference.direct_dependencies = {"a": "*", "b": "2.x"}
+        solution = reference.compile(version_order=NEWEST_FIRST, lockfile=self.path)
+        # the subtree of `a` is kept, the subtree of `b` is resolved again with the newest versions
+        self.assertEqual(sorted(str(package_version) for package_version in solution),
+                         ["(a:1.0.0)", "(b:2.0.0)", "(c:1.0.0)", "(e:2.0.0)"])
+        self.assertEqual(Lockfile.load(self.path).direct_dependencies, {"a": "*", "b": "2.x"})
+
+    def test_partial_packuments(self):
+        reference = SyntheticReference(LOCKED_REGISTRY)
+        reference.direct_dependencies = {"a": "*", "b": "1.x"}
+        reference.compile(lockfile=self.path)
+        self.assertEqual(reference.metadata_stats.packuments, 5)
+
+        # only `b` changed: the packuments of the subtree of `a` aren't loaded
+        reference = SyntheticReference(LOCKED_REGISTRY)
+        reference.direct_dependencies = {"a": "*", "b": "2.x"}
+        solution = reference.compile(version_order=NEWEST_FIRST, lockfile=self.path)
+        self.assertEqual(sorted(str(package_version) for package_version in solution),
+                         ["(a:1.0.0)", "(b:2.0.0)", "(c:1.0.0)", "(e:1.0.0)", "(f:1.0.0)"])
+        self.assertEqual(reference.metadata_stats.packuments, 2)
+        self.assertEqual(Lockfile.load(self.path).packages["c"].dependencies, {"f": "*"})
+
+    def test_partial_conflict(self):
+        reference = SyntheticReference(LOCKED_REGISTRY)
+        reference.direct_dependencies = {"a": "*", "b": "1.x"}
+        reference.compile(lockfile=self.path)
+
+        # `b` 3.0.0 needs a `c` which the locked `a` doesn't accept, `a` is resolved again
+        reference = SyntheticReference(LOCKED_REGISTRY)
+        reference.direct_dependencies = {"a": "*", "b": "3.x"}
+        solution = reference.compile(lockfile=self.path)
+        self.assertEqual(sorted(str(package_version) for package_version in solution),
+                         ["(a:1.1.0)", "(b:3.0.0)", "(c:2.0.0)"])
+
+    def test_partial_changed_range(self):
+        reference = SyntheticReference(CHANGED_REGISTRY)
+        reference.direct_dependencies = {"a": "*", "x": "1.x"}
+        self.assertEqual(sorted(str(package_version) for package_version in reference.compile(lockfile=self.path)),
+                         ["(a:1.0.0)", "(x:1.0.0)"])
+
+        # `x` is reachable from the kept `a` but its own range changed, its locked version isn't kept
+        reference = SyntheticReference(CHANGED_REGISTRY)
+        reference.direct_dependencies = {"a": "*", "x": "2.x"}
+        self.assertEqual(sorted(str(package_version) for package_version in reference.compile(lockfile=self.path)),
+                         ["(a:1.0.0)", "(x:2.0.0)"])
+
+        # the kept `b` needs `x` 1.x, which the new range of `x` doesn't accept: `b` is resolved again
+        os.remove(self.path)
+        reference = SyntheticReference(CHANGED_REGISTRY)
+        reference.direct_dependencies = {"b": "*", "x": "1.x"}
+        reference.compile(lockfile=self.path)
+        reference = SyntheticReference(CHANGED_REGISTRY)
+        reference.direct_dependencies = {"b": "*", "x": "2.x"}
+        self.assertEqual(sorted(str(package_version) for package_version in reference.compile(lockfile=self.path)),
+                         ["(b:2.0.0)", "(x:2.0.0)"])
+
+
+LOCKED_REGISTRY = {
+    "a": {"1.0.0": {"c": "1.x"}, "1.1.0": {"c": "*"}},
+    "b": {"1.0.0": {"d": "*"}, "2.0.0": {"e": "*"}, "3.0.0": {"c": "2.x"}},
+    "c": {"1.0.0": {"f": "*"}, "2.0.0": {}},
+    "d": {"1.0.0": {}},
+    "e": {"1.0.0": {}},
+    "f": {"1.0.0": {}},
+}
+
+CHANGED_REGISTRY = {
+    "a": {"1.0.0": {"x": "*"}},
+    "b": {"1.0.0": {"x": "1.x"}, "2.0.0": {"x": "*"}},
+    "x": {"1.0.0": {}, "2.0.0": {}},
+}
+
+LOCKED_REFERENCE = """
+{
+  "a": {"1.0.0": {"c": "1.x"}},
+  "b": {"1.0.0": {"d": "*"}, "2.0.0": {"e": "*"}},
+  "c": {"1.0.0": {}},
+  "d": {"1.0.0": {}},
+  "e": {"1.0.0": {}}
+}
+"""
+
+LOCKED_REFERENCE_UPDATED = """
+{
+  "a": {"1.0.0": {"c": "1.x"}, "1.1.0": {"c": "1.x"}},
+  "b": {"1.0.0": {"d": "*"}, "2.0.0": {"e": "*"}},
+  "c": {"1.0.0": {}, "1.1.0": {}},
+  "d": {"1.0.0": {}},
+  "e": {"1.0.0": {}, "2.0.0": {}}
+}
+"""
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,384 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent import futures
+from typing import Callable, Iterable, Optional
+
+import requests
+
+from .base import PackageName, VersionName, format_name
+from .packument import PackumentParser, VersionRanges
+from .registry import RegistryClient
+from .tracing import NETWORK, PARSE, TimedReader, Tracer
+
+# bump whenever the tables change, a store with another version is rebuilt from scratch
+SCHEMA_VERSION = 2
+
+DEFAULT_STORE_PATH = "./resources/metadata.sqlite3"
+
+# seconds a stored package is used without asking the registry whether it changed
+MAX_AGE = 300.0
+
+# packuments kept by a `MetadataCache`
+CACHE_SIZE = 4096
+
+FROM_STORE = "store"
+NOT_MODIFIED = "not_modified"
+FROM_REGISTRY = "registry"
+FROM_RESOURCES = "resources"
+STALE = "stale"
+
+
+class StoredPackage(object):
+    def __init__(self,
+                 name: PackageName,
+                 versions: VersionRanges,
+                 etag: Optional[str] = None,
+                 last_modified: Optional[str] = None,
+                 fetched_at: float = 0.0,
+                 source: str = FROM_STORE,
+                 size: int = 0,
+                 integrities: Optional[dict[VersionName, str]] = None):
+        """
+        :param source: where the package came from on this load, one of FROM_STORE, NOT_MODIFIED, FROM_REGISTRY,
+        FROM_RESOURCES and STALE (the registry couldn't be reached, the stored copy is used anyway)
+        :param size: bytes of the raw document parsed to get the package, 0 if it came from the store
+        :param integrities: integrity of the tarball of the versions, see `integrity.Integrity`
+        """
+        self.name = name
+        self.versions = versions
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.source = source
+        self.size = size
+        self.integrities = integrities or {}
+
+    def fresh(self, max_age: Optional[float]) -> bool:
+        return max_age is None or time.time() - self.fetched_at < max_age
+
+    def validators(self) -> dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def packument(self) -> dict:
+        """
+        the subset of the registry document the resolver reads
+        """
+        return {
+            "name": self.name,
+            "versions": {version_name: self._version_metadata(version_name, dependencies)
+                         for version_name, dependencies in self.versions.items()}
+        }
+
+    def _version_metadata(self, version_name: VersionName, dependencies: dict[PackageName, str]) -> dict:
+        if version_name not in self.integrities:
+            return {"dependencies": dependencies}
+        return {"dependencies": dependencies, "dist": {"integrity": self.integrities[version_name]}}
+
+
+class MetadataStore(object):
+    """
+    pre-parsed packuments: name -> version -> dependency ranges, one row per version so that a package is loaded
+    without decoding any other
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.lock = threading.Lock()
+        self._migrate()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, name: PackageName) -> Optional[StoredPackage]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id, etag, last_modified, fetched_at FROM packages WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            package_id, etag, last_modified, fetched_at = row
+            rows = self.connection.execute(
+                "SELECT version, dependencies, integrity FROM versions WHERE package_id = ? ORDER BY position",
+                (package_id,)).fetchall()
+        versions = {version_name: json.loads(dependencies) if dependencies else {}
+                    for version_name, dependencies, _ in rows}
+        integrities = {version_name: integrity for version_name, _, integrity in rows if integrity is not None}
+        return StoredPackage(name, versions, etag, last_modified, fetched_at, integrities=integrities)
+
+    def put(self, package: StoredPackage):
+        rows = [(position,
+                 version_name,
+                 json.dumps(dependencies, separators=(",", ":")) if dependencies else None,
+                 package.integrities.get(version_name))
+                for position, (version_name, dependencies) in enumerate(package.versions.items())]
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM packages WHERE name = ?", (package.name,))
+            package_id = self.connection.execute(
+                "INSERT INTO packages (name, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)",
+                (package.name, package.etag, package.last_modified, package.fetched_at)).lastrowid
+            self.connection.executemany(
+                "INSERT INTO versions (package_id, position, version, dependencies, integrity) VALUES (?, ?, ?, ?, ?)",
+                [(package_id,) + row for row in rows])
+
+    def touch(self, name: PackageName, fetched_at: float):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE packages SET fetched_at = ? WHERE name = ?", (fetched_at, name))
+
+    def _migrate(self):
+        with self.lock, self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version == SCHEMA_VERSION:
+                return
+            self.connection.execute("DROP TABLE IF EXISTS versions")
+            self.connection.execute("DROP TABLE IF EXISTS packages")
+            self.connection.execute("""
+                CREATE TABLE packages (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE versions (
+                    package_id INTEGER NOT NULL REFERENCES packages (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    version TEXT NOT NULL,
+                    dependencies TEXT,
+                    integrity TEXT,
+                    PRIMARY KEY (package_id, position)
+                )""")
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def load_packages(names: Iterable[PackageName],
+                  store: MetadataStore,
+                  client: RegistryClient,
+                  max_age: Optional[float] = MAX_AGE,
+                  resources: Optional[str] = "./resources",
+                  tracer: Optional[Tracer] = None) -> dict[PackageName, StoredPackage]:
+    """
+    load packages from the store, revalidating the stale ones with the registry in parallel. Packages missing from
+    the store are imported from the raw documents in `resources` if there are some, else downloaded.
+
+    :param max_age: seconds a stored package is used without revalidation, None to never revalidate
+    :param tracer: gets a span for every request and every document parsed
+    """
+    tracer = tracer or Tracer()
+    packages: dict[PackageName, StoredPackage] = {}
+    outdated: dict[PackageName, Optional[StoredPackage]] = {}
+    for name in set(names):
+        package = store.get(name) or _import_resource(name, store, resources, tracer)
+        if package is not None and package.fresh(max_age):
+            packages[name] = package
+        else:
+            outdated[name] = package
+
+    future_to_name = {client.executor.submit(_revalidate, name, package, store, client, tracer): name
+                      for name, package in outdated.items()}
+    for future in futures.as_completed(future_to_name):
+        packages[future_to_name[future]] = future.result()
+    return packages
+
+
+def _import_resource(name: PackageName,
+                     store: MetadataStore,
+                     resources: Optional[str],
+                     tracer: Tracer) -> Optional[StoredPackage]:
+    if resources is None:
+        return None
+    path = os.path.join(resources, format_name(name))
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as reader, tracer.span("parse", PARSE, package=name, source=FROM_RESOURCES) as args:
+        parser = PackumentParser(reader)
+        versions = parser.parse()
+        args["bytes"] = parser.size
+    # the document was downloaded by an earlier run without validators, it is revalidated once it gets stale
+    package = StoredPackage(name, versions, fetched_at=time.time(), source=FROM_RESOURCES, size=parser.size,
+                            integrities=parser.integrities)
+    store.put(package)
+    return package
+
+
+def _revalidate(name: PackageName,
+                package: Optional[StoredPackage],
+                store: MetadataStore,
+                client: RegistryClient,
+                tracer: Tracer) -> StoredPackage:
+    url = client.packument_url(name)
+    try:
+        with tracer.span("fetch", NETWORK, package=name) as args:
+            response = client.get_packument(name,
+                                            headers=package.validators() if package is not None else None,
+                                            stream=True)
+            args["status"] = response.status_code
+    except requests.RequestException:
+        if package is None:
+            raise
+        package.source = STALE
+        return package
+
+    with response:
+        now = time.time()
+        if response.status_code == 304 and package is not None:
+            store.touch(name, now)
+            package.fetched_at = now
+            package.source = NOT_MODIFIED
+            return package
+        if response.status_code != 200:
+            if package is not None and response.status_code >= 500:
+                package.source = STALE
+                return package
+            raise ValueError(f"error fetching package info {url}")
+
+        response.raw.decode_content = True
+        start = time.perf_counter()
+        # the document is parsed as it arrives, the time spent waiting for it is told apart
+        reader = TimedReader(response.raw)
+        parser = PackumentParser(reader)
+        versions = parser.parse()
+        duration = time.perf_counter() - start
+        tracer.add("download", NETWORK, start, duration, reader.seconds, package=name)
+        tracer.add("parse", PARSE, start, duration, duration - reader.seconds,
+                   package=name, source=FROM_REGISTRY, bytes=parser.size)
+    package = StoredPackage(name,
+                            versions,
+                            response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"),
+                            now,
+                            FROM_REGISTRY,
+                            parser.size,
+                            parser.integrities)
+    store.put(package)
+    return package
+
+
+class MetadataCache(object):
+    """
+    packuments shared by the references of a process, safe to use from any thread. The least recently used are
+    evicted past `max_packages`, and concurrent requests for a package wait for a single load of it.
+    """
+
+    def __init__(self, max_packages: int = CACHE_SIZE):
+        self.max_packages = max_packages
+        self.lock = threading.Lock()
+        # name -> packument and `time.time()` when it was loaded, the least recently used first
+        self.packages: OrderedDict[PackageName, tuple[dict, float]] = OrderedDict()
+        # packages being loaded -> their packument once it is
+        self.loading: dict[PackageName, futures.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        # requests which waited for the load of another thread
+        self.waits = 0
+        self.evictions = 0
+
+    def __contains__(self, name: PackageName) -> bool:
+        with self.lock:
+            return name in self.packages
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.packages)
+
+    def get(self,
+            names: Iterable[PackageName],
+            load: Callable[[set[PackageName]], dict[PackageName, StoredPackage]],
+            max_age: Optional[float] = None) -> tuple[dict[PackageName, dict], dict[PackageName, StoredPackage]]:
+        """
+        :param load: loads the packages missing from the cache, it is called by one of the threads asking for them
+               and its errors are raised in all of them
+        :param max_age: seconds a cached packument is used, None to use it until it is evicted
+        :return: the packuments, and the packages loaded by this call
+        """
+        now = time.time()
+        packuments: dict[PackageName, dict] = {}
+        waiting: dict[PackageName, futures.Future] = {}
+        mine: dict[PackageName, futures.Future] = {}
+        with self.lock:
+            for name in set(names):
+                cached = self.packages.get(name)
+                if cached is not None and (max_age is None or now - cached[1] < max_age):
+                    self.packages.move_to_end(name)
+                    packuments[name] = cached[0]
+                    self.hits += 1
+                elif name in self.loading:
+                    waiting[name] = self.loading[name]
+                    self.waits += 1
+                else:
+                    mine[name] = self.loading[name] = futures.Future()
+                    self.misses += 1
+
+        loaded: dict[PackageName, StoredPackage] = {}
+        if mine:
+            try:
+                loaded = load(set(mine))
+                for name in mine:
+                    packuments[name] = loaded[name].packument()
+            except BaseException as error:
+                with self.lock:
+                    for name in mine:
+                        del self.loading[name]
+                for future in mine.values():
+                    future.set_exception(error)
+                raise
+            loaded_at = time.time()
+            with self.lock:
+                for name in mine:
+                    del self.loading[name]
+                    self.packages[name] = (packuments[name], loaded_at)
+                    self.packages.move_to_end(name)
+                while len(self.packages) > self.max_packages:
+                    self.packages.popitem(last=False)
+                    self.evictions += 1
+            for name, future in mine.items():
+                future.set_result(packuments[name])
+
+        for name, future in waiting.items():
+            packuments[name] = future.result()
+        return packuments, loaded
+
+
+_default_store: Optional[MetadataStore] = None
+_default_store_lock = threading.Lock()
+
+
+def default_store() -> MetadataStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MetadataStore()
+        return _default_store
+
+
+_default_cache: Optional[MetadataCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> MetadataCache:
+    """
+    the cache shared by the references loading from the default client and store
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache()
+        return _default_cache
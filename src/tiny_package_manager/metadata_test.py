@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from .metadata import *
+from .reference import YarnReference
+from .registry import RegistryClient
+from .registry_test import LocalRegistry
+
+
+class MetadataStoreTestCase(unittest.TestCase):
+    def test_put_get(self):
+        with MetadataStore(":memory:") as store:
+            self.assertIsNone(store.get("a"))
+            versions = {"1.0.1": {"b": "^1.0.0"}, "1.0.0": {}, "0.9.0": {"b": "*", "c": "~2.1"}}
+            store.put(StoredPackage("a", versions, etag='"x"', fetched_at=1.0))
+            store.put(StoredPackage("b", {"1.0.0": {}}))
+            package = store.get("a")
+            self.assertEqual(package.versions, versions)
+            self.assertEqual(list(package.versions), ["1.0.1", "1.0.0", "0.9.0"])
+            self.assertEqual(package.validators(), {"If-None-Match": '"x"'})
+
+            store.put(StoredPackage("a", {"2.0.0": {}}))
+            self.assertEqual(store.get("a").versions, {"2.0.0": {}})
+            self.assertEqual(store.get("b").versions, {"1.0.0": {}})
+
+    def test_schema_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metadata.sqlite3")
+            with MetadataStore(path) as store:
+                store.put(StoredPackage("a", {"1.0.0": {}}))
+            with MetadataStore(path) as store:
+                self.assertIsNotNone(store.get("a"))
+
+            connection = sqlite3.connect(path)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+            connection.close()
+            with MetadataStore(path) as store:
+                self.assertIsNone(store.get("a"))
+
+    def test_revalidation(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client, MetadataStore(":memory:") as store:
+            packages = load_packages(["express"], store, client, max_age=0, resources=None)
+            self.assertEqual(packages["express"].source, FROM_REGISTRY)
+            self.assertIn("3.0.0", packages["express"].versions)
+
+            packages = load_packages(["express"], store, client, max_age=None, resources=None)
+            self.assertEqual(packages["express"].source, FROM_STORE)
+            self.assertEqual(registry.hits, {"/express": 1})
+
+            packages = load_packages(["express"], store, client, max_age=0, resources=None)
+            self.assertEqual(packages["express"].source, NOT_MODIFIED)
+            self.assertEqual(registry.hits, {"/express": 2})
+            self.assertEqual(registry.not_modified, 1)
+
+    def test_resources(self):
+        with (RegistryClient("http://127.0.0.1:9", retries=1, backoff=0.01) as client,
+              MetadataStore(":memory:") as store):
+            packages = load_packages(["express"], store, client)
+            self.assertEqual(packages["express"].source, FROM_RESOURCES)
+            self.assertEqual(store.get("express").versions, packages["express"].versions)
+
+            # the registry can't be reached, the stored copy is used
+            packages = load_packages(["express"], store, client, max_age=0)
+            self.assertEqual(packages["express"].source, STALE)
+
+    def test_reference(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client, MetadataStore(":memory:") as store:
+            YarnReference(client=client, store=store, max_age=0).get_metadata("express")
+            reference = YarnReference(client=client, store=store, max_age=0)
+            metadata = reference.get_metadata("express")
+            self.assertEqual(metadata["versions"]["3.0.0"]["dependencies"]["connect"], "2.6.0")
+            self.assertEqual(reference.metadata_stats.stored, 1)
+            self.assertEqual(reference.metadata_stats.bytes, 0)
+
+
+class MetadataCacheTestCase(unittest.TestCase):
+    @staticmethod
+    def load(names):
+        return {name: StoredPackage(name, {"1.0.0": {}}) for name in names}
+
+    def test_eviction(self):
+        cache = MetadataCache(max_packages=2)
+        packuments, loaded = cache.get(["a", "b"], self.load)
+        self.assertEqual(set(loaded), {"a", "b"})
+        self.assertEqual(packuments["a"], {"name": "a", "versions": {"1.0.0": {"dependencies": {}}}})
+        # `a` is used again, `b` is the least recently used
+        self.assertEqual(cache.get(["a"], self.load)[1], {})
+        cache.get(["c"], self.load)
+        self.assertEqual((len(cache), "a" in cache, "b" in cache), (2, True, False))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 3, 1))
+        # too old
+        self.assertEqual(set(cache.get(["a"], self.load, max_age=0)[1]), {"a"})
+
+    def test_single_flight(self):
+        calls = []
+
+        def load(names):
+            calls.append(names)
+            time.sleep(0.05)
+            return self.load(names)
+
+        cache = MetadataCache()
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(cache.get(["a"], load)[0]["a"])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [{"a"}])
+        self.assertEqual(len(found), 8)
+        self.assertTrue(all(packument is found[0] for packument in found))
+        self.assertEqual(cache.waits, 7)
+
+    def test_error(self):
+        def load(names):
+            raise ValueError("no package info")
+
+        cache = MetadataCache()
+        with self.assertRaises(ValueError):
+            cache.get(["a"], load)
+        # nothing is left in flight, the next request loads it again
+        self.assertEqual(set(cache.get(["a"], self.load)[1]), {"a"})
+
+    def test_references(self):
+        cache = MetadataCache()
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client, MetadataStore(":memory:") as store:
+            references = [YarnReference(client=client, store=store, max_age=None, cache=cache) for _ in range(4)]
+            threads = [threading.Thread(target=reference.get_metadata, args=("express",)) for reference in references]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # a single one loaded it
+        self.assertEqual(sum(reference.metadata_stats.packuments for reference in references), 1)
+        self.assertEqual(sum(reference.metadata_stats.shared for reference in references), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
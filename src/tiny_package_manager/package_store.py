@@ -0,0 +1,130 @@
+import errno
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # windows, reflinks fall back to copies
+    fcntl = None
+
+from .integrity import Integrity
+
+DEFAULT_PACKAGE_STORE = os.path.expanduser("~/.tiny-package-manager/store")
+
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+COPY = "copy"
+# cheapest first
+LINK_METHODS = (HARDLINK, REFLINK, COPY)
+
+# ioctl cloning a whole file on linux, from linux/fs.h
+FICLONE = 0x40049409
+
+# written last in a package directory, a directory without it is an interrupted extraction
+COMPLETE = ".complete"
+
+
+class PackageStore(object):
+    """
+    extracted packages shared by every project, keyed by the integrity of their tarball. A project links the files of
+    a package from here instead of extracting the tarball again.
+
+    Hardlinked files are the same inode as the store's: a project must not modify the files of its dependencies.
+    """
+
+    def __init__(self, root: str = DEFAULT_PACKAGE_STORE):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, integrity: Integrity) -> str:
+        digest = integrity.digests[integrity.algorithm].hex()
+        return os.path.join(self.root, integrity.algorithm, digest[:2], digest[2:])
+
+    def has(self, integrity: Integrity) -> bool:
+        return os.path.exists(os.path.join(self.path(integrity), COMPLETE))
+
+    def staging_directory(self) -> str:
+        """
+        a directory to extract a package into, on the same file system as the store so that `commit` is a rename
+        """
+        return tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+
+    def commit(self, staging_directory: str, integrity: Integrity) -> str:
+        """
+        move an extracted package into the store, unless another process has stored the same package meanwhile
+
+        :return: path of the package in the store
+        """
+        with open(os.path.join(staging_directory, COMPLETE), "w"):
+            pass
+        path = self.path(integrity)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path) and not self.has(integrity):
+            shutil.rmtree(path)
+        try:
+            os.rename(staging_directory, path)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            shutil.rmtree(staging_directory)
+        return path
+
+
+def link_tree(source: str, destination: str, methods: tuple[str, ...] = LINK_METHODS) -> dict[str, int]:
+    """
+    materialize the package `source` of the store at `destination`, replacing what was there. Every file is linked
+    with the first of `methods` which works, a method failing once isn't tried again for the next files.
+
+    :return: files linked by each method
+    """
+    if os.path.lexists(destination):
+        shutil.rmtree(destination)
+    counts = {method: 0 for method in methods}
+    available = list(methods)
+    for directory, directories, files in os.walk(source):
+        target_directory = os.path.join(destination, os.path.relpath(directory, source))
+        os.makedirs(target_directory, exist_ok=True)
+        for file_name in files:
+            if directory == source and file_name == COMPLETE:
+                continue
+            source_file = os.path.join(directory, file_name)
+            target_file = os.path.join(target_directory, file_name)
+            while True:
+                method = available[0]
+                if _link(method, source_file, target_file, len(available) == 1):
+                    counts[method] += 1
+                    break
+                available.pop(0)
+    return counts
+
+
+def _link(method: str, source: str, target: str, last: bool) -> bool:
+    """
+    :param last: no other method to fall back to, errors are raised
+    :return: False if the method isn't supported here
+    """
+    try:
+        if method == HARDLINK:
+            os.link(source, target)
+        elif method == REFLINK:
+            _reflink(source, target)
+        else:
+            shutil.copy2(source, target)
+        return True
+    except OSError:
+        if last:
+            raise
+        # a partially cloned file must not stay in the way of the next method
+        if method == REFLINK and os.path.exists(target):
+            os.remove(target)
+        return False
+
+
+def _reflink(source: str, target: str):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks aren't supported")
+    with open(source, "rb") as reader, open(target, "wb") as writer:
+        fcntl.ioctl(writer.fileno(), FICLONE, reader.fileno())
+    shutil.copymode(source, target)
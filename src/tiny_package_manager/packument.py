@@ -0,0 +1,245 @@
+import codecs
+import json
+import re
+from typing import BinaryIO, Iterator, Optional
+
+from .base import PackageName, VersionName
+from .integrity import dist_integrity
+
+# dependency ranges of every version of a package, in registry order
+VersionRanges = dict[VersionName, dict[PackageName, str]]
+
+CHUNK_SIZE = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_STRING_SPECIAL = re.compile(r'["\\]')
+_CONTAINER_SPECIAL = re.compile(r'["{}\[\]]')
+_LITERAL_END = re.compile(r"[\s,}\]]")
+
+
+def _dependencies(value) -> dict[PackageName, str]:
+    # a few ancient versions have a list or null instead of an object
+    return value if isinstance(value, dict) else {}
+
+
+def parse_packument(package_data: bytes) -> VersionRanges:
+    """
+    parse a packument which is already in memory
+    """
+    packument = json.loads(package_data)
+    return {version_name: _dependencies(version_metadata.get("dependencies"))
+            for version_name, version_metadata in packument.get("versions", {}).items()}
+
+
+class PackumentParser(object):
+    """
+    pull parser extracting `versions[*].dependencies`, and the integrity of the tarballs, from a packument,
+    abbreviated or not, read chunk by chunk. Everything else (readmes, maintainers...) is scanned over without being
+    decoded, so the memory used is bounded by the chunk size and the largest version, not by the document.
+    """
+
+    def __init__(self, reader: BinaryIO, chunk_size: int = CHUNK_SIZE):
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        # start of the value being read, the buffer is kept from there while reading the next chunks
+        self.mark: Optional[int] = None
+        self.eof = False
+        # bytes read from the reader
+        self.size = 0
+        # integrity of the tarball of every version which has one, filled by `parse`
+        self.integrities: dict[VersionName, str] = {}
+
+    def parse(self) -> VersionRanges:
+        versions: VersionRanges = {}
+        for key in self._object_keys():
+            if key == "versions":
+                for version_name in self._object_keys():
+                    self._peek()
+                    # a version is decoded at once if it is buffered, it's small compared to the document
+                    decoded, version_metadata = self._decode_buffered()
+                    if decoded and isinstance(version_metadata, dict):
+                        versions[version_name] = _dependencies(version_metadata.get("dependencies"))
+                        self._integrity(version_name, version_metadata.get("dist"))
+                    elif decoded:
+                        raise ValueError(f"invalid packument: version {version_name} is not an object")
+                    else:
+                        versions[version_name] = self._version_dependencies(version_name)
+            else:
+                self._skip_value()
+        return versions
+
+    def _version_dependencies(self, version_name: VersionName) -> dict[PackageName, str]:
+        dependencies = {}
+        for key in self._object_keys():
+            if key == "dependencies":
+                dependencies = _dependencies(self._read_value())
+            elif key == "dist":
+                self._integrity(version_name, self._read_value())
+            else:
+                self._skip_value()
+        return dependencies
+
+    def _integrity(self, version_name: VersionName, dist):
+        integrity = dist_integrity(dist)
+        if integrity is not None:
+            self.integrities[version_name] = integrity
+
+    def _object_keys(self) -> Iterator[str]:
+        """
+        iterate over the keys of an object, the caller consumes the value of each key before asking for the next
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self._read_string()
+            self._expect(":")
+            yield key
+            separator = self._peek()
+            self.position += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"invalid packument: expected ',' or '}}', got {separator!r}")
+
+    def _fill(self) -> bool:
+        """
+        drop the scanned part of the buffer, but what follows the mark, and read the next chunk
+        :return: False at the end of the document
+        """
+        if self.eof:
+            return False
+        chunk = self.reader.read(self.chunk_size)
+        self.size += len(chunk)
+        if not chunk:
+            self.eof = True
+            text = self.decoder.decode(b"", final=True)
+        else:
+            text = self.decoder.decode(chunk)
+        keep_from = self.position if self.mark is None else self.mark
+        self.buffer = self.buffer[keep_from:] + text
+        self.position -= keep_from
+        if self.mark is not None:
+            self.mark = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError("invalid packument: unexpected end of document")
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"invalid packument: expected {char!r}, got {found!r}")
+        self.position += 1
+
+    def _read_string(self) -> str:
+        if self._peek() != '"':
+            raise ValueError("invalid packument: expected a string")
+        while True:
+            match = _STRING.match(self.buffer, self.position)
+            if match is not None:
+                self.position = match.end()
+                return json.loads(match.group())
+            if not self._fill():
+                raise ValueError("invalid packument: unterminated string")
+
+    def _decode_buffered(self) -> tuple[bool, object]:
+        """
+        decode the string or container at the current position if it's entirely in the buffer: the C decoder is
+        much faster than scanning, and a single value is small. Literals are never decoded this way, they might be
+        cut by the end of the buffer.
+        """
+        if self.buffer[self.position] not in '"{[':
+            return False, None
+        try:
+            value, self.position = _DECODER.raw_decode(self.buffer, self.position)
+            return True, value
+        except json.JSONDecodeError:
+            return False, None
+
+    def _read_value(self):
+        self._peek()
+        decoded, value = self._decode_buffered()
+        if decoded:
+            return value
+        self.mark = self.position
+        try:
+            self._skip_value()
+            return json.loads(self.buffer[self.mark:self.position])
+        finally:
+            self.mark = None
+
+    def _skip_value(self):
+        first = self._peek()
+        if self._decode_buffered()[0]:
+            return
+        if first == '"':
+            self._skip_string()
+        elif first in "{[":
+            self._skip_container()
+        else:
+            self._skip_literal()
+
+    def _search(self, pattern: re.Pattern) -> re.Match:
+        while True:
+            match = pattern.search(self.buffer, self.position)
+            if match is not None:
+                self.position = match.start()
+                return match
+            self.position = len(self.buffer)
+            if not self._fill():
+                raise ValueError("invalid packument: unexpected end of document")
+
+    def _skip_string(self):
+        # the opening quote
+        self.position += 1
+        while True:
+            char = self._search(_STRING_SPECIAL).group()
+            self.position += 1
+            if char == '"':
+                return
+            # an escape, the escaped character may be in the next chunk
+            if self.position >= len(self.buffer) and not self._fill():
+                raise ValueError("invalid packument: unterminated string")
+            self.position += 1
+
+    def _skip_container(self):
+        depth = 0
+        while True:
+            char = self._search(_CONTAINER_SPECIAL).group()
+            if char == '"':
+                self._skip_string()
+                continue
+            self.position += 1
+            depth += 1 if char in "{[" else -1
+            if depth == 0:
+                return
+
+    def _skip_literal(self):
+        while True:
+            match = _LITERAL_END.search(self.buffer, self.position)
+            if match is not None:
+                self.position = match.start()
+                return
+            self.position = len(self.buffer)
+            if not self._fill():
+                return
+
+
+def stream_packument(reader: BinaryIO, chunk_size: int = CHUNK_SIZE) -> tuple[VersionRanges, int]:
+    """
+    :return: dependency ranges of every version, and the bytes read
+    """
+    parser = PackumentParser(reader, chunk_size)
+    return parser.parse(), parser.size
@@ -0,0 +1,46 @@
+import json
+import unittest
+from io import BytesIO
+
+from .packument import *
+
+
+class PackumentParserTestCase(unittest.TestCase):
+    def test_fixtures(self):
+        for name in ("express", "at_jest_core", "mongoose"):
+            with open(f"./resources/{name}", "rb") as reader:
+                package_data = reader.read()
+            expected = parse_packument(package_data)
+            for chunk_size in (97, CHUNK_SIZE):
+                versions, size = stream_packument(BytesIO(package_data), chunk_size)
+                self.assertEqual(list(versions.items()), list(expected.items()))
+                self.assertEqual(size, len(package_data))
+
+    def test_skipped_values(self):
+        packument = {
+            "readme": "a \"quoted\" \\ readme {with [brackets]} and ünïcödé ☃",
+            "time": {"modified": "2024-01-01"},
+            "count": -1.5e3,
+            "flags": [True, False, None, {"versions": {}}],
+            "versions": {
+                "1.0.0": {"dist": {"shasum": "x"}, "dependencies": {"b": "^1.0.0", "ç": ">= 2 < 3"}, "bin": None},
+                "0.1.0": {"dependencies": None},
+                "0.0.1": {"dependencies": ["b"]},
+                "0.0.0": {}
+            },
+            "name": "a"
+        }
+        package_data = json.dumps(packument, ensure_ascii=False, indent=1).encode()
+        for chunk_size in (1, 2, 3, 1024):
+            versions, _ = stream_packument(BytesIO(package_data), chunk_size)
+            self.assertEqual(versions, {"1.0.0": {"b": "^1.0.0", "ç": ">= 2 < 3"},
+                                        "0.1.0": {}, "0.0.1": {}, "0.0.0": {}})
+
+    def test_invalid(self):
+        for package_data in (b"", b"[]", b'{"versions": {"1.0.0": {"dependencies": {"b": "1"}}', b'{"a" 1}'):
+            with self.assertRaises(ValueError):
+                stream_packument(BytesIO(package_data), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
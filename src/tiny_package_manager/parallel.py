@@ -0,0 +1,84 @@
+import multiprocessing
+from concurrent import futures
+from typing import Optional
+
+from .base import START_METHOD, PackageVersion
+
+# subproblems per worker, the workers stay busy when some subproblems fail right away
+SPLIT_FACTOR = 4
+
+# levels of the search tree split at most
+MAX_SPLIT_DEPTH = 3
+
+# the reference of a worker process, unpickled once from the snapshot of the parent
+_reference = None
+# shared with the parent: index of the first subproblem known to have a solution
+_first_solution = None
+
+
+def _start_worker(reference, first_solution):
+    global _reference, _first_solution
+    _reference = reference
+    _first_solution = first_solution
+
+
+def _solve(index: int, prefix: list[PackageVersion]) -> tuple[Optional[list[PackageVersion]], object]:
+    """
+    search the subtree of a subproblem, until a subproblem before it has a solution
+    :return: the solution, None if there is none or the search was cancelled, and the stats of the search
+    """
+    reference = _reference
+    reference._cancelled = lambda: _first_solution.value < index
+    reference._replay(prefix)
+    return reference._search(), reference.stats
+
+
+class ParallelSearch(object):
+    """
+    speculative parallel backtracking: the top levels of the search tree are split into subproblems, one for every
+    selection of their packages, searched by a pool of processes over a snapshot of the packuments loaded by the
+    reference. The solution of the first subproblem in the order of the search is returned, so it is the one a single
+    process finds, and the workers searching the subproblems after it are cancelled. Starting the pool takes a few
+    tenths of a second and the subproblems after the solution are searched speculatively, only long searches gain
+    from it.
+    """
+
+    def __init__(self, reference, workers: int):
+        """
+        :param reference: a `reference.YarnReference` prepared by `compile`, it is pickled to the workers
+        """
+        self.reference = reference
+        self.workers = workers
+
+    def solve(self) -> Optional[list[PackageVersion]]:
+        reference = self.reference
+        prefixes = reference._split(self.workers * SPLIT_FACTOR, MAX_SPLIT_DEPTH)
+        if len(prefixes) <= 1:
+            reference._start_search()
+            return reference._search()
+
+        context = multiprocessing.get_context(START_METHOD)
+        first_solution = context.Value("i", len(prefixes), lock=False)
+        solutions: dict[int, list[PackageVersion]] = {}
+        with futures.ProcessPoolExecutor(max_workers=min(self.workers, len(prefixes)),
+                                         mp_context=context,
+                                         initializer=_start_worker,
+                                         initargs=(reference, first_solution)) as pool:
+            searches = [pool.submit(_solve, index, prefix) for index, prefix in enumerate(prefixes)]
+            pending = set(searches)
+            # done once every subproblem before the first solution failed
+            while pending and not all(search.done() for search in searches[:first_solution.value]):
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for search in done:
+                    if search.cancelled():
+                        continue
+                    solution, stats = search.result()
+                    reference.stats.add(stats)
+                    index = searches.index(search)
+                    if solution is not None:
+                        solutions[index] = solution
+                        if index < first_solution.value:
+                            first_solution.value = index
+                            for later in searches[index + 1:]:
+                                later.cancel()
+        return solutions.get(first_solution.value)
@@ -0,0 +1,70 @@
+import pickle
+import unittest
+
+from semantic_version import Version
+
+from .parallel import *
+from .reference import NEWEST_FIRST, PUBGRUB
+from .synthetic import SyntheticReference, synthetic_registry
+
+
+def versions(solution: list[PackageVersion]) -> list[str]:
+    # `PackageVersion.__eq__` only compares the names
+    return sorted(str(package_version) for package_version in solution)
+
+
+def synthetic_reference(seed: int) -> SyntheticReference:
+    reference = SyntheticReference(synthetic_registry(40, 6, 3, 0.3, seed))
+    reference.direct_dependencies = {"p0": "*", "p1": "*", "p2": "*"}
+    return reference
+
+
+class ParallelTestCase(unittest.TestCase):
+    def test_pickle(self):
+        reference = synthetic_reference(1)
+        solution = reference.compile()
+        copy = pickle.loads(pickle.dumps(reference))
+        # the packuments are kept, not the search
+        self.assertEqual(copy.package_version_cache, reference.package_version_cache)
+        self.assertEqual(copy.version_cache, {})
+        self.assertEqual(copy.registry, reference.registry)
+        self.assertEqual(versions(copy.compile()), versions(solution))
+
+    def test_split(self):
+        reference = synthetic_reference(1)
+        reference.compile(version_order=NEWEST_FIRST)
+        prefixes = reference._split(1, MAX_SPLIT_DEPTH)
+        self.assertEqual([str(package_version) for prefix in prefixes for package_version in prefix],
+                         ["(p0:1.5.0)", "(p0:1.4.0)", "(p0:1.3.0)", "(p0:1.2.0)", "(p0:1.1.0)", "(p0:1.0.0)"])
+        prefixes = reference._split(20, 2)
+        self.assertEqual(len({prefix[0].name for prefix in prefixes}), 1)
+        self.assertEqual({len(prefix) for prefix in prefixes}, {2})
+        # in the order of the search
+        self.assertEqual([prefix[0].version for prefix in prefixes],
+                         sorted((prefix[0].version for prefix in prefixes), reverse=True))
+
+        reference._replay(prefixes[-1])
+        self.assertEqual([str(package_version) for package_version in reference._selected],
+                         [str(package_version) for package_version in prefixes[-1]])
+        with self.assertRaises(ValueError):
+            reference._replay([PackageVersion("p2", Version("1.0.0"))])
+
+    def test_same_solution(self):
+        for seed in range(3):
+            solutions = []
+            for workers in (1, 2):
+                reference = synthetic_reference(seed)
+                solutions.append(versions(reference.compile(version_order=NEWEST_FIRST, workers=workers)))
+                self.assertGreater(reference.stats.nodes, 0)
+            self.assertEqual(solutions[0], solutions[1], f"seed {seed}")
+
+    def test_unsupported(self):
+        reference = synthetic_reference(1)
+        with self.assertRaises(ValueError):
+            reference.compile(engine=PUBGRUB, workers=2)
+        with self.assertRaises(ValueError):
+            reference.compile(max_nodes=10, workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Iterable
+
+from .base import PackageName
+from .metadata import StoredPackage
+
+# threads fetching packuments ahead of the solver
+PREFETCH_CONCURRENCY = 4
+
+# candidate versions of a package added to the frontier whose dependencies are prefetched, the first ones in the
+# order the search tries them
+PREFETCH_CANDIDATES = 2
+
+
+class Prefetcher(object):
+    """
+    fetch packuments in background threads before the solver needs them, so the network overlaps with the solving.
+    Requests are served by priority, the lowest first and in the order they came for the same priority. The solver
+    takes the packuments it needs, waiting for the ones in flight and loading the others itself.
+    """
+
+    def __init__(self,
+                 fetch: Callable[[set[PackageName]], dict[PackageName, StoredPackage]],
+                 max_concurrency: int = PREFETCH_CONCURRENCY):
+        """
+        :param fetch: loads packuments without touching the state of the solver, it is called from the threads
+        """
+        self.fetch = fetch
+        self.max_concurrency = max_concurrency
+        self.condition = threading.Condition()
+        # (priority, order, name), a name is pushed again when its priority is raised
+        self.queue: list[tuple[int, int, PackageName]] = []
+        self.order = itertools.count()
+        # queued packages -> their priority
+        self.queued: dict[PackageName, int] = {}
+        self.in_flight: set[PackageName] = set()
+        # fetched packages -> the package and the seconds its fetch took
+        self.fetched: dict[PackageName, tuple[StoredPackage, float]] = {}
+        # every package ever requested, a package is fetched once
+        self.requested: set[PackageName] = set()
+        self.threads: list[threading.Thread] = []
+        self.closed = False
+        # packuments taken by the solver, and the seconds of fetching it didn't have to wait for
+        self.prefetched = 0
+        self.hidden_seconds = 0.0
+        self.waited_seconds = 0.0
+
+    def request(self, names: Iterable[PackageName], priority: int):
+        with self.condition:
+            for name in names:
+                if name in self.requested and self.queued.get(name, priority) <= priority:
+                    continue
+                self.requested.add(name)
+                self.queued[name] = priority
+                heapq.heappush(self.queue, (priority, next(self.order), name))
+            while len(self.threads) < min(self.max_concurrency, len(self.queued) + len(self.in_flight)):
+                thread = threading.Thread(target=self._work, name="prefetch", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify_all()
+
+    def take(self, names: set[PackageName]) -> dict[PackageName, StoredPackage]:
+        """
+        :return: the prefetched packuments among `names`, after the ones in flight arrived. The queued ones are
+                 dropped, the caller loads them with the others.
+        """
+        start = time.perf_counter()
+        with self.condition:
+            while not self.in_flight.isdisjoint(names):
+                self.condition.wait()
+            waited = time.perf_counter() - start
+            packages = {}
+            # the caller would have loaded them in parallel, waiting for the longest fetch
+            seconds = 0.0
+            for name in names:
+                self.queued.pop(name, None)
+                if name in self.fetched:
+                    packages[name], duration = self.fetched.pop(name)
+                    seconds = max(seconds, duration)
+            self.prefetched += len(packages)
+            self.waited_seconds += waited
+            self.hidden_seconds += max(seconds - waited, 0.0)
+        return packages
+
+    def unused(self) -> int:
+        """
+        :return: packuments fetched which the solver didn't take
+        """
+        with self.condition:
+            return len(self.fetched)
+
+    def close(self):
+        """
+        stop the threads once their current fetch is done
+        """
+        with self.condition:
+            self.closed = True
+            self.queue.clear()
+            self.queued.clear()
+            self.condition.notify_all()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                priority, _, name = heapq.heappop(self.queue)
+                if self.queued.get(name) != priority:
+                    # taken by the solver, or queued again with a higher priority
+                    continue
+                del self.queued[name]
+                self.in_flight.add(name)
+            start = time.perf_counter()
+            try:
+                package = self.fetch({name}).get(name)
+            except Exception:
+                # the solver loads it again if it needs it, and gets the error then
+                package = None
+            duration = time.perf_counter() - start
+            with self.condition:
+                self.in_flight.discard(name)
+                if package is not None:
+                    self.fetched[name] = (package, duration)
+                self.condition.notify_all()
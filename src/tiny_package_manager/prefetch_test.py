@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from .metadata import StoredPackage
+from .prefetch import *
+from .synthetic import SyntheticReference, synthetic_registry
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def test_priority(self):
+        fetched = []
+        started = threading.Event()
+        blocked = threading.Event()
+
+        def fetch(names):
+            started.set()
+            blocked.wait()
+            fetched.extend(names)
+            return {name: StoredPackage(name, {}) for name in names}
+
+        prefetcher = Prefetcher(fetch, max_concurrency=1)
+        prefetcher.request(["a"], 0)
+        started.wait()
+        # queued while `a` is in flight
+        prefetcher.request(["b", "c"], 1)
+        prefetcher.request(["d"], 0)
+        prefetcher.request(["c"], 0)
+        prefetcher.request(["a"], 0)
+        blocked.set()
+        self.assertEqual(set(prefetcher.take({"a", "d"})), {"a", "d"})
+        self.assertEqual(set(prefetcher.take({"c", "b"})), {"c", "b"})
+        self.assertEqual(fetched, ["a", "d", "c", "b"])
+        self.assertEqual(prefetcher.prefetched, 4)
+        self.assertEqual(prefetcher.unused(), 0)
+        prefetcher.close()
+
+    def test_failure(self):
+        def fetch(names):
+            raise ValueError("no package info")
+
+        prefetcher = Prefetcher(fetch)
+        prefetcher.request(["a"], 0)
+        # the caller loads it itself
+        self.assertEqual(prefetcher.take({"a"}), {})
+        prefetcher.close()
+
+    def test_compile(self):
+        registry = synthetic_registry(50, 10, 3, 0.1, seed=1)
+        found = []
+        for prefetch_concurrency in (0, 4):
+            reference = SyntheticReference(registry, latency=0.002, prefetch_concurrency=prefetch_concurrency)
+            reference.direct_dependencies = {"p0": "*", "p1": "*"}
+            found.append((reference.compile(), reference.stats.nodes, reference.metadata_stats.packuments))
+        self.assertEqual(found[0], found[1])
+        # the prefetched packuments are counted as loaded by the solver
+        self.assertEqual(reference.metadata_stats.cache_misses, reference.metadata_stats.packuments)
+        self.assertGreater(reference.metadata_stats.prefetched, 0)
+        self.assertGreaterEqual(reference.metrics()["seconds"]["prefetch_hidden"], 0.0)
+        self.assertIsNone(reference.prefetcher)
+
+
+if __name__ == '__main__':
+    unittest.main()
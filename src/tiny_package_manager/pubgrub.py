@@ -0,0 +1,438 @@
+from typing import TYPE_CHECKING, Optional, Union
+
+from semantic_version import Version
+
+from .base import PackageName, PackageVersion, VersionSet, VersionTable
+
+if TYPE_CHECKING:
+    from .reference import YarnReference
+
+# the package standing for the project, it depends on the direct dependencies
+ROOT = ""
+ROOT_VERSION = Version("0.0.0")
+
+# how an incompatibility was learned
+ROOT_CAUSE = "root"
+DEPENDENCY = "dependency"
+NO_VERSIONS = "no-versions"
+
+_SATISFIED = 0
+_CONTRADICTED = 1
+_INCONCLUSIVE = 2
+
+
+class Term(object):
+    """
+    a statement about a package: positive, it is selected with one of `versions`; negative, it isn't selected with
+    any of them, which holds if it isn't selected at all
+    """
+
+    def __init__(self, package_name: PackageName, versions: VersionSet, positive: bool = True):
+        self.package_name = package_name
+        self.versions = versions
+        self.positive = positive
+
+    def inverse(self) -> "Term":
+        return Term(self.package_name, self.versions, not self.positive)
+
+    def intersect(self, other: "Term") -> "Term":
+        if self.positive and other.positive:
+            return Term(self.package_name, self.versions & other.versions)
+        if self.positive:
+            return Term(self.package_name, self.versions - other.versions)
+        if other.positive:
+            return Term(self.package_name, other.versions - self.versions)
+        return Term(self.package_name, self.versions | other.versions, False)
+
+    def difference(self, other: "Term") -> "Term":
+        return self.intersect(other.inverse())
+
+    def empty(self) -> bool:
+        # a negative term holds whenever the package isn't selected
+        return self.positive and not self.versions
+
+    def satisfies(self, other: "Term") -> bool:
+        return self.difference(other).empty()
+
+    def relation(self, other: "Term") -> int:
+        """
+        :return: whether this term, the assignments of a package, satisfies or contradicts `other`
+        """
+        if self.satisfies(other):
+            return _SATISFIED
+        if self.intersect(other).empty():
+            return _CONTRADICTED
+        return _INCONCLUSIVE
+
+    def __str__(self):
+        if self.package_name == ROOT:
+            return "the project" if self.positive else "not the project"
+        description = f"{self.package_name} {describe_versions(self.versions)}"
+        return description if self.positive else f"not {description}"
+
+
+class Incompatibility(object):
+    """
+    terms which can't all hold at once. It was either given by the registry (`cause` is one of ROOT_CAUSE,
+    DEPENDENCY and NO_VERSIONS) or derived from two other incompatibilities (`cause` is the pair of them).
+    """
+
+    def __init__(self,
+                 terms: list[Term],
+                 cause: Union[str, tuple["Incompatibility", "Incompatibility"]],
+                 dependency_range: Optional[str] = None):
+        """
+        :param dependency_range: the raw range of a DEPENDENCY, to explain a failure with the words of the
+               manifests
+        """
+        merged: dict[PackageName, Term] = {}
+        for term in terms:
+            merged[term.package_name] = term.intersect(merged[term.package_name]) \
+                if term.package_name in merged else term
+        if len(merged) > 1 and isinstance(cause, tuple):
+            # the project is always selected, saying it adds nothing
+            root = merged.get(ROOT)
+            if root is not None and root.positive:
+                del merged[ROOT]
+        self.terms = list(merged.values())
+        self.cause = cause
+        self.dependency_range = dependency_range
+
+    def derived(self) -> bool:
+        return isinstance(self.cause, tuple)
+
+    def failure(self) -> bool:
+        return not self.terms or (len(self.terms) == 1 and self.terms[0].positive
+                                  and self.terms[0].package_name == ROOT)
+
+    def __str__(self):
+        if self.failure():
+            return "version solving failed"
+        if self.cause == DEPENDENCY and len(self.terms) == 2:
+            depender, dependency = self.terms
+            return f"{depender} depends on {dependency.package_name} {self.dependency_range}"
+        if self.cause == NO_VERSIONS:
+            return f"no versions of {self.terms[0]} exist"
+        if len(self.terms) == 1:
+            return f"{self.terms[0]} is forbidden"
+        positives = " and ".join(str(term) for term in self.terms if term.positive)
+        requirements = " or ".join(str(term.inverse()) for term in self.terms if not term.positive)
+        if positives and requirements:
+            return f"{positives} requires {requirements}"
+        if positives:
+            return f"{positives} are incompatible"
+        return f"{requirements} must be selected"
+
+
+class Assignment(object):
+    def __init__(self, term: Term, decision_level: int, index: int, cause: Optional[Incompatibility]):
+        """
+        :param cause: the incompatibility the term was derived from, None for a decision
+        """
+        self.term = term
+        self.decision_level = decision_level
+        self.index = index
+        self.cause = cause
+
+
+class PartialSolution(object):
+    """
+    the decisions made so far, and everything derived from them, in order
+    """
+
+    def __init__(self):
+        self.assignments: list[Assignment] = []
+        self.package_assignments: dict[PackageName, list[Assignment]] = {}
+        self.decisions: dict[PackageName, Version] = {}
+        # intersection of the assignments of every package
+        self.terms: dict[PackageName, Term] = {}
+
+    def decision_level(self) -> int:
+        return len(self.decisions)
+
+    def decide(self, package_name: PackageName, version: Version, versions: VersionSet):
+        self.decisions[package_name] = version
+        self._assign(Term(package_name, versions), None)
+
+    def derive(self, term: Term, cause: Incompatibility):
+        self._assign(term, cause)
+
+    def _assign(self, term: Term, cause: Optional[Incompatibility]):
+        assignment = Assignment(term, self.decision_level(), len(self.assignments), cause)
+        self.assignments.append(assignment)
+        self.package_assignments.setdefault(term.package_name, []).append(assignment)
+        previous = self.terms.get(term.package_name)
+        self.terms[term.package_name] = term if previous is None else previous.intersect(term)
+
+    def backtrack(self, decision_level: int):
+        """
+        undo the decisions after `decision_level`, and everything derived from them
+        """
+        # a dict rather than a set, the order of the terms picks the next decision among equals
+        undone: dict[PackageName, None] = {}
+        while self.assignments and self.assignments[-1].decision_level > decision_level:
+            assignment = self.assignments.pop()
+            package_name = assignment.term.package_name
+            self.package_assignments[package_name].pop()
+            if assignment.cause is None:
+                del self.decisions[package_name]
+            undone[package_name] = None
+        # the terms of these packages are rebuilt from their remaining assignments
+        for package_name in undone:
+            del self.terms[package_name]
+            for assignment in self.package_assignments[package_name]:
+                previous = self.terms.get(package_name)
+                self.terms[package_name] = assignment.term if previous is None else previous.intersect(assignment.term)
+
+    def relation(self, term: Term) -> int:
+        accumulated = self.terms.get(term.package_name)
+        return _INCONCLUSIVE if accumulated is None else accumulated.relation(term)
+
+    def satisfier(self, term: Term) -> Assignment:
+        """
+        :return: the first assignment after which `term` is satisfied
+        """
+        accumulated = None
+        for assignment in self.package_assignments.get(term.package_name, []):
+            accumulated = assignment.term if accumulated is None else accumulated.intersect(assignment.term)
+            if accumulated.satisfies(term):
+                return assignment
+        raise ValueError(f"{term} is not satisfied")
+
+
+class PubGrubSolver(object):
+    """
+    resolve the direct dependencies of a YarnReference with PubGrub: incompatibilities learned from every conflict
+    are propagated to the remaining packages, so the same conflict is never met twice, and a failure comes with
+    the chain of incompatibilities explaining it. See https://github.com/dart-lang/pub/blob/master/doc/solver.md
+    """
+
+    def __init__(self, reference: "YarnReference"):
+        self.reference = reference
+        self.stats = reference.stats
+        self.root_table = VersionTable(ROOT, [str(ROOT_VERSION)])
+        self.solution = PartialSolution()
+        self.incompatibilities: dict[PackageName, list[Incompatibility]] = {}
+        # the incompatibility explaining the failure, None if a solution was found
+        self.failure: Optional[Incompatibility] = None
+
+    def solve(self) -> Optional[list[PackageVersion]]:
+        root_versions = self.root_table.all()
+        self._add_incompatibility(Incompatibility([Term(ROOT, root_versions, False)], ROOT_CAUSE))
+        self.solution.decide(ROOT, ROOT_VERSION, root_versions)
+        for package_name, spec in self.reference.direct_dependencies.items():
+            versions = self.reference.matching_versions(package_name, spec)
+            self._add_incompatibility(Incompatibility([Term(ROOT, root_versions), Term(package_name, versions, False)],
+                                                      DEPENDENCY, spec))
+        next_package: Optional[PackageName] = ROOT
+        while next_package is not None:
+            if not self._propagate(next_package):
+                return None
+            next_package = self._decide()
+        return [PackageVersion(package_name, version)
+                for package_name, version in self.solution.decisions.items() if package_name != ROOT]
+
+    def explanation(self) -> Optional[str]:
+        return None if self.failure is None else explain(self.failure)
+
+    def _add_incompatibility(self, incompatibility: Incompatibility):
+        for term in incompatibility.terms:
+            self.incompatibilities.setdefault(term.package_name, []).append(incompatibility)
+
+    def _propagate(self, package_name: PackageName) -> bool:
+        """
+        unit propagation: derive every term implied by the incompatibilities of the changed packages
+        :return: False if the dependencies can't be resolved
+        """
+        changed = [package_name]
+        while changed:
+            package_name = changed.pop()
+            # the latest incompatibilities first, they are the most specific
+            for incompatibility in reversed(self.incompatibilities.get(package_name, [])):
+                result = self._propagate_incompatibility(incompatibility)
+                if result is _CONFLICT:
+                    root_cause = self._resolve_conflict(incompatibility)
+                    if root_cause is None:
+                        return False
+                    # the root cause is satisfied but for one term after backjumping, the inverse of which is derived
+                    changed = [self._propagate_incompatibility(root_cause)]
+                    break
+                if result is not None:
+                    changed.append(result)
+        return True
+
+    def _propagate_incompatibility(self, incompatibility: Incompatibility):
+        """
+        :return: the package a term was derived for, _CONFLICT if the incompatibility is satisfied, else None
+        """
+        unsatisfied = None
+        for term in incompatibility.terms:
+            relation = self.solution.relation(term)
+            if relation == _CONTRADICTED:
+                return None
+            if relation == _INCONCLUSIVE:
+                if unsatisfied is not None:
+                    return None
+                unsatisfied = term
+        if unsatisfied is None:
+            return _CONFLICT
+        self.solution.derive(unsatisfied.inverse(), incompatibility)
+        return unsatisfied.package_name
+
+    def _resolve_conflict(self, incompatibility: Incompatibility) -> Optional[Incompatibility]:
+        """
+        derive the root cause of a conflict, and backjump to where it's no longer satisfied
+        :return: the root cause, None if it means the dependencies can't be resolved
+        """
+        self.stats.conflicts += 1
+        learned = False
+        while not incompatibility.failure():
+            most_recent_term: Optional[Term] = None
+            most_recent_satisfier: Optional[Assignment] = None
+            difference: Optional[Term] = None
+            previous_level = 1
+            for term in incompatibility.terms:
+                satisfier = self.solution.satisfier(term)
+                if most_recent_satisfier is None or most_recent_satisfier.index < satisfier.index:
+                    if most_recent_satisfier is not None:
+                        previous_level = max(previous_level, most_recent_satisfier.decision_level)
+                    most_recent_term, most_recent_satisfier, difference = term, satisfier, None
+                else:
+                    previous_level = max(previous_level, satisfier.decision_level)
+                if most_recent_term is term:
+                    # the satisfier may say more than the term, what it says on top of it has its own satisfier
+                    difference = most_recent_satisfier.term.difference(most_recent_term)
+                    if difference.empty():
+                        difference = None
+                    else:
+                        previous_level = max(previous_level,
+                                             self.solution.satisfier(difference.inverse()).decision_level)
+
+            if previous_level < most_recent_satisfier.decision_level or most_recent_satisfier.cause is None:
+                self.stats.backtracks += 1
+                if self.solution.decision_level() - previous_level > 1:
+                    self.stats.backjumps += 1
+                self.solution.backtrack(previous_level)
+                if learned:
+                    self._add_incompatibility(incompatibility)
+                    self.stats.nogoods_learned += 1
+                return incompatibility
+
+            cause = most_recent_satisfier.cause
+            terms = [term for term in incompatibility.terms if term is not most_recent_term]
+            terms += [term for term in cause.terms if term.package_name != most_recent_satisfier.term.package_name]
+            if difference is not None:
+                terms.append(difference.inverse())
+            incompatibility = Incompatibility(terms, (incompatibility, cause))
+            learned = True
+        self.failure = incompatibility
+        return None
+
+    def _decide(self) -> Optional[PackageName]:
+        """
+        select a version of the undecided package with the fewest candidates
+        :return: the package, None if every package is decided
+        """
+        candidates = [term for package_name, term in self.solution.terms.items()
+                      if term.positive and package_name not in self.solution.decisions]
+        if not candidates:
+            return None
+        term = min(candidates, key=lambda candidate: len(candidate.versions))
+        package_name = term.package_name
+        versions = self.reference._ordered_versions(package_name, term.versions)
+        if not versions:
+            self._add_incompatibility(Incompatibility([term], NO_VERSIONS))
+            return package_name
+
+        version = versions[0]
+        self.stats.nodes += 1
+        chosen_one = PackageVersion(package_name, version)
+        version_dependency = self.reference._choose_new(chosen_one)
+        ranges = self._dependency_ranges(chosen_one)
+        version_set = term.versions.table.version_set([version])
+        conflict = False
+        for dependency_name, dependency_versions in version_dependency.versions.items():
+            incompatibility = Incompatibility([Term(package_name, version_set),
+                                               Term(dependency_name, dependency_versions, False)],
+                                              DEPENDENCY, ranges.get(dependency_name))
+            self._add_incompatibility(incompatibility)
+            # a dependency contradicting the decisions already made, the version is ruled out by propagation
+            conflict = conflict or all(other.package_name == package_name
+                                       or self.solution.relation(other) == _SATISFIED
+                                       for other in incompatibility.terms)
+        if not conflict:
+            self.solution.decide(package_name, version, version_set)
+            self.stats.max_depth = max(self.stats.max_depth, self.solution.decision_level() - 1)
+        return package_name
+
+    def _dependency_ranges(self, package_version: PackageVersion) -> dict[PackageName, str]:
+        version_metadata: dict = self.reference.get_metadata(package_version.name)["versions"].get(
+            str(package_version.version), {})
+        dependencies = version_metadata.get("dependencies")
+        return dependencies if isinstance(dependencies, dict) else {}
+
+
+_CONFLICT = object()
+
+
+def describe_versions(versions: VersionSet) -> str:
+    """
+    the versions as runs of consecutive versions of the package, e.g. `1.0.0 || >=1.2.0 <=1.4.0`
+    """
+    if versions == versions.table.all() and len(versions) > 1:
+        return "*"
+    if not versions:
+        return "(no version)"
+    runs: list[str] = []
+    table = versions.table
+    start = None
+    for idx in range(len(table.versions) + 1):
+        inside = idx < len(table.versions) and (versions.bits >> idx) & 1
+        if inside and start is None:
+            start = idx
+        elif not inside and start is not None:
+            first, last = table.versions[start], table.versions[idx - 1]
+            runs.append(str(first) if start == idx - 1 else f">={first} <={last}")
+            start = None
+    return " || ".join(runs)
+
+
+def explain(failure: Incompatibility) -> str:
+    """
+    the derivation of a failure, one line for every derived incompatibility, the causes before their
+    consequences. Incompatibilities used more than once are numbered to be referred to.
+    """
+    uses: dict[int, int] = {}
+
+    def count(incompatibility: Incompatibility):
+        for cause in incompatibility.cause:
+            if cause.derived():
+                uses[id(cause)] = uses.get(id(cause), 0) + 1
+                if uses[id(cause)] == 1:
+                    count(cause)
+
+    lines: list[str] = []
+    visited: set[int] = set()
+    numbers: dict[int, int] = {}
+
+    def reference(incompatibility: Incompatibility) -> str:
+        number = numbers.get(id(incompatibility))
+        return str(incompatibility) if number is None else f"{incompatibility} ({number})"
+
+    def visit(incompatibility: Incompatibility):
+        visited.add(id(incompatibility))
+        for cause in incompatibility.cause:
+            if cause.derived() and id(cause) not in visited:
+                visit(cause)
+        first, second = incompatibility.cause
+        line = f"Because {reference(first)} and {reference(second)}, {incompatibility}."
+        if uses.get(id(incompatibility), 0) > 1:
+            numbers[id(incompatibility)] = len(numbers) + 1
+            line += f" ({numbers[id(incompatibility)]})"
+        lines.append(line)
+
+    if not failure.derived():
+        return f"{failure}."
+    count(failure)
+    visit(failure)
+    return "\n".join(lines)
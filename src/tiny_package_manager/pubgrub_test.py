@@ -0,0 +1,68 @@
+import unittest
+
+from semantic_version import Version
+
+from .base import VersionTable
+from .pubgrub import *
+from .reference import BACKTRACKING, PUBGRUB
+from .reference_test import BACKJUMPING_REFERENCE, offline_reference
+from .synthetic import SyntheticReference, synthetic_registry
+
+
+class PubGrubTestCase(unittest.TestCase):
+    def test_term(self):
+        table = VersionTable("a", ["1.0.0", "1.1.0", "2.0.0"])
+        one = Term("a", table.version_set([Version("1.0.0"), Version("1.1.0")]))
+        two = Term("a", table.version_set([Version("2.0.0")]))
+        self.assertTrue(one.intersect(two).empty())
+        self.assertTrue(one.satisfies(two.inverse()))
+        # not being selected satisfies a negative term, never a positive one
+        self.assertFalse(two.inverse().satisfies(one))
+        self.assertFalse(two.inverse().intersect(one.inverse()).empty())
+        self.assertEqual(str(one), "a >=1.0.0 <=1.1.0")
+        self.assertEqual(str(one.intersect(Term("a", table.all()))), "a >=1.0.0 <=1.1.0")
+        self.assertEqual(describe_versions(table.version_set([Version("1.0.0"), Version("2.0.0")])),
+                         "1.0.0 || 2.0.0")
+
+    def test_compile(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {"e": "*"}
+        solution = reference.compile(engine=PUBGRUB)
+        self.assertEqual(sorted(str(package_version) for package_version in solution),
+                         ["(a:1.0.1)", "(b:1.0.1)", "(e:1.0.0)", "(h:1.0.0)"])
+        self.assertIsNone(reference.explanation)
+
+    def test_explanation(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {"a": "*", "i": "*"}
+        self.assertIsNone(reference.compile(engine=PUBGRUB))
+        # `a` has nothing to do with the conflict
+        self.assertEqual(reference.explanation.splitlines(), [
+            "Because c 1.0.0 depends on d 2.x and i 1.0.0 depends on c 1.x, i 1.0.0 requires d 2.0.0.",
+            "Because i 1.0.0 depends on d 1.x and i 1.0.0 requires d 2.0.0, i 1.0.0 is forbidden.",
+            "Because i 1.0.0 is forbidden and the project depends on i *, version solving failed.",
+        ])
+
+    def test_same_answers(self):
+        # pubgrub is complete: it finds a solution whenever the backtracking engine does
+        for seed in range(30):
+            registry = synthetic_registry(12, 4, 3, 0.6, seed)
+            found = []
+            for engine in (BACKTRACKING, PUBGRUB):
+                reference = SyntheticReference(registry)
+                reference.direct_dependencies = {"p0": "*", "p1": "*"}
+                solution = reference.compile(engine=engine)
+                found.append(solution is not None)
+                versions = {package_version.name: package_version.version for package_version in solution or []}
+                for package_version in solution or []:
+                    for name, allowed in reference._choose_new(package_version).versions.items():
+                        self.assertIn(versions[name], allowed)
+            self.assertEqual(found[0], found[1], f"seed {seed}")
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            offline_reference(BACKJUMPING_REFERENCE).compile(engine="sat")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,20 @@
-import copy
+import functools
+import itertools
 import json
-from typing import Optional
+import time
+from typing import Callable, Optional
 
-import requests
 from semantic_version import NpmSpec
 
 from .base import *
-from .utils import download_with_cache
+from .lockfile import LockedPackage, Lockfile
+from .metadata import (MAX_AGE, FROM_STORE, NOT_MODIFIED, MetadataCache, MetadataStore, StoredPackage, default_cache,
+                       default_store, load_packages)
+from .parallel import ParallelSearch
+from .prefetch import PREFETCH_CANDIDATES, PREFETCH_CONCURRENCY, Prefetcher
+from .pubgrub import PubGrubSolver
+from .registry import RegistryClient, default_client
+from .tracing import NETWORK, PARSE, SOLVE, Tracer
 
 
 def format_npm(npm_version: str) -> str:
@@ -20,49 +28,387 @@ def format_npm(npm_version: str) -> str:
     return version
 
 
+# bound of the caches of parsed ranges and of the versions matching a range
+SPEC_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=SPEC_CACHE_SIZE)
+def parse_npm_spec(npm_version: str) -> NpmSpec:
+    """
+    parse a raw npm range, every distinct range is parsed only once
+    """
+    return NpmSpec(format_npm(npm_version))
+
+
 class UnresolvedDependency(object):
-    def __init__(self, package_name: PackageName, versions: list[Version]):
+    __slots__ = ("package_name", "versions", "introduced_by")
+
+    def __init__(self,
+                 package_name: PackageName,
+                 versions: VersionSet,
+                 introduced_by: Optional[set[PackageName]] = None):
+        """
+        :param package_name: the name of the package
+        :param versions: candidate versions of the package
+        :param introduced_by: names of the selected packages which depend on this package,
+               empty for direct dependencies
+        """
         self.package_name = package_name
         self.versions = versions
+        self.introduced_by = introduced_by if introduced_by is not None else set()
 
     def merge(self, another: 'UnresolvedDependency'):
         if not isinstance(another, UnresolvedDependency):
             raise TypeError(f"{another} is not of type UnresolvedDependency")
-        union_set = set(self.versions) | set(another.versions)
-        union_list = list(union_set)
-        self.versions = sorted(union_list)
+        self.versions = self.versions | another.versions
+        self.introduced_by = self.introduced_by | another.introduced_by
+
+
+# heuristics choosing the next package to resolve
+INSERTION_ORDER = "insertion"
+FEWEST_VERSIONS_FIRST = "fewest-versions"
+MOST_DEPENDED_FIRST = "most-depended"
+PACKAGE_ORDERS = (INSERTION_ORDER, FEWEST_VERSIONS_FIRST, MOST_DEPENDED_FIRST)
+
+# heuristics ordering the candidate versions of a package
+LISTED_ORDER = "listed"
+NEWEST_FIRST = "newest"
+VERSION_ORDERS = (LISTED_ORDER, NEWEST_FIRST)
 
-    def __deepcopy__(self, memo):
-        new_package_name = copy.deepcopy(self.package_name, memo)
-        new_versions = copy.deepcopy(self.versions, memo)
-        return UnresolvedDependency(new_package_name, new_versions)
+# search engines of `YarnReference.compile`
+BACKTRACKING = "backtracking"
+PUBGRUB = "pubgrub"
+ENGINES = (BACKTRACKING, PUBGRUB)
+
+# budgets of the backtracking search, see `PartialResult`
+NODE_BUDGET = "nodes"
+TIME_BUDGET = "time"
+# why a search of the parallel mode was stopped: another worker found a solution which comes first
+CANCELLED = "cancelled"
+
+_POP = 0
+_PUSH = 1
+_SWAP = 2
+_MERGE = 3
 
 
 class UnresolvedDependencies(object):
+    """
+    the frontier of the search. It is shared by all branches: every change is recorded on a trail,
+    which is undone when backtracking.
+    """
+
     def __init__(self, direct_dependencies: list[UnresolvedDependency]):
         self.unresolved_dependencies = direct_dependencies
+        # dependencies before `start` have been resolved
+        self.start = 0
+        # position of every unresolved dependency
+        self.positions: dict[PackageName, int] = {ud.package_name: idx
+                                                  for idx, ud in enumerate(direct_dependencies)}
+        self.trail: list[tuple] = []
+
+    def empty(self) -> bool:
+        return self.start >= len(self.unresolved_dependencies)
 
-    def deep_copy(self) -> 'UnresolvedDependencies':
-        copied_deps = copy.deepcopy(self.unresolved_dependencies)
-        return UnresolvedDependencies(copied_deps)
+    def unresolved(self) -> list[UnresolvedDependency]:
+        return self.unresolved_dependencies[self.start:]
+
+    def head(self) -> UnresolvedDependency:
+        return self.unresolved_dependencies[self.start]
+
+    def pop_head(self) -> UnresolvedDependency:
+        head = self.head()
+        del self.positions[head.package_name]
+        self.start += 1
+        self.trail.append((_POP,))
+        return head
+
+    def pop(self,
+            package_order: str = INSERTION_ORDER,
+            allowed: Optional['AllowedVersions'] = None) -> UnresolvedDependency:
+        """
+        resolve the next dependency chosen by `package_order`
+        :param allowed: the versions still allowed by the selected packages, FEWEST_VERSIONS_FIRST counts the
+               candidates among them
+        """
+        if package_order == INSERTION_ORDER:
+            return self.pop_head()
+        unresolved = range(self.start, len(self.unresolved_dependencies))
+        if package_order == FEWEST_VERSIONS_FIRST:
+            idx = min(unresolved, key=lambda i: self._candidates(self.unresolved_dependencies[i], allowed))
+        elif package_order == MOST_DEPENDED_FIRST:
+            idx = max(unresolved, key=lambda i: len(self.unresolved_dependencies[i].introduced_by))
+        else:
+            raise ValueError(f"unknown package order {package_order}")
+        self._swap(self.start, idx)
+        return self.pop_head()
+
+    def mark(self) -> int:
+        """
+        :return: a mark of the current state, which can be restored by `undo`
+        """
+        return len(self.trail)
+
+    def undo(self, mark: int):
+        while len(self.trail) > mark:
+            change = self.trail.pop()
+            if change[0] == _POP:
+                self.start -= 1
+                self.positions[self.head().package_name] = self.start
+            elif change[0] == _PUSH:
+                del self.positions[self.unresolved_dependencies.pop().package_name]
+            elif change[0] == _SWAP:
+                self._swap(change[1], change[2], record=False)
+            else:
+                _, unresolved_dependency, versions, introduced_by = change
+                unresolved_dependency.versions = versions
+                unresolved_dependency.introduced_by = introduced_by
 
     def index(self, unresolved_dependency: UnresolvedDependency) -> int:
         if not isinstance(unresolved_dependency, UnresolvedDependency):
             return False
-        for idx, ud in enumerate(self.unresolved_dependencies):
-            if ud.package_name == unresolved_dependency.package_name:
-                return idx
-        return -1
+        return self.positions.get(unresolved_dependency.package_name, -1)
 
     def add_unresolved_dependencies(self, indirect_dependencies: list[UnresolvedDependency]):
-        new_unresolved_dependencies: list[UnresolvedDependency] = []
         for indirect_dependency in indirect_dependencies:
             idx = self.index(indirect_dependency)
             if idx < 0:
-                new_unresolved_dependencies.append(indirect_dependency)
+                self.positions[indirect_dependency.package_name] = len(self.unresolved_dependencies)
+                self.unresolved_dependencies.append(indirect_dependency)
+                self.trail.append((_PUSH,))
                 continue
-            self.unresolved_dependencies[idx].merge(indirect_dependency)
-        self.unresolved_dependencies.extend(new_unresolved_dependencies)
+            unresolved_dependency = self.unresolved_dependencies[idx]
+            # `merge` never modifies the sets in place, so keeping the references is enough to undo it
+            self.trail.append((_MERGE,
+                               unresolved_dependency,
+                               unresolved_dependency.versions,
+                               unresolved_dependency.introduced_by))
+            unresolved_dependency.merge(indirect_dependency)
+
+    @staticmethod
+    def _candidates(unresolved_dependency: UnresolvedDependency, allowed: Optional['AllowedVersions']) -> int:
+        versions = unresolved_dependency.versions
+        allowed_versions = None if allowed is None else allowed.get(unresolved_dependency.package_name)
+        return len(versions if allowed_versions is None else versions & allowed_versions)
+
+    def _swap(self, i: int, j: int, record: bool = True):
+        if i == j:
+            return
+        deps = self.unresolved_dependencies
+        deps[i], deps[j] = deps[j], deps[i]
+        self.positions[deps[i].package_name] = i
+        self.positions[deps[j].package_name] = j
+        if record:
+            self.trail.append((_SWAP, i, j))
+
+
+class AllowedVersions(object):
+    """
+    versions of every package which are still allowed by the selected packages. It is narrowed when a package
+    is selected, and every change is recorded on a trail which is undone when backtracking.
+    """
+
+    def __init__(self):
+        self.allowed: dict[PackageName, VersionSet] = {}
+        # the constraints narrowing each package: (name of the selected package, versions it allows),
+        # the name is None for the constraints of direct dependencies
+        self.constraints: dict[PackageName, list[tuple[Optional[PackageName], VersionSet]]] = {}
+        self.trail: list[tuple[PackageName, Optional[VersionSet]]] = []
+
+    def get(self, package_name: PackageName) -> Optional[VersionSet]:
+        """
+        :return: the allowed versions of the package, None if no selected package depends on it
+        """
+        return self.allowed.get(package_name)
+
+    def narrow(self, package_name: PackageName, versions: VersionSet, by: Optional[PackageName]) -> bool:
+        """
+        :return: False if no version of the package is allowed anymore
+        """
+        previous = self.allowed.get(package_name)
+        self.trail.append((package_name, previous))
+        self.constraints.setdefault(package_name, []).append((by, versions))
+        allowed = versions if previous is None else previous & versions
+        self.allowed[package_name] = allowed
+        return bool(allowed)
+
+    def constrained_by(self, package_name: PackageName) -> set[PackageName]:
+        return {by for by, _ in self.constraints.get(package_name, []) if by is not None}
+
+    def rejections(self,
+                   package_name: PackageName,
+                   versions: VersionSet) -> list[tuple[VersionSet, set[PackageName]]]:
+        """
+        :return: the versions which are not allowed, along with the name of the first package rejecting them
+        """
+        rejections: list[tuple[VersionSet, set[PackageName]]] = []
+        for by, allowed in self.constraints.get(package_name, []):
+            rejected = versions - allowed
+            if rejected:
+                rejections.append((rejected, set() if by is None else {by}))
+                versions = versions & allowed
+        return rejections
+
+    def mark(self) -> int:
+        return len(self.trail)
+
+    def undo(self, mark: int):
+        while len(self.trail) > mark:
+            package_name, previous = self.trail.pop()
+            self.constraints[package_name].pop()
+            if previous is None:
+                del self.allowed[package_name]
+            else:
+                self.allowed[package_name] = previous
+
+
+class MetadataStats(object):
+    def __init__(self):
+        # packuments loaded, and the bytes of the raw documents parsed for them
+        self.packuments = 0
+        self.bytes = 0
+        # packuments read pre-parsed from the metadata store, possibly after a 304 from the registry
+        self.stored = 0
+        # dependency tables built for package versions
+        self.version_tables = 0
+        # packuments asked for which were already loaded, and the ones which had to be loaded
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # packuments fetched in the background before the solver asked for them, and the ones it never asked for
+        self.prefetched = 0
+        self.prefetch_unused = 0
+        # packuments found in the shared cache, loaded by another reference or an earlier compilation
+        self.shared = 0
+
+    def __str__(self):
+        return (f"packuments={self.packuments}, bytes={self.bytes}, stored={self.stored}, "
+                f"version_tables={self.version_tables}, cache_hits={self.cache_hits}, "
+                f"cache_misses={self.cache_misses}, prefetched={self.prefetched}, "
+                f"prefetch_unused={self.prefetch_unused}, shared={self.shared}")
+
+
+class SolverStats(object):
+    def __init__(self):
+        # candidate versions which were expanded by the search
+        self.nodes = 0
+        # candidate versions rejected by a selected package or by a learned nogood
+        self.conflicts = 0
+        # candidate versions rejected because no version of one of their dependencies was allowed anymore
+        self.wipeouts = 0
+        # failed subtrees which didn't involve the current decision
+        self.backjumps = 0
+        # sibling versions skipped by backjumping
+        self.pruned_by_backjump = 0
+        self.nogoods_learned = 0
+        # candidate versions rejected by a learned nogood
+        self.pruned_by_nogood = 0
+        # selected versions undone because their subtree failed
+        self.backtracks = 0
+        # most packages selected at once
+        self.max_depth = 0
+
+    def pruned(self) -> int:
+        return self.pruned_by_backjump + self.pruned_by_nogood
+
+    def add(self, another: 'SolverStats'):
+        """
+        count the work of another search, e.g. of a worker of the parallel mode
+        """
+        for name, value in vars(another).items():
+            if name == "max_depth":
+                self.max_depth = max(self.max_depth, value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+    def __str__(self):
+        return (f"nodes={self.nodes}, conflicts={self.conflicts}, wipeouts={self.wipeouts}, "
+                f"backjumps={self.backjumps}, pruned_by_backjump={self.pruned_by_backjump}, "
+                f"nogoods_learned={self.nogoods_learned}, pruned_by_nogood={self.pruned_by_nogood}, "
+                f"backtracks={self.backtracks}, max_depth={self.max_depth}")
+
+
+class SearchFrame(object):
+    """
+    a package being resolved by the backtracking search, and the next of its candidate versions to try
+    """
+
+    def __init__(self,
+                 mark: int,
+                 package_name: PackageName,
+                 versions: list[InternedVersion],
+                 conflict_set: set[PackageName]):
+        """
+        :param mark: mark of the frontier before the package was popped from it
+        :param versions: the candidate versions, in the order they are tried
+        :param conflict_set: names of the selected packages which ruled out some of the versions
+        """
+        self.mark = mark
+        self.package_name = package_name
+        self.versions = versions
+        self.conflict_set = conflict_set
+        self.next = 0
+        # marks of the allowed versions and of the frontier before the current version was selected
+        self.allowed_mark = 0
+        self.branch = 0
+
+
+class PartialResult(object):
+    """
+    where a search stopped by its budget was: it can be resumed by `YarnReference.resume`
+    """
+
+    def __init__(self,
+                 reason: str,
+                 selected: list[PackageVersion],
+                 unresolved: list[PackageName],
+                 stats: SolverStats,
+                 elapsed: float):
+        """
+        :param reason: the budget which ran out, NODE_BUDGET or TIME_BUDGET, or CANCELLED
+        :param selected: the largest consistent selection the search went through
+        :param unresolved: the packages which were still to be resolved from that selection
+        :param elapsed: seconds the search ran
+        """
+        self.reason = reason
+        self.selected = selected
+        self.unresolved = unresolved
+        self.stats = stats
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return (f"{self.reason} budget exceeded after {self.elapsed:.3f}s: {len(self.selected)} packages selected, "
+                f"{len(self.unresolved)} unresolved, {self.stats}")
+
+
+class Nogoods(object):
+    """
+    combinations of package versions learned to never be part of the same solution
+    """
+
+    def __init__(self):
+        # every nogood is indexed by each of its members, so it is checked as soon as its last member is chosen.
+        # The versions are their indexes in the VersionTable of their package.
+        self.nogoods: dict[tuple[PackageName, int], list[dict[PackageName, int]]] = {}
+
+    def learn(self, nogood: dict[PackageName, int]):
+        for package_name, index in nogood.items():
+            self.nogoods.setdefault((package_name, index), []).append(nogood)
+
+    def conflict(self,
+                 selected: dict[PackageName, int],
+                 package_name: PackageName,
+                 index: int) -> Optional[set[PackageName]]:
+        """
+        :param selected: indexes of the versions of the selected packages
+        :param package_name: the package of the candidate to be selected
+        :param index: index of the version of the candidate
+        :return: names of the selected packages which, together with the candidate, form a learned nogood;
+                 None if there is no such nogood
+        """
+        for nogood in self.nogoods.get((package_name, index), []):
+            if all(name == package_name or selected.get(name) == member for name, member in nogood.items()):
+                return set(nogood) - {package_name}
+        return None
 
 
 class JsonReference(Reference):
@@ -73,22 +419,23 @@ class JsonReference(Reference):
     def __init__(self, conf: str):
         self.all_dependencies: dict[PackageName, VersionDependencies] = {}
         package_dependencies = json.loads(conf)
+        self.version_tables = self._version_tables(package_dependencies)
         for package_name in package_dependencies:
             package_version_dependencies: dict[VersionName, VersionDependency] = {}
             # jest
             package_info = package_dependencies[package_name]
             for package_version in package_info:
-                sub_version_dependencies: dict[VersionName, list[Version]] = {}
+                sub_version_dependencies: dict[PackageName, VersionSet] = {}
                 # 0.0.1
                 version_dependencies = package_info[package_version]
                 if version_dependencies:
                     for version_dependency_name in version_dependencies:
                         # express
                         version_single_dependency = version_dependencies[version_dependency_name]
-                        version_single_dependencies: list[Version] = []
-                        for v in version_single_dependency:
-                            # ["0.0.1", "0.0.2"]
-                            version_single_dependencies.append(Version(v))
+                        version_table = self.version_tables[version_dependency_name]
+                        # ["0.0.1", "0.0.2"]
+                        version_single_dependencies = version_table.version_set(
+                            version_table.version(v) for v in version_single_dependency)
                         sub_version_dependencies[version_dependency_name] = version_single_dependencies
                     package_version_dependencies[package_version] = VersionDependency(sub_version_dependencies)
                 else:
@@ -100,45 +447,313 @@ class JsonReference(Reference):
 
     def package_versions(self, name: PackageName) -> list[PackageVersion]:
         if name in self.all_dependencies:
-            return [PackageVersion(name, version)
-                    for version in self.all_dependencies[name].all_versions()]
+            table = self.version_tables[name]
+            return [PackageVersion(name, table.version(version_name))
+                    for version_name in self.all_dependencies[name].version_dependencies]
         else:
             raise ValueError(f"no package info for {name}")
 
+    @staticmethod
+    def _version_tables(package_dependencies: dict) -> dict[PackageName, VersionTable]:
+        # versions of every package, including the ones only mentioned by its dependents
+        version_names: dict[PackageName, dict[VersionName, None]] = {}
+        for package_name, package_info in package_dependencies.items():
+            version_names.setdefault(package_name, {}).update(dict.fromkeys(package_info))
+            for version_dependencies in package_info.values():
+                for dependency_name, dependency_versions in (version_dependencies or {}).items():
+                    version_names.setdefault(dependency_name, {}).update(dict.fromkeys(dependency_versions))
+        return {package_name: VersionTable(package_name, names) for package_name, names in version_names.items()}
+
 
 class YarnReference(Reference):
-    def __init__(self, debug: bool = False):
+    # rebuilt rather than pickled: the connections, the caches derived from the packuments and the search state
+    _TRANSIENT = ("client", "store", "cache", "tracer", "prefetcher", "matching_versions", "version_cache", "manifest",
+                  "nogoods", "allowed", "_selected_indexes", "_frontier", "_stack", "_selected", "_returning", "_best",
+                  "_cancelled", "partial", "lockfile")
+
+    def __init__(self,
+                 debug: bool = False,
+                 spec_cache_size: int = SPEC_CACHE_SIZE,
+                 client: Optional[RegistryClient] = None,
+                 store: Optional[MetadataStore] = None,
+                 max_age: Optional[float] = MAX_AGE,
+                 tracer: Optional[Tracer] = None,
+                 prefetch_concurrency: int = PREFETCH_CONCURRENCY,
+                 cache: Optional[MetadataCache] = None):
+        """
+        :param tracer: times the network, parsing and solving work of every compilation, see `metrics`
+        :param prefetch_concurrency: threads fetching packuments in the background while the backtracking search
+               runs, see `prefetch.Prefetcher`; 0 to load them only when they are needed
+        :param cache: packuments shared with other references, by default the references loading from the default
+               client and store share `metadata.default_cache()`
+        """
+        self.client = client or default_client()
+        self.store = store or default_store()
+        if cache is None:
+            cache = default_cache() if client is None and store is None else MetadataCache()
+        self.cache = cache
+        self.spec_cache_size = spec_cache_size
+        # seconds a stored packument is used before revalidating it with the registry, None to never revalidate
+        self.max_age = max_age
+        # the packuments used by this reference, they stay here when the shared cache evicts them
         self.package_version_cache: dict[PackageName, dict] = {}
+        # parsed versions of every package
+        self.version_cache: dict[PackageName, VersionTable] = {}
+        # (package, raw range) -> versions of the package matching the range, see `matching_versions.cache_info()`
+        self.matching_versions = functools.lru_cache(maxsize=spec_cache_size)(self._matching_versions)
+        self.metadata_stats = MetadataStats()
+        self.tracer = tracer or Tracer()
+        self.prefetch_concurrency = prefetch_concurrency
+        self.prefetcher: Optional[Prefetcher] = None
+        # seconds the last compilation spent in total, and waiting for packuments
+        self.elapsed = 0.0
+        self.metadata_seconds = 0.0
+        # seconds of fetching the packuments prefetched by the last compilation which it didn't wait for
+        self.prefetch_hidden_seconds = 0.0
         self.direct_dependencies: dict[str, str] = {}
         self.manifest = Dependencies({})
         self.debug = debug
+        self.stats = SolverStats()
+        self.nogoods = Nogoods()
+        self.allowed = AllowedVersions()
+        # indexes of the versions of the selected packages during the search, see `VersionTable`
+        self._selected_indexes: dict[PackageName, int] = {}
+        self.package_order = INSERTION_ORDER
+        self.version_order = LISTED_ORDER
+        self.preferred_versions: dict[PackageName, Version] = {}
+        self.engine = BACKTRACKING
+        self.workers = 1
+        # state of the backtracking search, kept to resume it
+        self._frontier = UnresolvedDependencies([])
+        self._stack: list[SearchFrame] = []
+        self._selected: list[PackageVersion] = []
+        # conflict set of the subtree which just failed, None while going down
+        self._returning: Optional[set[PackageName]] = None
+        # whether the next step opens a frame for the next package, rather than trying another version
+        self._expand = True
+        self._searching = False
+        self._best: tuple[list[PackageVersion], list[PackageName]] = ([], [])
+        self._node_limit: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._search_start = 0.0
+        self._lockfile_path: Optional[str] = None
+        # packages of the locked subtrees kept by the search, selected from the start, see `compile`
+        self._pinned: dict[PackageName, LockedPackage] = {}
+        # tells a search of the parallel mode to stop
+        self._cancelled: Optional[Callable[[], bool]] = None
+        # where the last search stopped, if its budget ran out
+        self.partial: Optional[PartialResult] = None
+        # why the last compilation failed, if its engine tells
+        self.explanation: Optional[str] = None
+        # the lockfile of the last compilation, its integrities are used without loading the packuments
+        self.lockfile: Optional[Lockfile] = None
+
+    def __getstate__(self) -> dict:
+        """
+        a reference is pickled with its settings and the packuments it loaded, the workers of the parallel mode
+        resolve from them without loading them again
+        """
+        state = {name: value for name, value in vars(self).items() if name not in self._TRANSIENT}
+        state["registry_url"] = self.client.registry_url
+        state["store_path"] = self.store.path
+        return state
+
+    def __setstate__(self, state: dict):
+        state = dict(state)
+        client = RegistryClient(state.pop("registry_url"))
+        store = MetadataStore(state.pop("store_path"))
+        YarnReference.__init__(self, state["debug"], state["spec_cache_size"], client, store, state["max_age"])
+        vars(self).update(state)
 
     def package_versions(self, name: str) -> list[PackageVersion]:
-        package_info = self.get_metadata(name)
-        if "versions" not in package_info:
-            return []
-        versions: dict = package_info["versions"]
-        return [PackageVersion(name, Version(version)) for version in versions]
+        return [PackageVersion(name, version) for version in self.version_table(name).names.values()]
+
+    def integrity(self, name: str, version_name: str) -> Optional[str]:
+        if self.lockfile is not None and (integrity := self.lockfile.integrity(name, version_name)) is not None:
+            return integrity
+        version_metadata: dict = self.get_metadata(name)["versions"].get(version_name, {})
+        return version_metadata.get("dist", {}).get("integrity")
+
+    def version_table(self, name: PackageName) -> VersionTable:
+        if name not in self.version_cache:
+            package_info = self.get_metadata(name)
+            versions: dict = package_info.get("versions", {})
+            self.version_cache[name] = VersionTable(name, versions)
+        return self.version_cache[name]
+
+    def _matching_versions(self, name: PackageName, npm_version: str) -> VersionSet:
+        """
+        :return: versions of the package matching the raw range
+        """
+        npm_spec = parse_npm_spec(npm_version)
+        table = self.version_table(name)
+        return table.version_set(version for version in table.versions if version in npm_spec)
+
+    def compile(self,
+                package_order: str = INSERTION_ORDER,
+                version_order: str = LISTED_ORDER,
+                preferred_versions: Optional[dict[PackageName, Version]] = None,
+                lockfile: Optional[str] = None,
+                engine: str = BACKTRACKING,
+                max_nodes: Optional[int] = None,
+                max_seconds: Optional[float] = None,
+                workers: int = 1) -> Optional[list[PackageVersion]]:
+        """
+        :param package_order: heuristic choosing the next package to resolve, one of `PACKAGE_ORDERS`
+        :param version_order: heuristic ordering the candidate versions of a package, one of `VERSION_ORDERS`
+        :param preferred_versions: versions tried before any other candidate, e.g. the ones pinned by a lockfile
+        :param lockfile: path of the lockfile, see `lockfile.DEFAULT_LOCKFILE`. If the direct dependencies didn't
+               change since it was written, its solution is returned without loading any packument. Else the
+               locked subtrees of the unchanged direct dependencies are kept: the backtracking search pins their
+               versions and only resolves the others, loading just the packuments of the kept packages they depend
+               on. If they conflict with a kept version, the whole graph is solved again with the locked versions
+               preferred, which is all PUBGRUB does. The lockfile is rewritten.
+        :param engine: search engine, one of `ENGINES`. PUBGRUB ignores `package_order`, and explains a failure in
+               `explanation`.
+        :param max_nodes: budget of the backtracking search in nodes, see `SolverStats.nodes`
+        :param max_seconds: budget of the backtracking search in seconds. When a budget runs out, None is returned
+               and `partial` tells where the search was, it can go on with `resume`.
+        :param workers: processes running the backtracking search in parallel, see `parallel.ParallelSearch`. It
+               returns the same solution as a single process, budgets are not supported.
+        :return: the selected package versions, None if the dependencies can't be resolved
+        """
+        if package_order not in PACKAGE_ORDERS:
+            raise ValueError(f"unknown package order {package_order}")
+        if version_order not in VERSION_ORDERS:
+            raise ValueError(f"unknown version order {version_order}")
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine}")
+        if workers > 1 and (engine != BACKTRACKING or max_nodes is not None or max_seconds is not None):
+            raise ValueError("only the backtracking search without a budget runs in parallel")
+        self.engine = engine
+        self.workers = workers
+        self.explanation = None
+        self.partial = None
+        self._searching = False
+        self._lockfile_path = lockfile
+        self._pinned = {}
+        self.package_order = package_order
+        self.version_order = version_order
+        self.preferred_versions = preferred_versions or {}
+        self.stats = SolverStats()
+        self._budget(max_nodes, max_seconds)
+        return self._run(lambda: self._compile(lockfile))
 
-    def compile(self) -> Optional[list[PackageVersion]]:
+    def _run(self, solve: Callable[[], Optional[list[PackageVersion]]]) -> Optional[list[PackageVersion]]:
         """
+        run a compilation or a resumed search, timing it and prefetching the packuments it needs, see `metrics`
         """
-        solution: list[list[PackageVersion]] = []
-        selected: list[PackageVersion] = []
+        self.tracer.reset()
+        self.metadata_seconds = 0.0
+        self.prefetch_hidden_seconds = 0.0
+        if self.prefetch_concurrency > 0:
+            self.prefetcher = Prefetcher(self._fetch_packages, self.prefetch_concurrency)
+        start = time.perf_counter()
+        try:
+            return solve()
+        finally:
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.metadata_stats.prefetch_unused += self.prefetcher.unused()
+                self.prefetch_hidden_seconds = self.prefetcher.hidden_seconds
+                self.prefetcher = None
+            self.elapsed = time.perf_counter() - start
+            self.tracer.add("compile", SOLVE, start, self.elapsed, self.elapsed - self.metadata_seconds,
+                            packages=len(self.direct_dependencies))
+            self.tracer.metrics(self.metrics())
+
+    def _compile(self, lockfile: Optional[str]) -> Optional[list[PackageVersion]]:
+        if lockfile is not None:
+            locked = Lockfile.load(lockfile)
+            if locked is not None and locked.direct_dependencies == self.direct_dependencies:
+                self.lockfile = locked
+                return locked.solution()
+            if locked is not None:
+                kept = locked.unchanged(self.direct_dependencies)
+                self.preferred_versions = {**kept, **self.preferred_versions}
+                if self.engine == BACKTRACKING:
+                    # unless the caller prefers another version
+                    self._pinned = {name: locked.packages[name] for name, version in kept.items()
+                                    if self.preferred_versions[name] == version}
+
+        solution = self._solve()
+        if solution is None and self._pinned and self.partial is None:
+            # the other dependencies conflict with the kept subtrees
+            self._pinned = {}
+            solution = self._solve()
+        return self._finish(solution)
+
+    def _solve(self) -> Optional[list[PackageVersion]]:
+        direct_dependencies = {package_name: spec for package_name, spec in self.direct_dependencies.items()
+                               if package_name not in self._pinned}
+        self._prefetch_metadata(set(direct_dependencies))
+        if self.prefetcher is not None:
+            self._request_prefetch([UnresolvedDependency(package_name, self.matching_versions(package_name, spec))
+                                    for package_name, spec in direct_dependencies.items()])
+        if self.engine == PUBGRUB:
+            solver = PubGrubSolver(self)
+            solution = solver.solve()
+            self.explanation = solver.explanation()
+            return solution
+        if self.workers > 1:
+            return ParallelSearch(self, self.workers).solve()
+        self._start_search()
+        return self._search()
+
+    def resume(self,
+               max_nodes: Optional[int] = None,
+               max_seconds: Optional[float] = None) -> Optional[list[PackageVersion]]:
+        """
+        go on with a search stopped by its budget, with a new budget. The timings of `metrics` cover this slice of
+        the search, its counters add up since the compilation.
+        """
+        if self.partial is None or not self._searching:
+            raise ValueError("no search to resume")
+        self._budget(max_nodes, max_seconds)
+        return self._run(lambda: self._finish(self._search()))
+
+    def _budget(self, max_nodes: Optional[int], max_seconds: Optional[float]):
+        self._search_start = time.perf_counter()
+        self._node_limit = None if max_nodes is None else self.stats.nodes + max_nodes
+        self._deadline = None if max_seconds is None else self._search_start + max_seconds
+
+    def _finish(self, solution: Optional[list[PackageVersion]]) -> Optional[list[PackageVersion]]:
+        if solution is not None and self._pinned:
+            solution = [package.package_version() for package in self._pinned.values()] + solution
+        if solution is not None and self._lockfile_path is not None:
+            self.lockfile = self._lock(solution)
+            self.lockfile.save(self._lockfile_path)
+        return solution
+
+    def _start_search(self):
         ud: list[UnresolvedDependency] = []
+        self.nogoods = Nogoods()
+        self.allowed = AllowedVersions()
+        self._selected_indexes = {}
         for package_name, spec in self.direct_dependencies.items():
-            npm_spec = NpmSpec(format_npm(spec))
-            self._update_metadata(package_name, npm_spec)
-            package_versions = self.package_versions(package_name)
-            versions = [pv.version for pv in package_versions if pv.version in npm_spec]
+            if package_name in self._pinned:
+                continue
+            versions = self.matching_versions(package_name, spec)
+            self.allowed.narrow(package_name, versions, None)
             dependency = UnresolvedDependency(package_name, versions)
             ud.append(dependency)
-        unresolved_dependencies: UnresolvedDependencies = UnresolvedDependencies(ud)
-        self._do_compile(solution, selected, unresolved_dependencies)
-        if solution:
-            return solution[0]
-        else:
-            return None
+        self._frontier = UnresolvedDependencies(ud)
+        # the pinned packages are never selected, their dependencies on the other packages are constrained upfront
+        pinned_dependencies: list[UnresolvedDependency] = []
+        for package in self._pinned.values():
+            for package_name, spec in package.dependencies.items():
+                if package_name in self._pinned:
+                    continue
+                versions = self.matching_versions(package_name, spec)
+                self.allowed.narrow(package_name, versions, None)
+                pinned_dependencies.append(UnresolvedDependency(package_name, versions))
+        self._frontier.add_unresolved_dependencies(pinned_dependencies)
+        self._stack = []
+        self._selected = []
+        self._returning = None
+        self._expand = True
+        self._searching = True
+        self._best = ([], list(self.direct_dependencies))
         # for package_name, npm_spec in self.direct_dependencies.items():
         #     package_versions = self.package_versions(package_name)
         #     for package_version in package_versions:
@@ -159,94 +774,320 @@ class YarnReference(Reference):
         #         for dependency_name, dependency_npm_version in dependencies.items():
         #             pass
 
-    def _do_compile(self,
-                    solution: list[list[PackageVersion]],
-                    selected: list[PackageVersion],
-                    unresolved_package: UnresolvedDependencies) -> list[list[PackageVersion]]:
-        if solution:
-            return solution
+    def metrics(self) -> dict:
+        """
+        counters and timings of the last compilation or `resume`, the metadata counters add up since the reference
+        was created. The network and parsing seconds are summed over the threads loading the packuments in parallel,
+        the solving seconds exclude the time spent waiting for them. `prefetch_hidden` is the network wait the
+        prefetcher took off the solver.
+        """
+        seconds = dict(self.tracer.seconds)
+        return {
+            "solver": dict(vars(self.stats)),
+            "metadata": dict(vars(self.metadata_stats)),
+            "seconds": {NETWORK: seconds[NETWORK], PARSE: seconds[PARSE], SOLVE: seconds[SOLVE],
+                        "metadata": self.metadata_seconds, "prefetch_hidden": self.prefetch_hidden_seconds,
+                        "total": self.elapsed},
+        }
+
+    def _lock(self, solution: list[PackageVersion]) -> Lockfile:
+        packages = []
+        for package_version in solution:
+            if package_version.name in self._pinned:
+                packages.append(self._pinned[package_version.name])
+                continue
+            version_name = str(package_version.version)
+            version_metadata: dict = self.get_metadata(package_version.name)["versions"][version_name]
+            dependencies = None if self._is_empty_dependency(version_metadata) else version_metadata["dependencies"]
+            packages.append(LockedPackage(package_version.name, package_version.version, dependencies,
+                                          version_metadata.get("dist", {}).get("integrity")))
+        return Lockfile(self.direct_dependencies, packages)
+
+    def _search(self) -> Optional[list[PackageVersion]]:
+        """
+        search for a solution with conflict-directed backjumping. The search is a loop over an explicit stack of
+        frames, one for every package being resolved, so it can be stopped when its budget runs out and resumed.
+        :return: the selected package versions, None if the dependencies can't be resolved or the budget ran out,
+                 see `partial`
+        """
+        self.partial = None
+        frontier = self._frontier
+        stack = self._stack
+        selected = self._selected
+        selected_indexes = self._selected_indexes
+        while True:
+            reason = self._exceeded()
+            if reason is not None:
+                self.partial = PartialResult(reason, self._best[0], self._best[1], self.stats,
+                                             time.perf_counter() - self._search_start)
+                return None
+
+            returning = self._returning
+            if returning is not None:
+                # the subtree of the version selected by the top frame failed, `returning` is its conflict set
+                if not stack:
+                    self._searching = False
+                    return None
+                frame = stack[-1]
+                self._deselect(frame)
+                self.stats.backtracks += 1
+                if frame.package_name not in returning:
+                    # the failure doesn't depend on the package, none of its remaining versions could fix it.
+                    self.stats.backjumps += 1
+                    self.stats.pruned_by_backjump += len(frame.versions) - frame.next
+                    frontier.undo(frame.mark)
+                    stack.pop()
+                    continue
+                frame.conflict_set |= returning - {frame.package_name}
+                self._returning = None
+            elif self._expand:
+                if frontier.empty():
+                    self._searching = False
+                    return list(selected)
+                stack.append(self._frame(frontier))
+
+            frame = stack[-1]
+            self._expand = self._select_next(frame)
+            if not self._expand:
+                frontier.undo(frame.mark)
+                if frame.conflict_set:
+                    self.nogoods.learn({package_name: selected_indexes[package_name]
+                                        for package_name in frame.conflict_set})
+                    self.stats.nogoods_learned += 1
+                stack.pop()
+                self._returning = frame.conflict_set
+
+    def _deselect(self, frame: SearchFrame):
+        """
+        undo the selection of the current version of the package of the frame
+        """
+        self._frontier.undo(frame.branch)
+        self.allowed.undo(frame.allowed_mark)
+        del self._selected_indexes[frame.package_name]
+        self._selected.pop()
+
+    def _split(self, count: int, max_depth: int) -> list[list[PackageVersion]]:
+        """
+        split the search tree into the subtrees of the selections of its top levels, in the order the search tries
+        them. It is cut one level deeper until there are `count` of them, or `max_depth` levels.
+        """
+        prefixes: list[list[PackageVersion]] = []
+        for depth in range(1, max_depth + 1):
+            self._start_search()
+            prefixes = []
+            self._expand_prefixes(depth, prefixes)
+            if len(prefixes) >= count:
+                break
+        self._searching = False
+        return prefixes
+
+    def _expand_prefixes(self, depth: int, prefixes: list[list[PackageVersion]]):
+        if depth == 0 or self._frontier.empty():
+            prefixes.append(list(self._selected))
+            return
+        frame = self._frame(self._frontier)
+        while self._select_next(frame):
+            self._expand_prefixes(depth - 1, prefixes)
+            self._deselect(frame)
+        self._frontier.undo(frame.mark)
+
+    def _replay(self, prefix: list[PackageVersion]):
+        """
+        start a search which only explores the subtree of a selection made by `_split`
+        """
+        self.stats = SolverStats()
+        self._budget(None, None)
+        self._start_search()
+        for package_version in prefix:
+            frame = self._frame(self._frontier)
+            if frame.package_name != package_version.name or package_version.version not in frame.versions:
+                raise ValueError(f"{package_version} isn't the next selection of the search")
+            # the version interned by this reference, `prefix` may come from another process
+            frame.versions = [version for version in frame.versions if version == package_version.version]
+            self._stack.append(frame)
+            if not self._select_next(frame):
+                raise ValueError(f"{package_version} isn't the next selection of the search")
 
-        if not unresolved_package.unresolved_dependencies:
-            # we find a solution.
-            solution.append(selected)
+    def _frame(self, frontier: UnresolvedDependencies) -> SearchFrame:
+        """
+        pop the next package to resolve from the frontier
+        """
+        mark = frontier.mark()
+        head = frontier.pop(self.package_order, self.allowed)
+        head_package = head.package_name
+        # the head has to be resolved for as long as the packages depending on it are selected
+        conflict_set = set(head.introduced_by)
+        for rejected, reason in self.allowed.rejections(head_package, head.versions):
+            self.stats.conflicts += len(rejected)
+            conflict_set |= reason
+        return SearchFrame(mark, head_package, self._ordered_versions(head_package, self._candidates(head)),
+                           conflict_set)
+
+    def _select_next(self, frame: SearchFrame) -> bool:
+        """
+        select the next version of the package of the frame which passes the nogoods and the forward check
+        :return: False if there is no such version left
+        """
+        selected_indexes = self._selected_indexes
+        while frame.next < len(frame.versions):
+            head_version = frame.versions[frame.next]
+            frame.next += 1
+            reason = self.nogoods.conflict(selected_indexes, frame.package_name, head_version.index)
+            if reason is not None:
+                self.stats.pruned_by_nogood += 1
+                self.stats.conflicts += 1
+                frame.conflict_set |= reason
+                continue
+
+            chosen_one = PackageVersion(frame.package_name, head_version)
+            indirect_dep = self._choose_new(chosen_one)
+            allowed_mark = self.allowed.mark()
+            reason = self._forward_check(chosen_one, indirect_dep)
+            if reason is not None:
+                self.allowed.undo(allowed_mark)
+                self.stats.conflicts += 1
+                frame.conflict_set |= reason
+                continue
+
+            self.stats.nodes += 1
+            self._selected.append(chosen_one)
+            self.stats.max_depth = max(self.stats.max_depth, len(self._selected))
+            selected_indexes[frame.package_name] = head_version.index
+            frame.allowed_mark = allowed_mark
+            frame.branch = self._frontier.mark()
+            self._update_unresolved(chosen_one, indirect_dep, self._frontier)
+            if len(self._selected) > len(self._best[0]):
+                self._best = (list(self._selected), [ud.package_name for ud in self._frontier.unresolved()])
+            return True
+        return False
+
+    def _exceeded(self) -> Optional[str]:
+        """
+        :return: which budget of the search ran out, None if neither did
+        """
+        if self._node_limit is not None and self.stats.nodes >= self._node_limit:
+            return NODE_BUDGET
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return TIME_BUDGET
+        if self._cancelled is not None and self._cancelled():
+            return CANCELLED
+        return None
+
+    def _candidates(self, head: UnresolvedDependency) -> VersionSet:
+        """
+        :return: versions of the head accepted by all selected packages
+        """
+        allowed_versions = self.allowed.get(head.package_name)
+        if allowed_versions is None:
+            return head.versions
+        return head.versions & allowed_versions
+
+    def _forward_check(self, chosen_one: PackageVersion, indirect_dep: VersionDependency) -> Optional[set[PackageName]]:
+        """
+        narrow the allowed versions of the dependencies of `chosen_one`
+        :return: names of the selected packages which, together with `chosen_one`, leave one of its dependencies
+                 without any allowed version; None if every dependency still has one
+        """
+        if indirect_dep is None:
+            return None
+        for package_name, versions in indirect_dep.versions.items():
+            pinned = self._pinned.get(package_name)
+            if pinned is not None:
+                if pinned.version not in versions:
+                    # a pinned version never changes during the search, no selected package is to blame
+                    return set()
+                continue
+            selected_index = self._selected_indexes.get(package_name)
+            if selected_index is not None:
+                if not (versions.bits >> selected_index) & 1:
+                    return {package_name}
+                continue
+            if not self.allowed.narrow(package_name, versions, chosen_one.name):
+                self.stats.wipeouts += 1
+                return self.allowed.constrained_by(package_name) - {chosen_one.name}
+        return None
+
+    def _ordered_versions(self, package_name: PackageName, versions: VersionSet) -> list[InternedVersion]:
+        if self.version_order == NEWEST_FIRST:
+            ordered_versions = list(versions)[::-1]
         else:
-            # head is current candidate, tail is the next unresolved collection.
-            head, tail = unresolved_package.unresolved_dependencies[0], unresolved_package.unresolved_dependencies[1:]
-            head_package = head.package_name
-            if not self.manifest.contain_package(head_package):
-                self._update_metadata(head_package)
-            for head_version in head.versions:
-                # package_version_dependencies = self.manifest.package_dependencies(head_package)
-                # for version_name, version_dependency in package_version_dependencies.version_dependencies.items():
-                chosen_one = PackageVersion(head_package, head_version)
-                if self._compatible(selected, chosen_one):
-                    selected_new = selected + [chosen_one]
-                    indirect_dep = self._choose_new(chosen_one)
-                    unresolved_new = self._copy_and_update_unresolved(indirect_dep, UnresolvedDependencies(tail))
-                    self._do_compile(solution, selected_new, unresolved_new)
-        return []
+            ordered_versions = versions.listed()
+        preferred_version = self.preferred_versions.get(package_name)
+        if preferred_version is not None and preferred_version in versions:
+            # the interned version of the package, a preferred version may come from a lockfile
+            preferred_version = versions.table.versions[versions.table.index(preferred_version)]
+            ordered_versions.remove(preferred_version)
+            ordered_versions.insert(0, preferred_version)
+        return ordered_versions
 
     def _choose_new(self, chosen_one: PackageVersion) -> VersionDependency:
         if not self.manifest.contain_package_version(chosen_one):
-            version_name = format_npm(str(chosen_one.version))
-            self._update_metadata(chosen_one.name, NpmSpec(version_name))
+            return self._build_version_dependency(chosen_one.name, str(chosen_one.version))
         return self.manifest.package_version_dependencies(chosen_one)
 
-    def _copy_and_update_unresolved(self,
-                                    indirect_dep: VersionDependency,
-                                    unresolved: UnresolvedDependencies) -> UnresolvedDependencies:
-        unresolved_new = unresolved.deep_copy()
+    def _update_unresolved(self,
+                           chosen_one: PackageVersion,
+                           indirect_dep: VersionDependency,
+                           unresolved: UnresolvedDependencies):
         if indirect_dep is None:
             # it means the package doesn't have any indirect dependency.
-            return unresolved_new
+            return
         unresolved_indirect_deps: list[UnresolvedDependency] = []
-        for version, deps in indirect_dep.versions.items():
-            unresolved_indirect_deps.append(UnresolvedDependency(version, deps))
-        unresolved_new.add_unresolved_dependencies(unresolved_indirect_deps)
-        return unresolved_new
-
-    def _compatible(self, selected: list[PackageVersion], dep: PackageVersion) -> bool:
-        for current in selected:
-            if not self._single_compatible(current, dep):
-                return False
-        return True
+        for package_name, deps in indirect_dep.versions.items():
+            if package_name in self._selected_indexes or package_name in self._pinned:
+                # dependencies on selected and pinned packages are checked by `_forward_check`
+                continue
+            unresolved_indirect_deps.append(UnresolvedDependency(package_name, deps, {chosen_one.name}))
+        unresolved.add_unresolved_dependencies(unresolved_indirect_deps)
+        if self.prefetcher is not None:
+            self._request_prefetch(unresolved_indirect_deps)
 
     def _single_compatible(self, current: PackageVersion, dep: PackageVersion) -> bool:
-        if not self.manifest.contain_package(current.name):
+        if not self.manifest.contain_package_version(current):
             try:
-                self._update_metadata(current.name)
+                self._build_version_dependency(current.name, str(current.version))
             except Exception:
                 print(f"failed to update metadata for {current}")
         return self.manifest.compatible(current, dep)
 
     def _update_metadata(self, package_name: PackageName,
-                         npm_spec: NpmSpec = NpmSpec("")) -> None:
-        metadata = self.get_metadata(package_name)
-        self._init_new_dependencies(metadata)
-        versions: dict = metadata["versions"]
-        for version_name, version_metadata in versions.items():
+                         npm_spec: NpmSpec = parse_npm_spec("")) -> None:
+        """
+        build the dependency tables of the versions of the package matching `npm_spec`.
+        The solver doesn't need it, it builds the table of a version when it is tried.
+        """
+        table = self.version_table(package_name)
+        for version_name, version in table.names.items():
             if self.manifest.contain_package_version(PackageVersion(package_name, version_name)):
                 print(f"skipping {version_name}")
                 continue
-            if Version(version_name) not in npm_spec:
+            if version not in npm_spec:
                 continue
+            self._build_version_dependency(package_name, version_name)
 
-            if self._is_empty_dependency(version_metadata):
-                self.manifest.update(package_name, version_name, VersionDependency({}))
-            else:
-                dependencies: dict = version_metadata["dependencies"]
-                version_dependency: VersionDependency = VersionDependency({})
-                for dependency_name, npm_version_str in dependencies.items():
-                    if self.debug:
-                        print(f"updated metadata for ({dependency_name}-{npm_version_str}) for ({package_name}), count = {self.manifest.inc_count()}")
-                    npm_version = NpmSpec(format_npm(npm_version_str))
-                    dependency_versions = self.package_versions(dependency_name)
-                    compatible_versions = [dependency_version.version
-                                           for dependency_version in dependency_versions
-                                           if dependency_version.version in npm_version]
-                    if not self.manifest.contain_package(dependency_name):
-                        version_dependency.update(dependency_name, compatible_versions)
-                self.manifest.update(package_name, version_name, version_dependency)
+    def _build_version_dependency(self, package_name: PackageName, version_name: VersionName) -> VersionDependency:
+        """
+        build the dependency table of a single version, only the packuments of its own dependencies are fetched.
+        The versions with the same raw dependencies share their table.
+        """
+        version_metadata: dict = self.get_metadata(package_name)["versions"][version_name]
+        dependencies: dict = {} if self._is_empty_dependency(version_metadata) else version_metadata["dependencies"]
+        # flat, a tuple per dependency would take more memory than the table
+        ranges = tuple(itertools.chain.from_iterable(dependencies.items()))
+        if dependencies:
+            self._prefetch_metadata(set(dependencies))
+        version_dependency = self.manifest.shared(ranges)
+        if version_dependency is None:
+            version_dependency = VersionDependency({})
+            for dependency_name, npm_version_str in dependencies.items():
+                if self.debug:
+                    print(f"updated metadata for ({dependency_name}-{npm_version_str}) for ({package_name}), count = {self.manifest.inc_count()}")
+                compatible_versions = self.matching_versions(dependency_name, npm_version_str)
+                version_dependency.update(dependency_name, compatible_versions)
+            self.manifest.share(ranges, version_dependency)
+        self.manifest.update(package_name, version_name, version_dependency)
+        self.metadata_stats.version_tables += 1
+        return version_dependency
 
     def _is_empty_dependency(self, version_metadata) -> bool:
         assert isinstance(version_metadata, dict)
@@ -255,24 +1096,68 @@ class YarnReference(Reference):
         dependencies: dict = version_metadata["dependencies"]
         return not dependencies
 
-    def _init_new_dependencies(self, metadata: dict):
-        from .utils import parse_all_dependency_name
-        all_dependency_name = parse_all_dependency_name(metadata)
-        new_dependencies = [dependency_name
-                            for dependency_name in all_dependency_name
-                            if dependency_name not in self.package_version_cache]
-        dataset = download_with_cache(set(new_dependencies))
-        for package_name, package_data in dataset.items():
-            self.package_version_cache[package_name] = json.loads(package_data)
+    def _prefetch_metadata(self, package_names: set[PackageName]):
+        """
+        load the missing packuments from the metadata store, the stale and unknown ones are fetched in parallel
+        """
+        new_package_names = {package_name
+                             for package_name in package_names
+                             if package_name not in self.package_version_cache}
+        self.metadata_stats.cache_hits += len(package_names) - len(new_package_names)
+        self.metadata_stats.cache_misses += len(new_package_names)
+        if not new_package_names:
+            return
+        start = time.perf_counter()
+        self._load_metadata(new_package_names)
+        duration = time.perf_counter() - start
+        self.metadata_seconds += duration
+        # the work is counted by the spans of the packuments themselves
+        self.tracer.add("metadata", NETWORK, start, duration, 0.0, packages=len(new_package_names))
+
+    def _load_metadata(self, package_names: set[PackageName]):
+        packuments, loaded = self.cache.get(package_names, self._load_packages, self.max_age)
+        self.package_version_cache.update(packuments)
+        self.metadata_stats.shared += len(packuments) - len(loaded)
+        for package in loaded.values():
+            self.metadata_stats.packuments += 1
+            self.metadata_stats.bytes += package.size
+            if package.source in (FROM_STORE, NOT_MODIFIED):
+                self.metadata_stats.stored += 1
+
+    def _load_packages(self, package_names: set[PackageName]) -> dict[PackageName, StoredPackage]:
+        """
+        load the packuments missing from the shared cache, the prefetched ones are taken from the prefetcher
+        """
+        packages: dict[PackageName, StoredPackage] = {}
+        if self.prefetcher is not None:
+            packages = self.prefetcher.take(package_names)
+            self.metadata_stats.prefetched += len(packages)
+        missing = package_names - set(packages)
+        if missing:
+            packages.update(self._fetch_packages(missing))
+        return packages
+
+    def _fetch_packages(self, package_names: set[PackageName]) -> dict[PackageName, StoredPackage]:
+        """
+        load packuments without caching them, it is called by the threads of the prefetcher too
+        """
+        return load_packages(package_names, self.store, self.client, self.max_age, tracer=self.tracer)
+
+    def _request_prefetch(self, unresolved_dependencies: list[UnresolvedDependency]):
+        """
+        ask the prefetcher for the packuments which the first candidates of packages just added to the frontier
+        depend on, the ones of the first candidate first
+        """
+        for unresolved_dependency in unresolved_dependencies:
+            package_name = unresolved_dependency.package_name
+            versions: dict = self.package_version_cache[package_name]["versions"]
+            candidates = self._ordered_versions(package_name, unresolved_dependency.versions)
+            for priority, version in enumerate(candidates[:PREFETCH_CANDIDATES]):
+                dependencies = versions.get(str(version), {}).get("dependencies") or {}
+                self.prefetcher.request([dependency_name for dependency_name in dependencies
+                                         if dependency_name not in self.package_version_cache
+                                         and dependency_name not in self.cache], priority)
 
     def get_metadata(self, name: PackageName) -> dict:
-        if name not in self.package_version_cache:
-            url = f"https://registry.yarnpkg.com/{name}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                raise ValueError(f"error fetching package info {url}")
-            package_info = json.loads(response.content)
-            self.package_version_cache[name] = package_info
-        else:
-            package_info = self.package_version_cache[name]
-        return package_info
+        self._prefetch_metadata({name})
+        return self.package_version_cache[name]
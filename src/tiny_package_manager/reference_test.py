@@ -1,8 +1,14 @@
+import json
+import pickle
+import sys
 import unittest
 
 from semantic_version import Version, NpmSpec
 
-from .reference import JsonReference, PackageVersion, YarnReference
+from .base import InternedVersion, VersionTable
+from .reference import (FEWEST_VERSIONS_FIRST, NEWEST_FIRST, NODE_BUDGET, TIME_BUDGET, JsonReference, PackageVersion,
+                        UnresolvedDependencies, UnresolvedDependency, YarnReference)
+from .tracing import TraceRecorder
 
 
 class ReferenceTestCases(unittest.TestCase):
@@ -15,6 +21,68 @@ class ReferenceTestCases(unittest.TestCase):
                              PackageVersion("jest", Version("1.1.1"))]
         self.assertEqual(sorted(versions), sorted(expected_versions))
 
+    def test_unresolved_dependencies_undo(self):
+        express = VersionTable("express", ["0.0.1"])
+        babel = VersionTable("babel", ["0.0.1", "0.0.2"])
+        vows = VersionTable("vows", ["0.5.5"])
+        unresolved = UnresolvedDependencies([UnresolvedDependency("express", express.all()),
+                                             UnresolvedDependency("babel", babel.version_set([Version("0.0.2")]))])
+        mark = unresolved.mark()
+        self.assertEqual(unresolved.pop_head().package_name, "express")
+        unresolved.add_unresolved_dependencies([
+            UnresolvedDependency("babel", babel.version_set([Version("0.0.1")]), {"express"}),
+            UnresolvedDependency("vows", vows.all(), {"express"})])
+        self.assertEqual([ud.package_name for ud in unresolved.unresolved_dependencies[unresolved.start:]],
+                         ["babel", "vows"])
+        self.assertEqual(unresolved.head().versions, babel.all())
+        self.assertEqual(unresolved.head().introduced_by, {"express"})
+
+        unresolved.undo(mark)
+        self.assertEqual([ud.package_name for ud in unresolved.unresolved_dependencies], ["express", "babel"])
+        self.assertEqual(list(unresolved.unresolved_dependencies[1].versions), [Version("0.0.2")])
+        self.assertEqual(unresolved.unresolved_dependencies[1].introduced_by, set())
+
+    def test_version_set(self):
+        table = VersionTable("express", ["0.14.1", "1.0.0", "0.14.0", "0.0.1"])
+        self.assertEqual(table.versions, [Version("0.0.1"), Version("0.14.0"), Version("0.14.1"), Version("1.0.0")])
+        old = table.version_set([Version("0.0.1"), Version("0.14.0"), Version("0.14.1")])
+        new = table.version_set([Version("0.14.1"), Version("1.0.0")])
+        self.assertEqual(list(old & new), [Version("0.14.1")])
+        self.assertEqual(list(old | new), table.versions)
+        self.assertEqual(list(old - new), [Version("0.0.1"), Version("0.14.0")])
+        self.assertFalse((old - new) & new)
+        self.assertIn(Version("0.14.0"), old)
+        self.assertNotIn(Version("0.14.0"), new)
+        self.assertNotIn(Version("2.0.0"), new)
+        self.assertEqual(len(old), 3)
+        # the order of the registry is kept for the solver
+        self.assertEqual(old.listed(), [Version("0.14.1"), Version("0.14.0"), Version("0.0.1")])
+        with self.assertRaises(ValueError):
+            old & VersionTable("babel", ["0.0.1"]).all()
+
+    def test_interned_version(self):
+        table = VersionTable("express", ["1.0.0", "0.14.0", "1.0.0-rc.1"])
+        version = table.version("1.0.0")
+        # parsed once, ordered by its index
+        self.assertIs(table.versions[version.index], version)
+        self.assertEqual([version.index for version in table.versions], [0, 1, 2])
+        self.assertLess(table.version("1.0.0-rc.1"), version)
+        self.assertEqual(str(table.version("1.0.0-rc.1")), "1.0.0-rc.1")
+        # and still a version
+        self.assertEqual(version, Version("1.0.0"))
+        self.assertEqual(hash(version), hash(Version("1.0.0")))
+        self.assertGreater(version, Version("0.14.0"))
+        self.assertIn(Version("1.0.0"), table.all())
+        # versions of another package are compared as versions
+        other = VersionTable("babel", ["1.0.0"]).version("1.0.0")
+        self.assertEqual(other, version)
+        self.assertIsInstance(version, InternedVersion)
+
+        copy = pickle.loads(pickle.dumps(table))
+        self.assertEqual(copy.versions, table.versions)
+        self.assertIs(copy.version("1.0.0").table, copy)
+        self.assertIn(copy.version("1.0.0"), copy.version_set([Version("1.0.0")]))
+
     def test_yarn_reference(self):
         direct_dependencies = {
             "express": "",
@@ -59,6 +127,133 @@ class ReferenceTestCases(unittest.TestCase):
                              PackageVersion("eyes", Version("0.1.6"))])
         self.assertEqual(expected_solution, solution)
 
+    def test_compile_backjumping(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {
+            "a": "*",
+            "i": "*",
+        }
+        self.assertIsNone(reference.compile())
+        # `a` has nothing to do with the conflict between `c` and `d`, its other versions are skipped
+        self.assertEqual(reference.stats.nodes, 2)
+        # choosing c-1.0.0 leaves no version of `d`, which is found before `d` is expanded
+        self.assertEqual(reference.stats.wipeouts, 1)
+        self.assertEqual(reference.stats.backjumps, 1)
+        self.assertEqual(reference.stats.pruned_by_backjump, 4)
+
+    def test_compile_nogood(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {
+            "e": "*",
+        }
+        solution = reference.compile()
+        self.assertIsNotNone(solution)
+        self.assertEqual([str(pv) for pv in solution],
+                         ["(e:1.0.0)", "(a:1.0.1)", "(b:1.0.1)", "(h:1.0.0)"])
+        # b-1.0.0 failed under a-1.0.0 regardless of `a`, so it isn't searched again under a-1.0.1
+        self.assertEqual(reference.stats.pruned_by_nogood, 1)
+
+    def test_compile_heuristics(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {
+            "a": "*",
+            "c": "*",
+        }
+        solution = reference.compile(package_order=FEWEST_VERSIONS_FIRST)
+        self.assertEqual([str(pv) for pv in solution], ["(c:1.0.0)", "(d:2.0.0)", "(a:1.0.0)"])
+
+        solution = reference.compile(version_order=NEWEST_FIRST)
+        self.assertEqual([str(pv) for pv in solution], ["(a:1.0.4)", "(c:1.0.0)", "(d:2.0.0)"])
+
+        solution = reference.compile(version_order=NEWEST_FIRST, preferred_versions={"a": Version("1.0.2")})
+        self.assertEqual([str(pv) for pv in solution], ["(a:1.0.2)", "(c:1.0.0)", "(d:2.0.0)"])
+
+        with self.assertRaises(ValueError):
+            reference.compile(package_order="random")
+
+    def test_fewest_versions_allowed(self):
+        reference = offline_reference(NARROWED_REFERENCE)
+        reference.direct_dependencies = {"a": "*", "b": "*"}
+        # `x` is depended on with `*` but `b` only allows one of its versions, so it has fewer candidates than `y`
+        solution = reference.compile(package_order=FEWEST_VERSIONS_FIRST)
+        self.assertEqual([str(pv) for pv in solution], ["(a:1.0.0)", "(b:1.0.0)", "(x:1.0.0)", "(y:1.0.0)"])
+
+    def test_compile_budget(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {
+            "e": "*",
+        }
+        recorder = TraceRecorder()
+        reference.tracer.hooks.append(recorder)
+        self.assertIsNone(reference.compile(max_nodes=3))
+        partial = reference.partial
+        self.assertEqual(partial.reason, NODE_BUDGET)
+        self.assertEqual([str(pv) for pv in partial.selected], ["(e:1.0.0)", "(a:1.0.0)", "(b:1.0.0)"])
+        self.assertEqual(partial.unresolved, ["c", "d"])
+        self.assertEqual(reference.stats.nodes, 3)
+
+        # the search goes on where it stopped, the nodes aren't searched again
+        solution = reference.resume()
+        self.assertEqual([str(pv) for pv in solution], ["(e:1.0.0)", "(a:1.0.1)", "(b:1.0.1)", "(h:1.0.0)"])
+        self.assertIsNone(reference.partial)
+        self.assertEqual(reference.stats.pruned_by_nogood, 1)
+        # the resumed slice is timed like a compilation
+        self.assertEqual([span.name for span in recorder.spans if span.name == "compile"], ["compile", "compile"])
+        self.assertEqual(recorder.last_metrics["solver"]["nodes"], reference.stats.nodes)
+        self.assertEqual(recorder.last_metrics["seconds"]["total"], reference.elapsed)
+        with self.assertRaises(ValueError):
+            reference.resume()
+
+        self.assertIsNone(reference.compile(max_seconds=0))
+        self.assertEqual(reference.partial.reason, TIME_BUDGET)
+
+    def test_compile_deep(self):
+        # more packages are selected at once than the recursion limit
+        names = [f"p{idx}" for idx in range(2 * sys.getrecursionlimit())]
+        registry = {name: {"1.0.0": {dependency: "*"}} for name, dependency in zip(names, names[1:])}
+        registry[names[-1]] = {"1.0.0": {}}
+        reference = offline_reference(json.dumps(registry))
+        reference.direct_dependencies = {names[0]: "*"}
+        self.assertEqual(len(reference.compile()), len(names))
+
+    def test_compile_lazy_metadata(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference.direct_dependencies = {
+            "a": "*",
+            "d": "*",
+        }
+        self.assertEqual([str(pv) for pv in reference.compile()], ["(a:1.0.0)", "(d:1.0.0)"])
+        # only the versions which were tried have a dependency table
+        self.assertEqual(reference.metadata_stats.version_tables, 2)
+        self.assertFalse(reference.manifest.contain_package_version(PackageVersion("a", Version("1.0.1"))))
+
+    def test_matching_versions_cache(self):
+        reference = offline_reference(BACKJUMPING_REFERENCE)
+        reference._update_metadata("b")
+        reference._update_metadata("i")
+        # b-1.0.0 and i-1.0.0 have the same ranges of `c` and `d`, they share their table
+        info = reference.matching_versions.cache_info()
+        self.assertEqual(info.misses, 3)
+        self.assertEqual(info.hits, 0)
+        self.assertIs(reference.manifest.package_version_dependencies(PackageVersion("b", Version("1.0.0"))),
+                      reference.manifest.package_version_dependencies(PackageVersion("i", Version("1.0.0"))))
+        self.assertEqual(len(reference.manifest.tables), 2)
+
+
+def offline_reference(conf: str) -> YarnReference:
+    """
+    a YarnReference whose metadata cache is filled with packuments, so it never touches the registry
+    """
+    reference = YarnReference()
+    packages = json.loads(conf)
+    for package_name, package_info in packages.items():
+        reference.package_version_cache[package_name] = {
+            "name": package_name,
+            "versions": {version_name: {"dependencies": dependencies}
+                         for version_name, dependencies in package_info.items()}
+        }
+    return reference
+
 JSON_REFERENCE = """
 {
 	"jest": {
@@ -102,5 +297,26 @@ COMPILE_REFERENCE = """
 }
 """
 
+BACKJUMPING_REFERENCE = """
+{
+  "a": {"1.0.0": {}, "1.0.1": {}, "1.0.2": {}, "1.0.3": {}, "1.0.4": {}},
+  "b": {"1.0.0": {"c": "1.x", "d": "1.x"}, "1.0.1": {"h": "1.x"}},
+  "c": {"1.0.0": {"d": "2.x"}},
+  "d": {"1.0.0": {}, "2.0.0": {}},
+  "e": {"1.0.0": {"a": "1.0.0 || 1.0.1", "b": "*"}},
+  "h": {"1.0.0": {"a": "1.0.1"}},
+  "i": {"1.0.0": {"c": "1.x", "d": "1.x"}}
+}
+"""
+
+NARROWED_REFERENCE = """
+{
+  "a": {"1.0.0": {"x": "*", "y": "*"}},
+  "b": {"1.0.0": {"x": "1.0.0"}},
+  "x": {"1.0.0": {}, "1.1.0": {}, "1.2.0": {}},
+  "y": {"1.0.0": {}, "1.1.0": {}}
+}
+"""
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,274 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent import futures
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .integrity import Integrity, IntegrityError
+
+REGISTRY_URL = "https://registry.yarnpkg.com"
+
+# abbreviated packument: only the fields needed to install, without readmes and per-version package.json noise
+ABBREVIATED = "application/vnd.npm.install-v1+json"
+ABBREVIATED_ACCEPT = f"{ABBREVIATED}; q=1.0, application/json; q=0.8, */*"
+FULL_ACCEPT = "application/json"
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# status codes worth retrying, the registry uses them for rate limiting and transient failures
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class HostLimiter(object):
+    """
+    bound the concurrent requests to one host, and slow down while the host is telling us to back off
+    """
+
+    def __init__(self, max_concurrency: int, max_delay: float):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.max_delay = max_delay
+        # delay before every request, doubled on each throttled response and halved on each successful one
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        delay = self.delay
+        if delay > 0:
+            time.sleep(delay)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.semaphore.release()
+
+    def throttled(self, retry_after: Optional[float], base_delay: float) -> float:
+        """
+        :return: the delay before retrying
+        """
+        with self.lock:
+            self.delay = min(self.max_delay, max(base_delay, self.delay * 2))
+            delay = self.delay if retry_after is None else min(self.max_delay, retry_after)
+        # jitter, so the retries of concurrent requests don't hit the host at the same time
+        return delay * (0.5 + random.random() / 2)
+
+    def succeeded(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > 0.01 else 0.0
+
+
+class RegistryClient(object):
+    """
+    the only way to talk to the registry: a pooled keep-alive session with bounded per-host concurrency,
+    timeouts, gzip transfer, and retries with backoff on 429/5xx.
+    """
+
+    def __init__(self,
+                 registry_url: str = REGISTRY_URL,
+                 max_connections: int = 16,
+                 max_per_host: int = 8,
+                 timeout: float = 30.0,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 abbreviated: bool = True):
+        """
+        :param registry_url: base url of the registry
+        :param max_connections: size of the connection pool, and of the thread pool of the batch API
+        :param max_per_host: concurrent requests allowed to a single host
+        :param timeout: connect and read timeout of every request, in seconds
+        :param retries: retries of a request answered with 429/5xx or failed with a connection error
+        :param backoff: first delay before a retry, in seconds, doubled on every retry
+        :param max_backoff: bound of the delay before a retry
+        :param abbreviated: ask for abbreviated packuments, falling back to the full ones if the registry refuses
+        """
+        self.registry_url = registry_url.rstrip("/")
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.abbreviated = abbreviated
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip"
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="registry")
+
+        self._limiters: dict[str, HostLimiter] = {}
+        self._limiters_lock = threading.Lock()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def packument_url(self, name: str) -> str:
+        return f"{self.registry_url}/{name}"
+
+    def tarball_url(self, name: str, version: str) -> str:
+        # scoped packages are stored as @scope/name/-/name-version.tgz
+        base_name = name.split("/")[-1]
+        return f"{self.registry_url}/{name}/-/{base_name}-{version}.tgz"
+
+    def get(self, url: str, headers: Optional[dict[str, str]] = None, stream: bool = False) -> requests.Response:
+        """
+        send a GET request, retrying throttled and failed ones. The response may be any status code but 429/5xx,
+        unless the retries are exhausted.
+        """
+        limiter = self._limiter(url)
+        attempt = 0
+        while True:
+            try:
+                with limiter:
+                    response = self.session.get(url, headers=headers, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                # the host didn't ask us to slow down, only this request waits
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    limiter.succeeded()
+                return response
+            response.close()
+            time.sleep(limiter.throttled(self._retry_after(response), self.backoff * 2 ** attempt))
+            attempt += 1
+
+    def fetch(self, url: str, headers: Optional[dict[str, str]] = None) -> bytes:
+        response = self.get(url, headers=headers)
+        if response.status_code != 200:
+            raise ValueError(f"error fetching {url}")
+        return response.content
+
+    def download(self,
+                 url: str,
+                 path: str,
+                 integrity: Optional[Integrity] = None,
+                 chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> int:
+        """
+        stream `url` into a temporary file next to `path`, hashing the chunks as they arrive. The file is renamed to
+        `path` once complete and verified, so `path` never holds a partial or corrupt download.
+
+        :return: bytes downloaded
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        verifier = integrity.verifier() if integrity is not None else None
+        with self.get(url, stream=True) as response:
+            if response.status_code != 200:
+                raise ValueError(f"error fetching {url}")
+            # the announced length is the encoded one if the transfer is compressed
+            expected = -1 if "Content-Encoding" in response.headers else int(response.headers.get("Content-Length", -1))
+            size = 0
+            fd, temporary = tempfile.mkstemp(dir=directory, prefix=".download-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as writer:
+                    for chunk in response.iter_content(chunk_size):
+                        size += len(chunk)
+                        if 0 <= expected < size:
+                            raise IntegrityError(f"{url}: more than the {expected} bytes announced")
+                        if verifier is not None:
+                            verifier.update(chunk)
+                        writer.write(chunk)
+                if 0 <= expected != size:
+                    raise IntegrityError(f"{url}: truncated to {size} of {expected} bytes")
+                if verifier is not None:
+                    verifier.verify(url)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        return size
+
+    def fetch_many(self, urls: Iterable[str], headers: Optional[dict[str, str]] = None) -> dict[str, bytes]:
+        """
+        fetch urls concurrently, bounded by the pool size and by the per-host concurrency
+        """
+        future_to_url = {self.executor.submit(self.fetch, url, headers): url for url in set(urls)}
+        return {future_to_url[future]: future.result() for future in futures.as_completed(future_to_url)}
+
+    def get_packument(self,
+                      name: str,
+                      headers: Optional[dict[str, str]] = None,
+                      stream: bool = False) -> requests.Response:
+        """
+        GET the packument, abbreviated if possible. Both forms have `versions[*].dependencies`.
+
+        :param headers: extra headers, the validators of a conditional request for instance
+        :param stream: leave the body unread, see `packument.stream_packument`
+        """
+        url = self.packument_url(name)
+        if self.abbreviated:
+            response = self.get(url, headers={**(headers or {}), "Accept": ABBREVIATED_ACCEPT}, stream=stream)
+            if response.status_code not in (406, 415):
+                return response
+            response.close()
+        return self.get(url, headers={**(headers or {}), "Accept": FULL_ACCEPT}, stream=stream)
+
+    def fetch_packument(self, name: str) -> bytes:
+        response = self.get_packument(name)
+        if response.status_code != 200:
+            raise ValueError(f"error fetching package info {self.packument_url(name)}")
+        return response.content
+
+    def fetch_packuments(self, names: Iterable[str]) -> dict[str, bytes]:
+        future_to_name = {self.executor.submit(self.fetch_packument, name): name for name in set(names)}
+        return {future_to_name[future]: future.result() for future in futures.as_completed(future_to_name)}
+
+    def fetch_tarball(self, name: str, version: str) -> bytes:
+        return self.fetch(self.tarball_url(name, version))
+
+    def fetch_tarballs(self, packages: Iterable[tuple[str, str]]) -> dict[tuple[str, str], bytes]:
+        """
+        :param packages: (name, version) of the tarballs
+        """
+        url_to_package = {self.tarball_url(name, version): (name, version) for name, version in packages}
+        return {url_to_package[url]: data for url, data in self.fetch_many(url_to_package).items()}
+
+    def _limiter(self, url: str) -> HostLimiter:
+        host = urlsplit(url).netloc
+        with self._limiters_lock:
+            if host not in self._limiters:
+                self._limiters[host] = HostLimiter(self.max_per_host, self.max_backoff)
+            return self._limiters[host]
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return None
+
+
+_default_client: Optional[RegistryClient] = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> RegistryClient:
+    """
+    the client shared by everything which isn't given one explicitly
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = RegistryClient()
+        return _default_client
@@ -0,0 +1,240 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .metadata import MetadataStore
+from .packument import parse_packument
+from .reference import YarnReference
+from .integrity import Integrity, IntegrityError
+from .registry import ABBREVIATED, RegistryClient
+from .utils import format_name, download
+
+
+# fields of a version kept by the abbreviated packument
+ABBREVIATED_FIELDS = ("name", "version", "dependencies", "optionalDependencies", "peerDependencies",
+                      "bundleDependencies", "bin", "directories", "engines", "os", "cpu", "dist", "deprecated")
+
+
+def abbreviate(package_data: bytes) -> bytes:
+    packument = json.loads(package_data)
+    return json.dumps({
+        "name": packument["name"],
+        "modified": packument.get("time", {}).get("modified"),
+        "dist-tags": packument.get("dist-tags", {}),
+        "versions": {version_name: {field: version_metadata[field]
+                                    for field in ABBREVIATED_FIELDS
+                                    if field in version_metadata}
+                     for version_name, version_metadata in packument.get("versions", {}).items()}
+    }, separators=(",", ":")).encode()
+
+
+class LocalRegistry(object):
+    """
+    a stand-in registry serving the `resources/` fixtures: packuments at /<name> and tarballs at /<name>/-/<file>.tgz
+    """
+
+    def __init__(self, root: str = "./resources", abbreviated: bool = True, refuse_abbreviated: bool = False):
+        """
+        :param abbreviated: serve abbreviated packuments to the clients asking for them, else always the full ones
+        :param refuse_abbreviated: answer 406 to the clients asking for abbreviated packuments
+        """
+        self.root = os.path.abspath(root)
+        self.abbreviated = abbreviated
+        self.refuse_abbreviated = refuse_abbreviated
+        # path -> number of requests
+        self.hits: dict[str, int] = {}
+        # path -> number of 429 responses to send before serving it
+        self.throttled: dict[str, int] = {}
+        # path -> number of responses to delay by `delay` seconds before serving it
+        self.slow: dict[str, int] = {}
+        self.delay = 0.0
+        self.gzipped = 0
+        # abbreviated packuments served
+        self.served_abbreviated = 0
+        # responses to conditional requests whose validators matched
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def file_path(self, path: str) -> str:
+        if "/-/" in path:
+            return os.path.join(self.root, path.split("/-/")[-1])
+        return os.path.join(self.root, format_name(path.lstrip("/")))
+
+    def _handler(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with registry.lock:
+                    registry.hits[self.path] = registry.hits.get(self.path, 0) + 1
+                    throttled = registry.throttled.get(self.path, 0)
+                    if throttled:
+                        registry.throttled[self.path] = throttled - 1
+                    slow = registry.slow.get(self.path, 0)
+                    if slow:
+                        registry.slow[self.path] = slow - 1
+                if slow:
+                    time.sleep(registry.delay)
+                if throttled:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                file_path = registry.file_path(self.path)
+                if not os.path.isfile(file_path):
+                    self.send_error(404)
+                    return
+                with open(file_path, "rb") as reader:
+                    data = reader.read()
+
+                content_type = "application/octet-stream" if "/-/" in self.path else "application/json"
+                if "/-/" not in self.path and ABBREVIATED in self.headers.get("Accept", ""):
+                    if registry.refuse_abbreviated:
+                        self.send_error(406)
+                        return
+                    if registry.abbreviated:
+                        data = abbreviate(data)
+                        content_type = ABBREVIATED
+                        with registry.lock:
+                            registry.served_abbreviated += 1
+
+                etag = f'"{hashlib.sha1(data).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with registry.lock:
+                        registry.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", formatdate(os.path.getmtime(file_path), usegmt=True))
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    data = gzip.compress(data)
+                    self.send_header("Content-Encoding", "gzip")
+                    with registry.lock:
+                        registry.gzipped += 1
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class RegistryClientTestCase(unittest.TestCase):
+    def test_fetch_packument(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url, abbreviated=False) as client:
+            data = client.fetch_packument("@jest/core")
+            with open("./resources/at_jest_core", "rb") as reader:
+                self.assertEqual(data, reader.read())
+            self.assertEqual(registry.gzipped, 1)
+
+    def test_fetch_abbreviated_packument(self):
+        with open("./resources/mongoose", "rb") as reader:
+            full = reader.read()
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client:
+            data = client.fetch_packument("mongoose")
+            self.assertEqual(registry.served_abbreviated, 1)
+            self.assertLess(len(data) * 3, len(full))
+            self.assertEqual(parse_packument(data), parse_packument(full))
+
+    def test_abbreviated_fallback(self):
+        with open("./resources/express", "rb") as reader:
+            full = reader.read()
+        with LocalRegistry(abbreviated=False) as registry, RegistryClient(registry.url) as client:
+            self.assertEqual(client.fetch_packument("express"), full)
+            self.assertEqual(registry.hits, {"/express": 1})
+        with LocalRegistry(refuse_abbreviated=True) as registry, RegistryClient(registry.url) as client:
+            self.assertEqual(client.fetch_packument("express"), full)
+            self.assertEqual(registry.hits, {"/express": 2})
+
+    def test_fetch_tarball(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client:
+            data = client.fetch_tarball("dayjs", "1.11.13")
+            with open("./resources/dayjs-1.11.13.tgz", "rb") as reader:
+                self.assertEqual(data, reader.read())
+
+    def test_download(self):
+        with open("./resources/dayjs-1.11.13.tgz", "rb") as reader:
+            data = reader.read()
+        with (LocalRegistry() as registry,
+              RegistryClient(registry.url) as client,
+              tempfile.TemporaryDirectory() as directory):
+            url = client.tarball_url("dayjs", "1.11.13")
+            path = os.path.join(directory, "dayjs.tgz")
+            self.assertEqual(client.download(url, path, Integrity.of(data), chunk_size=1024), len(data))
+            with open(path, "rb") as reader:
+                self.assertEqual(reader.read(), data)
+
+            os.remove(path)
+            with self.assertRaises(IntegrityError):
+                client.download(url, path, Integrity.of(b"something else", "sha1"))
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_missing(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client:
+            with self.assertRaises(ValueError):
+                client.fetch_packument("no-such-package")
+
+    def test_backoff(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url, backoff=0.01) as client:
+            registry.throttled["/express"] = 2
+            client.fetch_packument("express")
+            self.assertEqual(registry.hits["/express"], 3)
+
+    def test_read_timeout(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url, timeout=0.2, backoff=0.01) as client:
+            registry.slow["/express"] = 1
+            registry.delay = 0.5
+            client.fetch_packument("express")
+            self.assertEqual(registry.hits["/express"], 2)
+
+    def test_retries_exhausted(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url, retries=1, backoff=0.01) as client:
+            registry.throttled["/express"] = 5
+            with self.assertRaises(ValueError):
+                client.fetch_packument("express")
+            self.assertEqual(registry.hits["/express"], 2)
+
+    def test_fetch_many(self):
+        names = {"express", "debug", "ms", "qs", "mime"}
+        with LocalRegistry() as registry, RegistryClient(registry.url, max_per_host=2) as client:
+            dataset = download(names, client)
+            self.assertEqual(set(dataset), names)
+            self.assertEqual(sum(registry.hits.values()), len(names))
+
+    def test_reference(self):
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client:
+            reference = YarnReference(client=client, store=MetadataStore(":memory:"), max_age=0)
+            metadata = reference.get_metadata("express")
+            self.assertEqual(reference.get_metadata("express"), metadata)
+            self.assertEqual(registry.hits, {"/express": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
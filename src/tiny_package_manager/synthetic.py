@@ -0,0 +1,72 @@
+import random
+import time
+
+from .base import PackageName
+from .metadata import FROM_REGISTRY, MetadataStore, StoredPackage
+from .packument import VersionRanges
+from .reference import SPEC_CACHE_SIZE, YarnReference
+
+# name -> version -> dependency ranges, as in the packuments
+Registry = dict[PackageName, VersionRanges]
+
+
+def synthetic_registry(packages: int,
+                       versions: int,
+                       fan_out: int,
+                       conflict_density: float = 0.0,
+                       seed: int = 0) -> Registry:
+    """
+    generate a registry of `packages` packages named p0, p1... with the versions 1.0.0, 1.1.0... Every version
+    depends on `fan_out` packages whose names come after its own, so the dependency graph has no cycle.
+
+    :param conflict_density: probability of a dependency accepting only two consecutive versions instead of most
+           of them, such narrow ranges of different packages usually disagree and force the solver to backtrack
+    :param seed: the same parameters and seed always give the same registry
+    """
+    rng = random.Random(seed)
+    registry: Registry = {}
+    for idx in range(packages):
+        candidates = [f"p{dependency}" for dependency in range(idx + 1, packages)]
+        package_versions: VersionRanges = {}
+        for minor in range(versions):
+            dependencies = {}
+            for dependency_name in rng.sample(candidates, min(fan_out, len(candidates))):
+                pinned = rng.randrange(versions)
+                if rng.random() < conflict_density:
+                    dependencies[dependency_name] = f">=1.{pinned}.0 <1.{pinned + 2}.0"
+                else:
+                    # the newest half of the versions at least
+                    dependencies[dependency_name] = f">=1.{min(pinned, versions // 2)}.0"
+            package_versions[f"1.{minor}.0"] = dependencies
+        registry[f"p{idx}"] = package_versions
+    return registry
+
+
+class SyntheticReference(YarnReference):
+    """
+    a YarnReference reading its packuments from a generated registry, the solver runs end to end without the
+    network nor the metadata store
+    """
+
+    def __init__(self,
+                 registry: Registry,
+                 spec_cache_size: int = SPEC_CACHE_SIZE,
+                 latency: float = 0.0,
+                 prefetch_concurrency: int = 0):
+        """
+        :param latency: seconds every packument takes to load, as if it came from the registry
+        """
+        super().__init__(spec_cache_size=spec_cache_size, store=MetadataStore(":memory:"),
+                         prefetch_concurrency=prefetch_concurrency)
+        self.registry = registry
+        self.latency = latency
+
+    def _fetch_packages(self, package_names: set[PackageName]) -> dict[PackageName, StoredPackage]:
+        for package_name in package_names:
+            if package_name not in self.registry:
+                raise ValueError(f"no package info for {package_name}")
+        if self.latency:
+            # the packuments are requested in parallel
+            time.sleep(self.latency)
+        return {package_name: StoredPackage(package_name, self.registry[package_name], source=FROM_REGISTRY)
+                for package_name in package_names}
@@ -0,0 +1,36 @@
+import unittest
+
+from .synthetic import *
+
+
+class SyntheticTestCase(unittest.TestCase):
+    def test_synthetic_registry(self):
+        registry = synthetic_registry(20, 5, 3, 0.5, seed=7)
+        self.assertEqual(registry, synthetic_registry(20, 5, 3, 0.5, seed=7))
+        self.assertEqual(len(registry), 20)
+        self.assertEqual(list(registry["p0"]), ["1.0.0", "1.1.0", "1.2.0", "1.3.0", "1.4.0"])
+        for idx in range(20):
+            for dependencies in registry[f"p{idx}"].values():
+                self.assertEqual(len(dependencies), min(3, 19 - idx))
+                # no cycle
+                self.assertTrue(all(int(name[1:]) > idx for name in dependencies))
+
+    def test_compile(self):
+        reference = SyntheticReference(synthetic_registry(50, 10, 3, 0.1, seed=1))
+        reference.direct_dependencies = {"p0": "*", "p1": "*"}
+        solution = reference.compile()
+        self.assertIsNotNone(solution)
+        versions = {package_version.name: package_version.version for package_version in solution}
+        # every dependency of every selected version is satisfied
+        for package_version in solution:
+            for name, allowed in reference._choose_new(package_version).versions.items():
+                self.assertIn(versions[name], allowed)
+        self.assertGreater(reference.stats.nodes, 0)
+
+        reference.direct_dependencies = {"p99": "*"}
+        with self.assertRaises(ValueError):
+            reference.compile()
+
+
+if __name__ == '__main__':
+    unittest.main()
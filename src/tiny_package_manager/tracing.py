@@ -0,0 +1,142 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+# where the time of a resolution goes
+NETWORK = "network"
+PARSE = "parse"
+SOLVE = "solve"
+CATEGORIES = (NETWORK, PARSE, SOLVE)
+
+
+class Span(object):
+    def __init__(self, name: str, category: str, start: float, duration: float, thread: int, args: dict):
+        """
+        :param start: `time.perf_counter()` when the span started
+        :param duration: in seconds
+        :param thread: identifier of the thread running the span, spans of different threads overlap
+        :param args: anything describing the span, e.g. the name of the package being fetched
+        """
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = duration
+        self.thread = thread
+        self.args = args
+
+
+class TraceHook(object):
+    """
+    receives the spans of a `Tracer` as they end, and the metrics of every resolution. Called from any thread.
+    """
+
+    def on_span(self, span: Span):
+        pass
+
+    def on_metrics(self, metrics: dict):
+        pass
+
+
+class Tracer(object):
+    """
+    times the network, parsing and solving work of the resolutions, and hands every span to its hooks
+    """
+
+    def __init__(self, hooks: Iterable[TraceHook] = ()):
+        self.hooks = list(hooks)
+        self.lock = threading.Lock()
+        # seconds spent in every category, summed over the threads
+        self.seconds: dict[str, float] = {category: 0.0 for category in CATEGORIES}
+
+    def reset(self):
+        with self.lock:
+            self.seconds = {category: 0.0 for category in CATEGORIES}
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[dict]:
+        """
+        time the body of the `with`, which may add to the args of the span through the dict it gets
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, category, start, time.perf_counter() - start, **args)
+
+    def add(self, name: str, category: str, start: float, duration: float, seconds: Optional[float] = None, **args):
+        """
+        :param seconds: part of the duration counted in the category, all of it by default. The rest is counted by
+               other spans, e.g. the resolution waiting for the packuments, which are timed by their own spans.
+        """
+        span = Span(name, category, start, duration, threading.get_ident(), args)
+        with self.lock:
+            self.seconds[category] += duration if seconds is None else seconds
+        for hook in self.hooks:
+            hook.on_span(span)
+
+    def metrics(self, metrics: dict):
+        for hook in self.hooks:
+            hook.on_metrics(metrics)
+
+
+class TimedReader(object):
+    """
+    a reader counting the seconds spent waiting for its data, to tell the network apart from the parsing of a
+    document streamed from the registry
+    """
+
+    def __init__(self, reader: BinaryIO):
+        self.reader = reader
+        self.seconds = 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        start = time.perf_counter()
+        try:
+            return self.reader.read(size)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+class TraceRecorder(TraceHook):
+    """
+    keep the spans, and the metrics of the last resolution, to be written as JSON or as a Chrome trace, which
+    chrome://tracing and https://ui.perfetto.dev display as a timeline
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans: list[Span] = []
+        self.last_metrics: Optional[dict] = None
+
+    def on_span(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+    def on_metrics(self, metrics: dict):
+        self.last_metrics = metrics
+
+    def chrome_trace(self) -> dict:
+        with self.lock:
+            spans = list(self.spans)
+        origin = min((span.start for span in spans), default=0.0)
+        events = [{"name": span.name,
+                   "cat": span.category,
+                   "ph": "X",
+                   "ts": round((span.start - origin) * 1e6, 1),
+                   "dur": round(span.duration * 1e6, 1),
+                   "pid": os.getpid(),
+                   "tid": span.thread,
+                   "args": span.args}
+                  for span in spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.last_metrics or {}}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as writer:
+            json.dump(self.chrome_trace(), writer)
+
+    def write_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as writer:
+            json.dump(self.last_metrics or {}, writer, indent=2)
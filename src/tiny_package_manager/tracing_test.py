@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+
+from .metadata import MetadataStore, load_packages
+from .registry import RegistryClient
+from .registry_test import LocalRegistry
+from .synthetic import SyntheticReference, synthetic_registry
+from .tracing import *
+
+
+class TracingTestCase(unittest.TestCase):
+    def test_tracer(self):
+        recorder = TraceRecorder()
+        tracer = Tracer([recorder])
+        with tracer.span("fetch", NETWORK, package="a") as args:
+            args["status"] = 200
+        tracer.add("parse", PARSE, 1.0, 0.5, 0.2)
+        self.assertEqual([span.name for span in recorder.spans], ["fetch", "parse"])
+        self.assertEqual(recorder.spans[0].args, {"package": "a", "status": 200})
+        self.assertAlmostEqual(tracer.seconds[PARSE], 0.2)
+        self.assertGreater(tracer.seconds[NETWORK], 0)
+
+        tracer.reset()
+        self.assertEqual(tracer.seconds, {NETWORK: 0.0, PARSE: 0.0, SOLVE: 0.0})
+
+    def test_packuments(self):
+        recorder = TraceRecorder()
+        with LocalRegistry() as registry, RegistryClient(registry.url) as client, MetadataStore(":memory:") as store:
+            load_packages(["express"], store, client, max_age=0, resources=None, tracer=Tracer([recorder]))
+        spans = {span.name: span for span in recorder.spans}
+        self.assertEqual(set(spans), {"fetch", "download", "parse"})
+        self.assertEqual(spans["fetch"].args, {"package": "express", "status": 200})
+        self.assertGreater(spans["parse"].args["bytes"], 0)
+
+    def test_compile(self):
+        recorder = TraceRecorder()
+        reference = SyntheticReference(synthetic_registry(50, 10, 3, 0.1, seed=1))
+        reference.tracer = Tracer([recorder])
+        reference.direct_dependencies = {"p0": "*", "p1": "*"}
+        self.assertIsNotNone(reference.compile())
+
+        metrics = recorder.last_metrics
+        self.assertEqual(metrics, reference.metrics())
+        self.assertEqual(metrics["solver"]["nodes"], reference.stats.nodes)
+        self.assertGreater(metrics["solver"]["backtracks"], 0)
+        self.assertGreater(metrics["solver"]["max_depth"], 1)
+        self.assertEqual(metrics["metadata"]["cache_misses"], metrics["metadata"]["packuments"])
+        self.assertGreater(metrics["metadata"]["cache_hits"], 0)
+        self.assertGreater(metrics["seconds"][SOLVE], 0)
+        self.assertLessEqual(metrics["seconds"][SOLVE], metrics["seconds"]["total"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            recorder.write_chrome_trace(path)
+            with open(path) as reader:
+                trace = json.load(reader)
+            self.assertIn("compile", [event["name"] for event in trace["traceEvents"]])
+            self.assertTrue(all(event["ph"] == "X" and event["ts"] >= 0 for event in trace["traceEvents"]))
+
+            path = os.path.join(directory, "metrics.json")
+            recorder.write_json(path)
+            with open(path) as reader:
+                self.assertEqual(json.load(reader)["solver"]["nodes"], reference.stats.nodes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,15 @@ import json
 import tarfile
 from concurrent import futures
 from io import BytesIO
+from typing import BinaryIO, Iterable, Optional
 
-import requests
 from semantic_version import Version, NpmSpec
 
 from .app import RemotePackage, LocalPackage
-from .base import PackageName, PackageVersion
+from .base import PackageName, PackageVersion, format_name
+from .registry import RegistryClient, default_client
+
+MANIFEST_WORKERS = 8
 
 
 def _max_satisfying_ver(sem_version: NpmSpec, package_version: PackageVersion, max_satisfying_ver: Version) -> Version:
@@ -41,51 +44,63 @@ def read_file_from_tar(package_data: bytes, virtual_path: str, file_name: str) -
     """
     read data from tarball file with specific name
     """
+    with BytesIO(package_data) as file_obj:
+        return _read_file_from_stream(file_obj, virtual_path, file_name)
+
+
+def read_file_from_tarball(path: str, virtual_path: str, file_name: str) -> bytes:
+    """
+    same as `read_file_from_tar`, for a tarball on disk which is never loaded in memory
+    """
+    with open(path, "rb") as file_obj:
+        return _read_file_from_stream(file_obj, virtual_path, file_name)
+
+
+def _read_file_from_stream(file_obj: BinaryIO, virtual_path: str, file_name: str) -> bytes:
+    """
+    walk the archive as a stream and stop at the file: the members after it are neither decompressed nor indexed
+    """
     # build the full path
     full_path = f"{virtual_path}/{file_name}" if virtual_path else file_name
 
-    with BytesIO(package_data) as file_obj:
-        with tarfile.open(fileobj=file_obj, mode="r:*") as tar:
-            try:
-                tar_info = tar.getmember(full_path)
+    with tarfile.open(fileobj=file_obj, mode="r|*") as tar:
+        for tar_info in tar:
+            name = tar_info.name[2:] if tar_info.name.startswith("./") else tar_info.name
+            if name == full_path and tar_info.isfile():
                 with tar.extractfile(tar_info) as f:
                     return f.read()
-            except KeyError:
-                raise FileNotFoundError(f"File '{file_name}' not found in archive")
+    raise FileNotFoundError(f"File '{file_name}' not found in archive")
 
 
-def fetch_url(url: str) -> bytes:
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise ValueError(f"error fetching package info {url}")
-    return response.content
+def read_manifests(paths: Iterable[str], max_workers: int = MANIFEST_WORKERS) -> dict[str, dict]:
+    """
+    read `package/package.json` of many tarballs on disk in parallel, zlib releases the GIL while decompressing
 
+    :return: tarball path -> parsed package.json
+    """
+    def read_manifest(path: str) -> dict:
+        return json.loads(read_file_from_tarball(path, "package", "package.json"))
 
-def download(dependency_names: set[PackageName]) -> dict[str, bytes]:
-    def remote_url(name: str) -> str:
-        return f"https://registry.yarnpkg.com/{name}"
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_path = {executor.submit(read_manifest, path): path for path in set(paths)}
+        return {future_to_path[future]: future.result() for future in futures.as_completed(future_to_path)}
 
-    with futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_url = {
-            executor.submit(fetch_url, remote_url(dependency_name)): dependency_name
-            for dependency_name in dependency_names
-        }
 
-        dataset: dict[str, bytes] = {}
-        for future in futures.as_completed(future_to_url):
-            package_name = future_to_url[future]
-            data = future.result()
-            dataset[package_name] = data
-        return dataset
+def fetch_url(url: str, client: Optional[RegistryClient] = None) -> bytes:
+    return (client or default_client()).fetch(url)
 
 
-def format_name(name: str) -> str:
-    name = name.replace("@", "at_")
-    name = name.replace("/", "_")
-    return name
+def download(dependency_names: set[PackageName], client: Optional[RegistryClient] = None) -> dict[str, bytes]:
+    """
+    download the packuments in parallel, the concurrency is bounded by the client
+    """
+    if not dependency_names:
+        return {}
+    return (client or default_client()).fetch_packuments(dependency_names)
 
 
-def download_with_cache(dependency_names: set[PackageName]) -> dict[str, bytes]:
+def download_with_cache(dependency_names: set[PackageName],
+                        client: Optional[RegistryClient] = None) -> dict[str, bytes]:
     dataset: dict[str, bytes] = {}
     uncached_dep: set[PackageName] = set()
     for dependency_name in dependency_names:
@@ -94,7 +109,7 @@ def download_with_cache(dependency_names: set[PackageName]) -> dict[str, bytes]:
             dataset[dependency_name] = local.fetch()
         else:
             uncached_dep.add(dependency_name)
-    uncached_dataset = download(uncached_dep)
+    uncached_dataset = download(uncached_dep, client)
     dataset.update(uncached_dataset)
     for dependency_name in uncached_dataset:
         data = dataset[dependency_name]
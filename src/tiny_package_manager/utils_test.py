@@ -42,6 +42,18 @@ class UtilsTestCase(unittest.TestCase):
         tar = read_file_from_tar(self.jest.fetch(), "package", "package.json")
         self.assertEqual(tar, self.jest_spec.fetch())
 
+    def test_read_file_from_tarball(self):
+        for package in (self.dayjs, self.jest):
+            tar = read_file_from_tarball(package.path, "package", "package.json")
+            self.assertEqual(tar, read_file_from_tar(package.fetch(), "package", "package.json"))
+        with self.assertRaises(FileNotFoundError):
+            read_file_from_tarball(self.jest.path, "package", "missing.json")
+
+    def test_read_manifests(self):
+        manifests = read_manifests([self.dayjs.path, self.jest.path])
+        self.assertEqual(manifests[self.dayjs.path]["name"], "dayjs")
+        self.assertEqual(manifests[self.jest.path]["version"], "0.0.71")
+
     def test_read_dependencies(self):
         dependencies = read_dependencies("dayjs", self.dayjs.fetch())
         self.assertEqual(len(dependencies), 0)